@@ -0,0 +1,68 @@
+"""
+Per-stream CPU cost of the PCM and Opus audio paths.
+
+Usage: python benchmarks/audio_path.py <audio file or stream url> [seconds] [codec]
+
+Reads ``seconds`` worth of frames from each source type as fast as possible and does the per-frame
+work the voice player would do (encoding to Opus for the PCM path). Reports CPU time spent in this
+process and in the FFmpeg child, per second of audio. Requires ffmpeg and libopus.
+"""
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import discord  # noqa: E402
+from discord import opus  # noqa: E402
+
+from utils.audio import FRAME_LENGTH, open_source  # noqa: E402
+from utils.track import Track  # noqa: E402
+
+
+def children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run(song: Track, mode: str, volume: float, seconds: float) -> None:
+    encoder = opus.Encoder() if mode == "pcm" else None
+    frames = int(seconds / FRAME_LENGTH)
+    child_before = children_cpu()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    source = open_source(song, volume, mode)
+    read = 0
+    for _ in range(frames):
+        data = source.read()
+        if not data:
+            break
+        if encoder is not None:
+            encoder.encode(data, encoder.SAMPLES_PER_FRAME)
+        read += 1
+    source.cleanup()
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    child = children_cpu() - child_before
+    audio = read * FRAME_LENGTH or 1
+    print(
+        f"{mode:<5} volume {volume:.2f}: {read} frames, python {cpu / audio * 1000:6.2f}ms/s, "
+        f"ffmpeg {child / audio * 1000:6.2f}ms/s, wall {wall:.2f}s"
+    )
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    if not opus.is_loaded():
+        opus._load_default()
+    url = sys.argv[1]
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 60.0
+    song = Track(title=url, url=url, codec=sys.argv[3] if len(sys.argv) > 3 else None)
+    for mode, volume in (("pcm", 1.0), ("pcm", 0.5), ("opus", 1.0), ("opus", 0.5)):
+        run(song, mode, volume, seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Local cluster test with fake gateway sessions.
+
+Usage: python benchmarks/cluster.py [shards] [clusters] [guilds per shard]
+
+Runs the real Supervisor and IPC channel over cluster processes that start the real DiscordBot
+offline. Instead of connecting to Discord, each shard "connects" by adding fake guilds (with voice
+clients in some of them) and dispatching ``shard_ready``. The script then checks:
+
+- every cluster connects back and the aggregated stats add up;
+- an extension reload reaches every cluster;
+- a cluster killed with SIGKILL is restarted and reconnects;
+- an owner requested restart brings the cluster back;
+- shutdown stops every process.
+
+It prints timings for each step as JSON.
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+async def fake_cluster(guilds_per_shard: int) -> None:
+    import discord
+
+    import fakes
+    from bot import DiscordBot, cluster
+
+    bot = DiscordBot(cluster=cluster)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGINT, stop.set)
+    async with bot:
+        bot._connection.user = discord.ClientUser(
+            state=bot._connection,
+            data={"id": 2, "username": "cluster", "discriminator": "0000", "avatar": None, "bot": True},
+        )
+        await bot.setup_hook()
+        for shard_id in cluster.shard_ids:
+            for index in range(guilds_per_shard):
+                guild = fakes.FakeGuild(bot)
+                guild.shard_id = shard_id
+                bot._connection._guilds[guild.id] = guild
+                if index % 4 == 0:
+                    await guild.voice_channel.connect()
+            bot.dispatch("shard_ready", shard_id)
+        bot.dispatch("ready")
+        while not stop.is_set() and not bot.is_closed():
+            await asyncio.sleep(0.1)
+        for voice in list(bot.voice_clients):
+            await voice.disconnect()
+        for extension in list(bot.extensions):
+            await bot.unload_extension(extension)
+        await bot.ipc.close()
+        await bot.http_client.close()
+
+
+async def wait_for(predicate, timeout: float = 30.0) -> float:
+    start = time.perf_counter()
+    while not predicate():
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError("condition not reached")
+        await asyncio.sleep(0.05)
+    return time.perf_counter() - start
+
+
+async def wait_until_guilds(supervisor, guilds: int, timeout: float = 30.0) -> None:
+    start = time.perf_counter()
+    while (await supervisor.stats())["totals"].get("guilds") != guilds:
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError("clusters did not report every guild")
+        await asyncio.sleep(0.05)
+
+
+def all_connected(supervisor) -> bool:
+    return all(cluster.info()["connected"] for cluster in supervisor.clusters)
+
+
+async def supervise(shards: int, clusters: int, guilds_per_shard: int) -> dict:
+    from utils.cluster import Supervisor
+
+    logging.basicConfig(level=logging.WARNING)
+    supervisor = Supervisor(
+        [sys.executable, os.path.abspath(__file__), "--child", str(guilds_per_shard)],
+        shards,
+        clusters,
+        start_delay=0.1,
+        min_backoff=0.2,
+        shutdown_timeout=10.0,
+        env={**os.environ, "PYTHONUNBUFFERED": "1"},
+    )
+    report = {"shards": shards, "clusters": clusters}
+    try:
+        await check(supervisor, report, shards, guilds_per_shard)
+    finally:
+        if not supervisor.closing:
+            await supervisor.close()
+    return report
+
+
+async def check(supervisor, report: dict, shards: int, guilds_per_shard: int) -> None:
+    start = time.perf_counter()
+    await supervisor.start()
+    await wait_for(lambda: all_connected(supervisor))
+    # Clusters connect during setup_hook, before their shards have "connected".
+    await wait_until_guilds(supervisor, shards * guilds_per_shard)
+    report["startup_seconds"] = round(time.perf_counter() - start, 2)
+
+    start = time.perf_counter()
+    stats = await supervisor.stats()
+    report["stats_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    report["totals"] = stats["totals"]
+    assert stats["totals"]["guilds"] == shards * guilds_per_shard, stats
+    assert stats["totals"]["shards"] == shards, stats
+
+    entries = await supervisor.reload(["fun"])
+    assert all(entry.get("result") == ["fun"] for entry in entries), entries
+
+    victim = supervisor.clusters[-1]
+    pid = victim.process.pid
+    start = time.perf_counter()
+    os.kill(pid, signal.SIGKILL)
+    await wait_for(lambda: victim.restarts == 1 and victim.info()["connected"])
+    await wait_until_guilds(supervisor, shards * guilds_per_shard)
+    report["crash_recovery_seconds"] = round(time.perf_counter() - start, 2)
+    assert victim.process.pid != pid
+
+    start = time.perf_counter()
+    await supervisor.restart(0)
+    await wait_for(lambda: supervisor.clusters[0].restarts == 1 and all_connected(supervisor))
+    await wait_until_guilds(supervisor, shards * guilds_per_shard)
+    report["restart_seconds"] = round(time.perf_counter() - start, 2)
+
+    stats = await supervisor.stats()
+    assert stats["totals"]["guilds"] == shards * guilds_per_shard, stats
+    report["restarts"] = [cluster.restarts for cluster in supervisor.clusters]
+
+    start = time.perf_counter()
+    processes = [cluster.process for cluster in supervisor.clusters]
+    await supervisor.close()
+    assert all(process.returncode is not None for process in processes)
+    report["shutdown_seconds"] = round(time.perf_counter() - start, 2)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        asyncio.run(fake_cluster(int(sys.argv[2])))
+    else:
+        args = [int(arg) for arg in sys.argv[1:4]]
+        shards, clusters, guilds_per_shard = args + [8, 4, 50][len(args):]
+        os.chdir(tempfile.mkdtemp())
+        print(json.dumps(asyncio.run(supervise(shards, clusters, guilds_per_shard)), indent=2))
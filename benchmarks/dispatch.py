@@ -0,0 +1,111 @@
+"""
+Messages per second through ``bot.on_message`` for mixed chat and command traffic.
+
+Usage: python benchmarks/dispatch.py [--messages N] [--command-share F] [--baseline]
+
+Builds the offline harness bot from ``simulate.py`` and feeds it messages from a number of guilds,
+some of which have their own prefix. Most messages are chat: plain text, text that happens to start
+with a prefix character, and mentions of other users. The rest are ``queue`` commands, which reply
+without any upstream work. ``--baseline`` swaps in the previous dispatch (a global
+``when_mentioned_or`` prefix and ``process_commands`` for every message) to compare against.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from discord.ext import commands  # noqa: E402
+
+import fakes  # noqa: E402
+from simulate import HarnessBot  # noqa: E402
+
+CHAT = [
+    "lol",
+    "anyone up for a game tonight?",
+    "$5 says the next song is another remix",
+    "!!! no way",
+    "did you see what happened in the last episode, I can't believe they did that to him",
+    "<@12345> check this out",
+    "https://example.com/some/very/long/link?with=query&parameters=1",
+]
+
+
+def legacy_dispatch(bot: HarnessBot) -> None:
+    """
+    Restores the dispatch from before the prefix cache: every message is parsed into a Context.
+    """
+    bot.command_prefix = commands.when_mentioned_or(bot.config["prefix"])
+
+    async def on_message(message) -> None:
+        if message.author == bot.user or message.author.bot:
+            return
+        await bot.process_commands(message)
+
+    bot.on_message = on_message
+
+
+def traffic(guilds, count: int, command_share: float, bot: HarnessBot):
+    members = {guild.id: guild.member("chatter") for guild in guilds}
+    messages = []
+    commands_sent = 0
+    for _ in range(count):
+        guild = random.choice(guilds)
+        if random.random() < command_share:
+            content = f"{bot.prefixes.get(guild.id)}queue"
+            commands_sent += 1
+        else:
+            content = random.choice(CHAT)
+        messages.append(fakes.FakeMessage(guild.text_channel, members[guild.id], content))
+    return messages, commands_sent
+
+
+async def main(args) -> dict:
+    media = fakes.MediaServer()
+    await media.start()
+    bot = HarnessBot(media)
+    directory = tempfile.mkdtemp()
+    bot.config = {**bot.config, "database": {"path": os.path.join(directory, "dispatch.db")}}
+    try:
+        async with bot:
+            await bot.start_offline()
+            guilds = [fakes.FakeGuild(bot) for _ in range(args.guilds)]
+            if args.baseline:
+                legacy_dispatch(bot)
+            else:
+                for guild in guilds[::4]:
+                    await bot.prefixes.set(guild.id, "!")
+            messages, commands_sent = traffic(guilds, args.messages, args.command_share, bot)
+            start = time.perf_counter()
+            for message in messages:
+                await bot.on_message(message)
+            elapsed = time.perf_counter() - start
+            replies = sum(len(guild.text_channel.sent) for guild in guilds)
+            await bot.stop_offline()
+    finally:
+        await media.stop()
+    return {
+        "dispatch": "baseline" if args.baseline else "prefix cache",
+        "messages": len(messages),
+        "commands": commands_sent,
+        "replies": replies,
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(len(messages) / elapsed),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--guilds", type=int, default=100)
+    parser.add_argument("--command-share", type=float, default=0.02, help="fraction of messages that are commands")
+    parser.add_argument("--baseline", action="store_true", help="use the previous dispatch")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    print(json.dumps(asyncio.run(main(args)), indent=2))
@@ -0,0 +1,470 @@
+"""
+Offline stand-ins for Discord and the media backends, used by ``simulate.py``.
+
+Discord objects are duck-typed to the parts of the API the cogs touch. The media backends are a local
+aiohttp server that imitates the YouTube results page, the Spotify Web API and uselessfacts, plus a
+stub extractor in place of yt_dlp and silent audio sources in place of FFmpeg.
+"""
+import asyncio
+import datetime
+import itertools
+import json
+import os
+import sys
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import discord
+from aiohttp import web
+from discord.ext import commands
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from utils.audio import FRAME_LENGTH, TrackedSource  # noqa: E402
+from utils.http import HTTPClient  # noqa: E402
+from utils.track import Track  # noqa: E402
+
+_ids = itertools.count(10_000)
+
+
+def snowflake() -> int:
+    return next(_ids)
+
+
+class FakeMessage:
+    def __init__(self, channel, author, content: str = "", embed=None, view=None, created_at=None) -> None:
+        self.id = snowflake()
+        self.channel = channel
+        self.guild = getattr(channel, "guild", None)
+        self._state = getattr(self.guild, "_state", None)
+        self.author = author
+        self.content = content
+        self.embed = embed
+        self.view = view
+        self.pinned = False
+        self.edits = 0
+        self.deleted = False
+        self.created_at = created_at or discord.utils.utcnow()
+        self.attachments = []
+        self.mentions = []
+        self.role_mentions = []
+        self.channel_mentions = []
+        self.mention_everyone = False
+        self.webhook_id = None
+        self.type = discord.MessageType.default
+
+    async def edit(self, *, embed=None, view=None, content=None, delete_after=None, **kwargs):
+        self.edits += 1
+        self.channel.api_calls += 1
+        if embed is not None:
+            self.embed = embed
+        self.view = view
+        if delete_after is not None:
+            asyncio.get_running_loop().call_later(delete_after, lambda: asyncio.ensure_future(self.delete()))
+        return self
+
+    async def delete(self, *, delay=None) -> None:
+        self.channel.api_calls += 1
+        if delay:
+            await asyncio.sleep(delay)
+        self.deleted = True
+        self.channel.remove(self)
+
+    async def add_reaction(self, emoji) -> None:
+        self.channel.api_calls += 1
+
+
+class FakeTextChannel:
+    """
+    Text channel with an in-memory history. Counts API calls and enforces the bulk delete rules
+    (2 to 100 messages, none older than 14 days).
+    """
+
+    def __init__(self, guild, name: str = "general") -> None:
+        self.id = snowflake()
+        self.guild = guild
+        self.name = name
+        self.type = discord.ChannelType.text
+        self.messages = []
+        self.sent = []
+        self.api_calls = 0
+
+    def add_history(self, author, count: int, age: datetime.timedelta = datetime.timedelta()) -> None:
+        created_at = discord.utils.utcnow() - age
+        for i in range(count):
+            self.messages.append(FakeMessage(self, author, f"message {i}", created_at=created_at))
+
+    def remove(self, message) -> None:
+        if message in self.messages:
+            self.messages.remove(message)
+
+    async def send(self, content=None, *, embed=None, view=None, **kwargs) -> FakeMessage:
+        self.api_calls += 1
+        message = FakeMessage(self, self.guild.me if self.guild else None, content or "", embed=embed, view=view)
+        self.sent.append(message)
+        self.messages.append(message)
+        return message
+
+    async def history(self, limit=100, before=None):
+        messages = list(reversed(self.messages))
+        if before is not None:
+            messages = [message for message in messages if message.id < before.id]
+        for start in range(0, min(limit, len(messages)), 100):
+            self.api_calls += 1
+            await asyncio.sleep(0)
+            for message in messages[start:min(start + 100, limit)]:
+                yield message
+
+    async def delete_messages(self, messages) -> None:
+        messages = list(messages)
+        cutoff = discord.utils.utcnow() - datetime.timedelta(days=14)
+        if not 1 <= len(messages) <= 100 or any(message.created_at < cutoff for message in messages):
+            raise ValueError("invalid bulk delete")
+        self.api_calls += 1
+        ids = {message.id for message in messages}
+        self.messages = [message for message in self.messages if message.id not in ids]
+
+    def typing(self):
+        return _Typing()
+
+
+class _Typing:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+
+class FakeVoiceState:
+    def __init__(self, channel) -> None:
+        self.channel = channel
+
+
+class FakeMember:
+    def __init__(self, guild, name: str, bot: bool = False, user_id: int = None) -> None:
+        self.id = user_id or snowflake()
+        self.guild = guild
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+        self.voice = None
+        self.mention = f"<@{self.id}>"
+
+    def __str__(self) -> str:
+        return self.name
+
+    def __eq__(self, other) -> bool:
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild, bot) -> None:
+        self.id = snowflake()
+        self.guild = guild
+        self.bot = bot
+        self.members = []
+
+    async def connect(self, **kwargs):
+        if self.guild.voice_client is not None:
+            raise discord.ClientException("Already connected to a voice channel.")
+        client = FakeVoiceClient(self.bot, self)
+        self.guild.voice_client = client
+        self.bot._connection._add_voice_client(self.guild.id, client)
+        return client
+
+
+class FakeVoiceClient:
+    """
+    Plays a source by reading its frames in real time (scaled by ``speed``) on the event loop, then
+    calls ``after`` like discord.py's player thread does.
+    """
+
+    speed = 1.0
+
+    def __init__(self, bot, channel) -> None:
+        self.bot = bot
+        self.channel = channel
+        self.guild = channel.guild
+        self._source = None
+        self._task = None
+        self._paused = False
+        self.tracks_played = 0
+
+    @property
+    def source(self):
+        return self._source
+
+    @source.setter
+    def source(self, value) -> None:
+        self._source = value
+
+    def is_connected(self) -> bool:
+        return self.guild.voice_client is self
+
+    def is_playing(self) -> bool:
+        return self._task is not None and not self._task.done() and not self._paused
+
+    def is_paused(self) -> bool:
+        return self._task is not None and not self._task.done() and self._paused
+
+    def play(self, source, *, after=None, **kwargs) -> None:
+        if self._task is not None and not self._task.done():
+            raise discord.ClientException("Already playing audio.")
+        self._source = source
+        self._paused = False
+        self.tracks_played += 1
+        self._task = asyncio.ensure_future(self._run(after))
+
+    async def _run(self, after) -> None:
+        batch = 50
+        try:
+            while True:
+                if self._paused:
+                    await asyncio.sleep(FRAME_LENGTH * batch / self.speed)
+                    continue
+                for _ in range(batch):
+                    if not self._source.read():
+                        return
+                await asyncio.sleep(FRAME_LENGTH * batch / self.speed)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._source.cleanup()
+            if after is not None:
+                after(None)
+
+    def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def pause(self) -> None:
+        self._paused = True
+
+    def resume(self) -> None:
+        self._paused = False
+
+    async def disconnect(self, *, force: bool = False) -> None:
+        self.stop()
+        self.guild.voice_client = None
+        self.bot._connection._remove_voice_client(self.guild.id)
+
+
+class FakeGuild:
+    def __init__(self, bot, name: str = None) -> None:
+        self.id = snowflake()
+        self._state = bot._connection
+        self.name = name or f"guild-{self.id}"
+        self.voice_client = None
+        self.me = FakeMember(self, "bot", bot=True, user_id=bot.user.id)
+        self.text_channel = FakeTextChannel(self)
+        self.voice_channel = FakeVoiceChannel(self, bot)
+
+    def member(self, name: str) -> FakeMember:
+        member = FakeMember(self, name)
+        member.voice = FakeVoiceState(self.voice_channel)
+        self.voice_channel.members.append(member)
+        return member
+
+    def leave_voice(self, member: FakeMember) -> None:
+        member.voice = None
+        self.voice_channel.members.remove(member)
+
+
+class FakeContext(commands.Context):
+    """
+    Context whose replies go to the fake channel instead of the Discord API.
+    """
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+    async def reply(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+    def typing(self, **kwargs):
+        return _Typing()
+
+
+class SilentSource(discord.AudioSource):
+    """
+    Yields silent 20ms PCM frames for ``duration`` seconds. Stands in for FFmpeg.
+    """
+
+    FRAME = b"\x00" * 3840
+    live = 0
+
+    def __init__(self, duration: float) -> None:
+        self.remaining = int(duration / FRAME_LENGTH)
+        self.closed = False
+        SilentSource.live += 1
+
+    def read(self) -> bytes:
+        if self.remaining <= 0:
+            return b""
+        self.remaining -= 1
+        return self.FRAME
+
+    def cleanup(self) -> None:
+        if not self.closed:
+            self.closed = True
+            SilentSource.live -= 1
+
+
+def open_silent_source(song: Track, volume: float = 1.0, start: float = 0.0) -> TrackedSource:
+    return TrackedSource(SilentSource(max((song.duration or 5) - start, 0)), volume=volume)
+
+
+def stub_extractor(track_duration: float = 5.0, delay: float = 0.05):
+    """
+    Returns a function with yt_dlp's ``extract_info`` result shape. ``delay`` simulates the time
+    yt_dlp spends fetching and parsing the watch page (on the resolver's worker thread).
+    """
+
+    def extract(url: str) -> dict:
+        time.sleep(delay)
+        video_id = url.rsplit("=", 1)[-1]
+        return {
+            "id": video_id,
+            "url": f"https://rr1---sn-stub.googlevideo.com/videoplayback?id={video_id}&expire={int(time.time()) + 21600}",
+            "title": f"Stub video {video_id}",
+            "thumbnail": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+            "duration": track_duration,
+            "acodec": "opus",
+            "abr": 128,
+            "formats": [{"format_id": str(i), "url": "x" * 500} for i in range(30)],
+        }
+
+    return extract
+
+
+def results_page(query: str, videos: int = 20) -> bytes:
+    """
+    A YouTube results page with the same structure as the real one: a lot of script before
+    ``ytInitialData``, videoRenderer objects inside it, and more script after.
+    """
+    renderers = []
+    base = abs(hash(query)) % 10 ** 6
+    for i in range(videos):
+        video_id = f"{base:06d}{i:05d}"[:11]
+        renderers.append({"videoRenderer": {
+            "videoId": video_id,
+            "thumbnail": {"thumbnails": [{"url": f"https://i.ytimg.com/vi/{video_id}/hq720.jpg"}] * 4},
+            "title": {"runs": [{"text": f"{query} ({i})"}]},
+            "lengthText": {"simpleText": f"{3 + i % 5}:{i % 60:02d}"},
+            "navigationEndpoint": {"commandMetadata": {"webCommandMetadata": {"url": f"/watch?v={video_id}"}}},
+            "descriptionSnippet": {"runs": [{"text": "lorem ipsum " * 40}]},
+        }})
+    initial_data = {"contents": {"twoColumnSearchResultsRenderer": {"primaryContents": {
+        "sectionListRenderer": {"contents": [{"itemSectionRenderer": {"contents": renderers}}]}}}}}
+    return (
+        "<html><head><script>var x = '" + "a" * 300_000 + "';</script>"
+        + "<script>var ytInitialData = " + json.dumps(initial_data) + ";</script>"
+        + "<script>" + "b" * 400_000 + "</script></body></html>"
+    ).encode()
+
+
+class MediaServer:
+    """
+    Local HTTP server imitating www.youtube.com/results, the Spotify Web API and uselessfacts.
+    ``playlist_size`` is the length of every Spotify playlist and album. Setting ``facts_down`` makes
+    uselessfacts answer 503.
+    """
+
+    def __init__(self, playlist_size: int = 2000, latency: float = 0.02) -> None:
+        self.playlist_size = playlist_size
+        self.latency = latency
+        self.requests = 0
+        self._runner = None
+        self.port = None
+        self._facts = itertools.count()
+        self.facts_down = False
+        self.fact_requests = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/results", self.youtube_results)
+        app.router.add_get("/random.json", self.random_fact)
+        app.router.add_get("/v1/playlists/{id}/items", self.spotify_page)
+        app.router.add_get("/v1/playlists/{id}/tracks", self.spotify_page)
+        app.router.add_get("/v1/albums/{id}/tracks", self.spotify_page)
+        app.router.add_get("/v1/albums/{id}/tracks/", self.spotify_page)
+        app.router.add_get("/v1/tracks/{id}", self.spotify_track)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _delay(self) -> None:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def youtube_results(self, request: web.Request) -> web.StreamResponse:
+        await self._delay()
+        page = results_page(request.query.get("search_query", ""))
+        response = web.StreamResponse(headers={"Content-Type": "text/html; charset=utf-8"})
+        try:
+            # The search parser stops reading once it has enough results and closes the connection.
+            await response.prepare(request)
+            for offset in range(0, len(page), 65536):
+                await response.write(page[offset:offset + 65536])
+        except (ConnectionResetError, RuntimeError):
+            pass
+        return response
+
+    async def random_fact(self, request: web.Request) -> web.Response:
+        await self._delay()
+        self.fact_requests += 1
+        if self.facts_down:
+            return web.json_response({"error": "unavailable"}, status=503)
+        number = next(self._facts)
+        return web.json_response({"id": str(number), "text": f"Random fact number {number}."})
+
+    async def spotify_page(self, request: web.Request) -> web.Response:
+        await self._delay()
+        spotify_id = request.match_info["id"]
+        limit = int(request.query.get("limit", 100))
+        offset = int(request.query.get("offset", 0))
+        wrap = "playlists" in request.path
+        tracks = [
+            {"name": f"{spotify_id} song {i}", "artists": [{"name": f"artist {i % 17}"}]}
+            for i in range(offset, min(offset + limit, self.playlist_size))
+        ]
+        return web.json_response({
+            "items": [{"track": track} for track in tracks] if wrap else tracks,
+            "total": self.playlist_size,
+            "limit": limit,
+            "offset": offset,
+        })
+
+    async def spotify_track(self, request: web.Request) -> web.Response:
+        await self._delay()
+        return web.json_response({"name": f"{request.match_info['id']} song", "artists": [{"name": "artist"}]})
+
+
+class RedirectingHTTPClient(HTTPClient):
+    """
+    HTTPClient that sends every request to the local MediaServer, keeping path and query.
+    """
+
+    def __init__(self, base_url: str, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.base_url = urlsplit(base_url)
+
+    def request(self, method: str, url: str, **kwargs):
+        parts = urlsplit(str(url))
+        url = urlunsplit((self.base_url.scheme, self.base_url.netloc, parts.path, parts.query, ""))
+        return super().request(method, url, **kwargs)
@@ -0,0 +1,81 @@
+"""
+Per-record cost of logging on the calling thread, before and after the queue based pipeline.
+
+Usage: python benchmarks/logging_pipeline.py [records]
+
+Console output goes to /dev/null and file output to a temporary directory.
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from utils.log import LoggingFormatter, setup_logging  # noqa: E402
+
+
+class LegacyFormatter(LoggingFormatter):
+    """The formatter as it was: a new Formatter and four string replaces per record."""
+
+    def format(self, record):
+        log_color = self.COLORS[record.levelno]
+        format = "(black){asctime}(reset) (levelcolor){levelname:<8}(reset) (green){name}(reset) {message}"
+        format = format.replace("(black)", self.black + self.bold)
+        format = format.replace("(reset)", self.reset)
+        format = format.replace("(levelcolor)", log_color)
+        format = format.replace("(green)", self.green + self.bold)
+        formatter = logging.Formatter(format, "%Y-%m-%d %H:%M:%S", style="{")
+        return formatter.format(record)
+
+
+def legacy_logger(directory: str, devnull) -> logging.Logger:
+    logger = logging.getLogger("legacy")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    console_handler = logging.StreamHandler(devnull)
+    console_handler.setFormatter(LegacyFormatter())
+    file_handler = logging.FileHandler(filename=os.path.join(directory, "legacy.log"), encoding="utf-8", mode="w")
+    file_handler.setFormatter(
+        logging.Formatter("[{asctime}] [{levelname:<8}] {name}: {message}", "%Y-%m-%d %H:%M:%S", style="{")
+    )
+    logger.addHandler(console_handler)
+    logger.addHandler(file_handler)
+    return logger
+
+
+def measure(name: str, log, records: int) -> None:
+    start = time.perf_counter()
+    for i in range(records):
+        log(i)
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<28} {elapsed / records * 1e6:8.2f}us per record on the calling thread")
+
+
+def main() -> None:
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w") as devnull:
+        legacy = legacy_logger(directory, devnull)
+        measure("legacy (f-string)", lambda i: legacy.info(
+            f"Executed play command in guild {i} (ID: {i}) by user#{i} (ID: {i})"), records)
+
+        stderr, sys.stderr = sys.stderr, devnull
+        try:
+            for json_mode in (False, True):
+                config = {"logging": {"file": os.path.join(directory, f"bot-{json_mode}.log"), "json": json_mode}}
+                logger, listener = setup_logging(config)
+                logger.propagate = False
+                label = "queued (json)" if json_mode else "queued"
+                measure(label, lambda i: logger.info(
+                    "Executed %s command in guild %s (ID: %s) by %s (ID: %s)", "play", i, i, f"user#{i}", i), records)
+                start = time.perf_counter()
+                listener.stop()
+                print(f"  {'':<28} listener drained the backlog in {time.perf_counter() - start:.2f}s off-thread")
+                logger.handlers.clear()
+        finally:
+            sys.stderr = stderr
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Memory held by queued songs in each representation the bot has used.
+
+Usage: python benchmarks/memory.py [--queue N] [--guilds N] [--guild-queue N] [--info-sample N]
+
+Builds the same players three times, holding each resolved song as:
+
+* ``info``: the yt_dlp info dict, with formats, thumbnails and captions in the shape YouTube returns;
+* ``dict``: the plain song dict the resolver used to return;
+* ``track``: ``Track``.
+
+The scenarios are one guild with a ``--queue`` entry queue, and ``--guilds`` guilds that are each
+playing a song with ``--guild-queue`` more queued. Memory is measured with tracemalloc, so it
+counts the Python objects only, not interpreter overhead. Info dicts take over half a megabyte each,
+so for them only ``--info-sample`` songs are built and the result is scaled up.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from utils.player import GuildPlayer  # noqa: E402
+from utils.track import Track  # noqa: E402
+
+FORMATS = 24
+THUMBNAILS = 40
+CAPTION_LANGUAGES = 150
+CAPTION_FORMATS = ("json3", "srv1", "srv2", "srv3", "ttml", "vtt")
+
+
+def stream_url(video_id: str, itag: int) -> str:
+    expire = int(time.time()) + 21600
+    return (
+        f"https://rr3---sn-4g5lznek.googlevideo.com/videoplayback?expire={expire}&ei=x7dJZq2lNPO&ip=203.0.113.7"
+        f"&id=o-{video_id}AKj3fX&itag={itag}&source=youtube&requiressl=yes&mh=Qd&mm=31%2C29&mn=sn-4g5lznek"
+        f"&ms=au%2Crdu&mv=m&mvi=3&pl=24&initcwndbps=1850000&vprv=1&mime=audio%2Fwebm&gir=yes&clen=3489225"
+        f"&dur=213.041&lmt=1714829363465148&mt=1716107423&fvip=3&keepalive=yes&c=IOS&txp=4532434"
+        f"&sparams=expire%2Cei%2Cip%2Cid%2Citag%2Csource%2Crequiressl%2Cvprv%2Cmime%2Cgir%2Cclen%2Cdur%2Clmt"
+        f"&sig=AJfQdSswRQIhAPN{video_id}kZ0ZB1w4u6iKqvDQ7Y3m4H8b4Zt7xYwIgHn2GfV7lCkVq2Xo9xK5x5Vw&lsparams=mh"
+    )
+
+
+def info_dict(index: int, full: bool = True) -> dict:
+    """
+    A yt_dlp ``extract_info`` result with the structure and typical sizes of a YouTube video.
+    Without ``full`` only the fields the other representations keep are filled in, which is much
+    quicker to build.
+    """
+    video_id = f"v{index:010d}"
+    if not full:
+        return {
+            "id": video_id, "title": f"Artist {index % 997} - Song number {index} (Official Audio)",
+            "thumbnail": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg", "duration": 213,
+            "url": stream_url(video_id, 272), "acodec": "opus", "abr": 130.0,
+        }
+    formats = [
+        {
+            "format_id": str(249 + i), "format_note": "medium", "ext": "webm", "protocol": "https",
+            "acodec": "opus" if i % 2 else "none", "vcodec": "none" if i % 2 else "vp9",
+            "url": stream_url(video_id, 249 + i), "width": None if i % 2 else 1920, "height": None if i % 2 else 1080,
+            "fps": None if i % 2 else 30, "tbr": 130.0 + i, "abr": 130.0, "asr": 48000, "filesize": 3489225 + i,
+            "source_preference": -1, "audio_channels": 2, "quality": 3, "has_drm": False,
+            "language": "en", "language_preference": -1, "preference": None, "dynamic_range": None,
+            "container": "webm_dash", "downloader_options": {"http_chunk_size": 10485760},
+            "http_headers": {
+                "User-Agent": "com.google.ios.youtube/19.09.3 (iPhone14,3; U; CPU iOS 15_6 like Mac OS X)",
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+                "Accept-Language": "en-us,en;q=0.5",
+                "Sec-Fetch-Mode": "navigate",
+            },
+            "audio_ext": "webm", "video_ext": "none", "format": f"{249 + i} - audio only (medium)",
+        }
+        for i in range(FORMATS)
+    ]
+    thumbnails = [
+        {
+            "url": f"https://i.ytimg.com/vi_webp/{video_id}/{name}.webp",
+            "preference": -i, "id": str(i), "height": 90 * (i % 8 + 1), "width": 120 * (i % 8 + 1),
+            "resolution": f"{120 * (i % 8 + 1)}x{90 * (i % 8 + 1)}",
+        }
+        for i, name in enumerate(["default", "mqdefault", "hqdefault", "sddefault", "maxresdefault"] * (THUMBNAILS // 5))
+    ]
+    captions = {
+        f"l{language:03d}": [
+            {
+                "ext": ext,
+                "url": f"https://www.youtube.com/api/timedtext?v={video_id}&ei=x7dJZq2lNPO&caps=asr&opi=112496729"
+                       f"&xoaf=5&hl=en&ip=0.0.0.0&ipbits=0&expire={int(time.time()) + 21600}&sparams=ip%2Cipbits"
+                       f"%2Cexpire%2Cv%2Cei%2Ccaps%2Copi%2Cxoaf&signature=7E3D1A&key=yt8&kind=asr&lang=en"
+                       f"&tlang=l{language:03d}&fmt={ext}",
+                "name": f"Language {language} (auto-generated)",
+            }
+            for ext in CAPTION_FORMATS
+        ]
+        for language in range(CAPTION_LANGUAGES)
+    }
+    best = formats[-1]
+    return {
+        "id": video_id, "title": f"Artist {index % 997} - Song number {index} (Official Audio)",
+        "formats": formats, "thumbnails": thumbnails, "thumbnail": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+        "description": "Listen to the new single now. " * 60, "channel_id": "UC" + "x" * 22,
+        "channel_url": "https://www.youtube.com/channel/UC" + "x" * 22, "duration": 213, "view_count": 1234567,
+        "age_limit": 0, "webpage_url": f"https://www.youtube.com/watch?v={video_id}",
+        "categories": ["Music"], "tags": [f"tag {i}" for i in range(30)], "playable_in_embed": True,
+        "live_status": "not_live", "automatic_captions": captions, "subtitles": {},
+        "chapters": None, "like_count": 54321, "channel": "Artist", "upload_date": "20240501",
+        "url": best["url"], "acodec": best["acodec"], "abr": best["abr"], "ext": best["ext"],
+        "format_id": best["format_id"], "http_headers": best["http_headers"],
+    }
+
+
+REPRESENTATIONS = ("info", "dict", "track")
+
+
+def song(index: int, representation: str):
+    if representation == "info":
+        return info_dict(index)
+    info = info_dict(index, full=False)
+    if representation == "dict":
+        return {
+            'id': info.get('id'),
+            'url': info['url'],
+            'title': info['title'],
+            'thumbnail': info['thumbnail'],
+            'duration': info.get('duration'),
+            'codec': info.get('acodec'),
+            'bitrate': info.get('abr'),
+        }
+    return Track.from_info(info)
+
+
+def measure(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    held = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return size
+
+
+def one_guild(size: int, representation: str):
+    player = GuildPlayer(1)
+    player.queue.extend(song(i, representation) for i in range(size))
+    return player
+
+
+def many_guilds(guilds: int, queued: int, representation: str):
+    players = {}
+    index = 0
+    for guild_id in range(guilds):
+        player = players[guild_id] = GuildPlayer(guild_id)
+        player.current_song = song(index, representation)
+        player.queue.extend(song(index + 1 + i, representation) for i in range(queued))
+        index += queued + 1
+    return players
+
+
+def main(args) -> dict:
+    # Warm up the caches urllib and the allocator fill on first use, so they are not counted.
+    measure(lambda: [song(i, representation) for i in range(3) for representation in REPRESENTATIONS])
+    scenarios = {
+        f"1 guild, {args.queue} queued": (lambda r, scale: one_guild(args.queue // scale, r), args.queue),
+        f"{args.guilds} guilds playing, {args.guild_queue} queued each": (
+            lambda r, scale: many_guilds(args.guilds // scale, args.guild_queue, r),
+            args.guilds * (args.guild_queue + 1),
+        ),
+    }
+    report = {}
+    for name, (build, songs) in scenarios.items():
+        report[name] = {}
+        for representation in REPRESENTATIONS:
+            # Info dicts are far too large to build every one of; build a fraction and scale up.
+            scale = max(1, songs // args.info_sample) if representation == "info" else 1
+            size = measure(lambda: build(representation, scale))
+            report[name][representation] = {
+                "mb": round(size * scale / 2 ** 20, 2),
+                "bytes_per_song": round(size * scale / songs),
+            }
+            if scale > 1:
+                report[name][representation]["scaled_from"] = songs // scale
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--queue", type=int, default=10000, help="entries in the single guild's queue")
+    parser.add_argument("--guilds", type=int, default=500)
+    parser.add_argument("--guild-queue", type=int, default=20, help="entries queued in each of the guilds")
+    parser.add_argument("--info-sample", type=int, default=200, help="info dicts to build per scenario")
+    args = parser.parse_args()
+    print(json.dumps(main(args), indent=2))
@@ -0,0 +1,91 @@
+"""
+Micro-benchmarks for TrackQueue against the collections.deque it replaced.
+
+Usage: python benchmarks/queue_ops.py [size ...]
+"""
+import os
+import random
+import sys
+import timeit
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from utils.track_queue import TrackQueue  # noqa: E402
+
+OPERATIONS = 2000
+
+
+def deque_ops(size: int) -> dict:
+    queue = deque(f"song {i}" for i in range(size))
+    rng = random.Random(1)
+
+    def get():
+        queue[rng.randrange(size)]
+
+    def insert_remove():
+        index = rng.randrange(size)
+        queue.insert(index, "new")
+        del queue[index]
+
+    def move():
+        source, destination = rng.randrange(size), rng.randrange(size)
+        item = queue[source]
+        del queue[source]
+        queue.insert(destination, item)
+
+    def page():
+        start = rng.randrange(size)
+        [queue[j] for j in range(start, min(start + 5, size))]
+
+    def render_all():
+        for i in range(0, len(queue), 5):
+            [queue[j] for j in range(i, min(i + 5, len(queue)))]
+
+    return {"get": get, "insert+remove": insert_remove, "move": move, "page": page, "render all": render_all}
+
+
+def track_queue_ops(size: int) -> dict:
+    queue = TrackQueue(f"song {i}" for i in range(size))
+    rng = random.Random(1)
+
+    def get():
+        queue[rng.randrange(size)]
+
+    def insert_remove():
+        index = rng.randrange(size)
+        queue.insert(index, "new")
+        queue.pop(index)
+
+    def move():
+        queue.move(rng.randrange(size), rng.randrange(size))
+
+    def page():
+        start = rng.randrange(size)
+        queue.page(start, start + 5)
+
+    def render_all():
+        # $queue now renders only the viewed page.
+        queue.page(0, 5)
+
+    return {"get": get, "insert+remove": insert_remove, "move": move, "page": page, "render all": render_all}
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000]
+    for size in sizes:
+        print(f"{size} entries (us per operation)")
+        baseline, candidate = deque_ops(size), track_queue_ops(size)
+        for name in baseline:
+            number = 3 if name == "render all" else OPERATIONS
+            old = timeit.timeit(baseline[name], number=number) / number * 1e6
+            new = timeit.timeit(candidate[name], number=number) / number * 1e6
+            print(f"  {name:<14} deque {old:12.2f}  TrackQueue {new:10.2f}")
+        queue = TrackQueue(range(size))
+        shuffle = timeit.timeit(queue.shuffle, number=3) / 3 * 1e3
+        unshuffle = timeit.timeit(lambda: (queue.shuffle(), queue.unshuffle()), number=3) / 3 * 1e3 - shuffle
+        print(f"  shuffle {shuffle:.2f}ms  unshuffle {unshuffle:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Compares the streaming YouTube search parser with the old ``ytbettersearch`` implementation.
+
+Usage: python benchmarks/search_parser.py [saved_results_page.html ...]
+
+Without arguments a synthetic results page and ``fixtures/youtube_results.html`` are used. The
+fixture is a trimmed results page with the markup YouTube serves: escaped ``ytInitialData``, ads,
+channel, playlist and Shorts shelves, a live stream and non-ASCII titles. Reports bytes read, wall
+time and peak allocations per parse. A page with a ``.json`` file of the same name next to it is
+also checked against the results listed there.
+"""
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from utils.youtube import SearchResult, parse_results  # noqa: E402
+
+CHUNK_SIZE = 16384
+RUNS = 50
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "youtube_results.html")
+
+
+def synthetic_page(videos: int = 20) -> bytes:
+    renderers = []
+    for i in range(videos):
+        video_id = f"vid{i:08d}"[:11]
+        renderers.append({"videoRenderer": {
+            "videoId": video_id,
+            "thumbnail": {"thumbnails": [{"url": f"https://i.ytimg.com/vi/{video_id}/hq720.jpg", "width": 720}] * 4},
+            "title": {"runs": [{"text": f"Song number {i} (Official Video)"}]},
+            "lengthText": {"simpleText": f"{3 + i % 5}:{i % 60:02d}"},
+            "navigationEndpoint": {"commandMetadata": {"webCommandMetadata": {"url": f"/watch?v={video_id}"}}},
+            "descriptionSnippet": {"runs": [{"text": "lorem ipsum " * 40}]},
+            "ownerBadges": [{"metadataBadgeRenderer": {"tooltip": "Verified"}}] * 3,
+        }})
+    initial_data = {"contents": {"twoColumnSearchResultsRenderer": {"primaryContents": {
+        "sectionListRenderer": {"contents": [{"itemSectionRenderer": {"contents": renderers}}]}}}}}
+    head = "<html><head>" + "<script>var x = '" + "a" * 300_000 + "';</script>"
+    tail = "<script>" + "b" * 400_000 + "</script></body></html>"
+    page = head + "<script>var ytInitialData = " + json.dumps(initial_data) + ";</script>" + tail
+    return page.encode()
+
+
+def legacy_parse(page: bytes) -> str:
+    html = page.decode()
+    index = html.find('watch?v')
+    url = ""
+    while True:
+        char = html[index]
+        if char == '"':
+            break
+        url += char
+        index += 1
+    return f"https://www.youtube.com/{url}"
+
+
+async def chunks(page: bytes):
+    for offset in range(0, len(page), CHUNK_SIZE):
+        yield page[offset:offset + CHUNK_SIZE]
+
+
+async def parse(page: bytes, max_results: int = 5):
+    # parse_results stops reading early; close the generator here rather than leaving it to the
+    # garbage collector, which would schedule its cleanup on a loop that may already be closed.
+    async with contextlib.aclosing(chunks(page)) as stream:
+        return await parse_results(stream, max_results)
+
+
+def check(loop, path: str, page: bytes) -> bool:
+    expected_path = os.path.splitext(path)[0] + ".json"
+    if not os.path.exists(expected_path):
+        return True
+    with open(expected_path, encoding="utf-8") as f:
+        expected = [SearchResult(**result) for result in json.load(f)]
+    results, _ = loop.run_until_complete(parse(page, len(expected) + 1))
+    if results == expected:
+        print(f"  results match {os.path.basename(expected_path)}")
+        return True
+    print(f"  results differ from {os.path.basename(expected_path)}:")
+    for result in results:
+        print(f"    got      {result}")
+    for result in expected:
+        print(f"    expected {result}")
+    return False
+
+
+def measure(name: str, func) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        bytes_read = func()
+    elapsed = (time.perf_counter() - start) / RUNS
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {name:<10} bytes read {bytes_read:>9}  time {elapsed * 1000:8.2f}ms  peak alloc {peak / 1024:9.1f}KiB")
+
+
+def main() -> None:
+    loop = asyncio.new_event_loop()
+    paths = sys.argv[1:] or [None, FIXTURE]
+    ok = True
+    for path in paths:
+        page = synthetic_page() if path is None else open(path, "rb").read()
+        print(f"{path or 'synthetic'} ({len(page)} bytes)")
+        measure("legacy", lambda: (legacy_parse(page), len(page))[1])
+        measure("streaming", lambda: loop.run_until_complete(parse(page))[1])
+        print(f"    legacy picked {legacy_parse(page)}")
+        results, _ = loop.run_until_complete(parse(page))
+        for result in results:
+            print(f"    {result.video_id} {result.duration}s {result.title}")
+        if path is not None:
+            ok = check(loop, path, page) and ok
+    loop.close()
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""
+Offline load simulation: drives the real bot, cogs and utils against fake Discord objects and a
+local stand-in for YouTube, Spotify and uselessfacts.
+
+Usage: python benchmarks/simulate.py [scenario] [options]
+
+Scenarios:
+    guilds      every guild joins voice and sends a burst of $play and $queue commands
+    spotify     one guild queues a large Spotify playlist while it plays
+    skips       every guild queues songs and then skips through them as fast as it can
+    priority    one guild skips through a Spotify playlist that is being resolved in the background
+                while other guilds keep every extraction worker busy with $play
+    facts       bursts of $randomfact, once healthy and once during an uselessfacts outage
+    purge       a PurgeJob over a channel of mostly recent and some older than 14 day messages
+    sessions    rounds of guilds that play a little and then leave voice or let the queue run out,
+                with short reaper timeouts, reporting what is left after each round
+    all         all of the above, one after the other (default)
+
+Commands go through ``bot.on_message`` so prefix parsing, checks, the metrics hooks and the cogs run
+unchanged. Only the Discord gateway, the voice connection, yt_dlp and FFmpeg are replaced. Prints a
+JSON report with command throughput and latency percentiles, event loop lag, tracks played,
+messages and API calls per channel, upstream requests and peak RSS.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import discord  # noqa: E402
+import spotipy  # noqa: E402
+
+import fakes  # noqa: E402
+from bot import DiscordBot  # noqa: E402
+from utils.admission import PRIORITY_NAMES  # noqa: E402
+from utils.purge import PurgeJob  # noqa: E402
+from utils.queue_resolver import QueueResolver  # noqa: E402
+from utils.spotify import SpotifyClient  # noqa: E402
+
+
+class HarnessBot(DiscordBot):
+    """
+    DiscordBot with the gateway replaced: it never logs in, contexts reply to fake channels and
+    outgoing HTTP goes to the MediaServer.
+    """
+
+    def __init__(self, media: fakes.MediaServer) -> None:
+        super().__init__()
+        self.media = media
+        self.owner_id = 1
+        # Playback is simulated, so there is nothing for the audio cache to download.
+        self.config = {**self.config, "audio_cache": {}}
+
+    def create_http_client(self):
+        http_config = self.config.get("http", {})
+        return fakes.RedirectingHTTPClient(
+            self.media.base_url,
+            limit=http_config.get("limit", 100),
+            limit_per_host=http_config.get("limit_per_host", 10),
+            timeout=http_config.get("timeout", 10.0),
+            retries=http_config.get("retries", 2),
+            backoff=http_config.get("backoff", 0.5),
+            max_retry_after=http_config.get("max_retry_after", 10.0),
+        )
+
+    async def get_context(self, origin, *, cls=fakes.FakeContext):
+        return await super().get_context(origin, cls=cls)
+
+    async def start_offline(self) -> None:
+        self._connection.user = discord.ClientUser(
+            state=self._connection,
+            data={"id": 2, "username": "harness", "discriminator": "0000", "avatar": None, "bot": True},
+        )
+        await self.setup_hook()
+        music = self.get_cog("music")
+        music.resolver.extractor = fakes.stub_extractor()
+        music.open_audio = fakes.open_silent_source
+        music.prefetcher.opener = fakes.open_silent_source
+        client = spotipy.Spotify(auth="offline")
+        client.prefix = f"{self.media.base_url}/v1/"
+        music.spotify = SpotifyClient("offline", "offline", client=client)
+
+    async def stop_offline(self) -> None:
+        for voice in list(self.voice_clients):
+            await voice.disconnect()
+        for loop in (self.status_task, self.metrics_task):
+            loop.cancel()
+        for extension in list(self.extensions):
+            await self.unload_extension(extension)
+        self.loop_lag.stop()
+        if self.http_client is not None:
+            await self.http_client.close()
+
+
+def current_rss() -> int:
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Simulation:
+    def __init__(self, bot: HarnessBot) -> None:
+        self.bot = bot
+        self.latencies = {}
+
+    async def send(self, guild: fakes.FakeGuild, member: fakes.FakeMember, content: str) -> None:
+        message = fakes.FakeMessage(guild.text_channel, member, content)
+        start = time.perf_counter()
+        await self.bot.on_message(message)
+        name = content.split()[0].lstrip(self.bot.config["prefix"])
+        self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+
+    async def guild_session(self, guild: fakes.FakeGuild, plays: int, jitter: float) -> None:
+        member = guild.member("listener")
+        for i in range(plays):
+            await asyncio.sleep(random.random() * jitter)
+            await self.send(guild, member, f"$play song {guild.id} {i % 7}")
+        await self.send(guild, member, "$queue")
+        await self.send(guild, member, "$now_playing")
+
+    async def guilds(self, count: int, plays: int, jitter: float, play_for: float) -> dict:
+        guilds = [fakes.FakeGuild(self.bot) for _ in range(count)]
+        await asyncio.gather(*(self.guild_session(guild, plays, jitter) for guild in guilds))
+        await asyncio.sleep(play_for)
+        return {
+            "guilds": count,
+            "tracks_played": sum(getattr(guild.voice_client, "tracks_played", 0) for guild in guilds),
+            "messages_sent": sum(len(guild.text_channel.sent) for guild in guilds),
+            "channel_api_calls": sum(guild.text_channel.api_calls for guild in guilds),
+        }
+
+    async def skip_session(self, guild: fakes.FakeGuild, songs: int) -> None:
+        member = guild.member("skipper")
+        for i in range(songs):
+            await self.send(guild, member, f"$play skip {guild.id} {i}")
+        for _ in range(songs - 1):
+            await self.send(guild, member, "$next")
+
+    async def skips(self, count: int, songs: int, play_for: float) -> dict:
+        guilds = [fakes.FakeGuild(self.bot) for _ in range(count)]
+        await asyncio.gather(*(self.skip_session(guild, songs) for guild in guilds))
+        await asyncio.sleep(play_for)
+        return {
+            "guilds": count,
+            "songs_per_guild": songs,
+            "messages_sent": sum(len(guild.text_channel.sent) for guild in guilds),
+            "channel_api_calls": sum(guild.text_channel.api_calls for guild in guilds),
+        }
+
+    async def spotify(self, play_for: float) -> dict:
+        guild = fakes.FakeGuild(self.bot)
+        member = guild.member("listener")
+        start = time.perf_counter()
+        await self.send(guild, member, "$play https://open.spotify.com/playlist/harness")
+        queued = time.perf_counter() - start
+        await asyncio.sleep(play_for)
+        player = self.bot.get_cog("music").players.peek(guild.id)
+        return {
+            "playlist_size": self.bot.media.playlist_size,
+            "queue_seconds": round(queued, 3),
+            "queued": len(player.queue) if player else 0,
+            "unresolved": QueueResolver.pending(player) if player else 0,
+            "tracks_played": getattr(guild.voice_client, "tracks_played", 0),
+            "messages_sent": len(guild.text_channel.sent),
+            "channel_api_calls": guild.text_channel.api_calls,
+        }
+
+    async def play_session(self, guild: fakes.FakeGuild, plays: int) -> None:
+        member = guild.member("listener")
+        for i in range(plays):
+            await self.send(guild, member, f"$play busy {guild.id} {i}")
+
+    async def priority(self, count: int, plays: int, skips: int) -> dict:
+        music = self.bot.get_cog("music")
+        extractor = music.resolver.extractor
+        # Slow extractions keep the workers saturated.
+        music.resolver.extractor = fakes.stub_extractor(delay=0.25)
+        try:
+            busy = [fakes.FakeGuild(self.bot) for _ in range(count)]
+            load = asyncio.gather(*(self.play_session(guild, plays) for guild in busy))
+            await asyncio.sleep(1.0)
+            guild = fakes.FakeGuild(self.bot)
+            member = guild.member("skipper")
+            await self.send(guild, member, "$play https://open.spotify.com/playlist/priority")
+            # Let the queue resolver start on the front of the queue.
+            await asyncio.sleep(0.5)
+            waiting = music.resolver.stats()["waiting"]
+            latencies = []
+            for _ in range(skips):
+                start = time.perf_counter()
+                await self.send(guild, member, "$next")
+                latencies.append(time.perf_counter() - start)
+            load_done = load.done()
+            tracks_played = guild.voice_client.tracks_played
+            await load
+            for other in [*busy, guild]:
+                await self.send(other, other.member("listener"), "$leave")
+        finally:
+            music.resolver.extractor = extractor
+        return {
+            "busy_guilds": count,
+            "waiting_at_first_skip": {PRIORITY_NAMES[priority]: n for priority, n in waiting.items()},
+            "skips": skips,
+            "next_p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+            "next_max_ms": round(max(latencies) * 1000, 2),
+            "skips_done_before_load": load_done,
+            "tracks_played": tracks_played,
+        }
+
+    async def fact_burst(self, guilds, size: int) -> dict:
+        start = time.perf_counter()
+        channel_sent = [len(guild.text_channel.sent) for guild in guilds]
+        requests = self.bot.media.fact_requests
+        await asyncio.gather(*(
+            self.send(guilds[i % len(guilds)], guilds[i % len(guilds)].member("curious"), "$randomfact")
+            for i in range(size)
+        ))
+        embeds = [
+            message for guild, sent in zip(guilds, channel_sent) for message in guild.text_channel.sent[sent:]
+        ]
+        return {
+            "commands": size,
+            "seconds": round(time.perf_counter() - start, 3),
+            "errors": sum(1 for message in embeds if message.embed is not None and message.embed.title == "Error!"),
+            "upstream_requests": self.bot.media.fact_requests - requests,
+            "pool": self.bot.get_cog("fun").facts.stats(),
+        }
+
+    async def purge(self, recent: int, old: int) -> dict:
+        guild = fakes.FakeGuild(self.bot)
+        channel = guild.text_channel
+        author = guild.member("chatter")
+        # History is oldest first: the old messages, then the recent ones.
+        channel.add_history(author, old, age=datetime.timedelta(days=20))
+        channel.add_history(author, recent)
+        progress = []
+
+        async def on_progress(job: PurgeJob) -> None:
+            progress.append(job.deleted)
+
+        start = time.perf_counter()
+        job = await PurgeJob(channel, recent + old, on_progress=on_progress).run()
+        return {
+            "messages": recent + old,
+            "older_than_14_days": old,
+            "seconds": round(time.perf_counter() - start, 3),
+            "bulk_deleted": job.bulk_deleted,
+            "single_deleted": job.single_deleted,
+            "left": len(channel.messages),
+            "progress_updates": len(progress),
+            "api_calls": channel.api_calls,
+            "job_api_calls": job.api_calls,
+        }
+
+    async def abandoned_session(self, guild: fakes.FakeGuild, leave: bool) -> None:
+        member = guild.member("listener")
+        await self.send(guild, member, f"$play session {guild.id}")
+        if leave:
+            guild.leave_voice(member)
+
+    async def sessions(self, count: int, rounds: int) -> dict:
+        music = self.bot.get_cog("music")
+        music.reaper.idle_timeout = 1.0
+        music.reaper.alone_timeout = 0.5
+        music.reap_task.change_interval(seconds=0.25)
+        report = []
+        for _ in range(rounds):
+            guilds = [fakes.FakeGuild(self.bot) for _ in range(count)]
+            await asyncio.gather(*(self.abandoned_session(guild, i % 2 == 0) for i, guild in enumerate(guilds)))
+            # Songs last 5s at the simulated speed, then the queue is empty.
+            await asyncio.sleep(5.0 / fakes.FakeVoiceClient.speed + 2.0)
+            report.append({
+                "voice_clients": len(self.bot.voice_clients),
+                "players": len(music.players),
+                "live_sources": fakes.SilentSource.live,
+                "open_fds": len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else None,
+                "rss_mb": round(current_rss() / 2 ** 20, 1),
+            })
+        return {"guilds_per_round": count, "rounds": report, "reaper": music.reaper.stats()}
+
+    async def facts(self, count: int, burst: int) -> dict:
+        guilds = [fakes.FakeGuild(self.bot) for _ in range(count)]
+        # Let the pool fill once, as it does after start up.
+        await asyncio.sleep(1.0)
+        report = {"healthy": await self.fact_burst(guilds, burst)}
+        self.bot.media.facts_down = True
+        # Long enough for the refill to fail its way to an open breaker.
+        await asyncio.sleep(5.0)
+        report["outage"] = await self.fact_burst(guilds, burst)
+        self.bot.media.facts_down = False
+        return report
+
+    def report(self, wall: float) -> dict:
+        commands = {}
+        total = 0
+        for name, values in sorted(self.latencies.items()):
+            total += len(values)
+            commands[name] = {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 0.5) * 1000, 2),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+                "max_ms": round(max(values) * 1000, 2),
+            }
+        lag = self.bot.loop_lag.snapshot()
+        return {
+            "commands": commands,
+            "commands_per_second": round(total / wall, 1) if wall else 0.0,
+            "loop_lag_ms": {key: round(value * 1000, 2) for key, value in lag.items()},
+            "upstream_requests": self.bot.media.requests,
+            "resolver": self.bot.get_cog("music").resolver.stats(),
+            "admission": self.bot.get_cog("music").admission.stats(),
+            "live_sources": fakes.SilentSource.live,
+        }
+
+
+async def main(args) -> dict:
+    media = fakes.MediaServer(playlist_size=args.playlist_size, latency=args.latency)
+    await media.start()
+    fakes.FakeVoiceClient.speed = args.speed
+    bot = HarnessBot(media)
+    report = {"scenario": args.scenario}
+    try:
+        async with bot:
+            await bot.start_offline()
+            simulation = Simulation(bot)
+            start = time.perf_counter()
+            if args.scenario in ("guilds", "all"):
+                report["guilds"] = await simulation.guilds(args.guilds, args.plays, args.jitter, args.play_for)
+            if args.scenario in ("spotify", "all"):
+                report["spotify"] = await simulation.spotify(args.play_for)
+            if args.scenario in ("facts", "all"):
+                report["facts"] = await simulation.facts(min(args.guilds, 50), args.burst)
+            if args.scenario in ("skips", "all"):
+                report["skips"] = await simulation.skips(args.guilds, args.plays * 2, args.play_for)
+            if args.scenario in ("priority", "all"):
+                report["priority"] = await simulation.priority(min(args.guilds, 50), args.plays * 2, args.skips)
+            if args.scenario in ("purge", "all"):
+                report["purge"] = await simulation.purge(args.purge_recent, args.purge_old)
+            if args.scenario in ("sessions", "all"):
+                report["sessions"] = await simulation.sessions(args.guilds, args.rounds)
+            wall = time.perf_counter() - start
+            report.update(simulation.report(wall))
+            report["wall_seconds"] = round(wall, 2)
+            await bot.stop_offline()
+    finally:
+        await media.stop()
+    report["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("scenario", nargs="?", default="all", choices=("guilds", "spotify", "skips", "priority", "facts", "purge", "sessions", "all"))
+    parser.add_argument("--guilds", type=int, default=500)
+    parser.add_argument("--plays", type=int, default=5, help="$play commands per guild")
+    parser.add_argument("--jitter", type=float, default=1.0, help="max seconds between a guild's commands")
+    parser.add_argument("--playlist-size", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated upstream latency in seconds")
+    parser.add_argument("--speed", type=float, default=10.0, help="playback speed multiplier")
+    parser.add_argument("--play-for", type=float, default=5.0, help="seconds to keep playing after the commands")
+    parser.add_argument("--skips", type=int, default=5, help="$next commands in the priority scenario")
+    parser.add_argument("--burst", type=int, default=200, help="$randomfact commands per burst")
+    parser.add_argument("--purge-recent", type=int, default=9990, help="recent messages in the purge scenario")
+    parser.add_argument("--purge-old", type=int, default=10, help="messages older than 14 days in the purge scenario")
+    parser.add_argument("--rounds", type=int, default=5, help="rounds of the sessions scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    print(json.dumps(asyncio.run(main(args)), indent=2))
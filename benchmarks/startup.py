@@ -0,0 +1,70 @@
+"""
+Time to ready for a fresh bot process.
+
+Usage: python benchmarks/startup.py [runs]
+
+Each run starts a new interpreter that imports the bot, runs ``setup_hook`` offline (no gateway
+login) and reports back. The parent measures wall time from spawning the process to the child being
+ready, which includes interpreter start up, imports and loading every cog. Prints the median and best
+run, and the per extension timings from the last run when the bot records them.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+CHILD = """
+import asyncio, json, sys, time
+sys.path.insert(0, {src!r})
+import discord
+from bot import DiscordBot
+
+async def main():
+    bot = DiscordBot()
+    async with bot:
+        bot._connection.user = discord.ClientUser(
+            state=bot._connection,
+            data={{"id": 2, "username": "startup", "discriminator": "0000", "avatar": None, "bot": True}},
+        )
+        await bot.setup_hook()
+        ready = time.time()
+        report = getattr(bot, "startup_report", None)
+        for extension in list(bot.extensions):
+            await bot.unload_extension(extension)
+        await bot.http_client.close()
+    return ready, report
+
+ready, report = asyncio.run(main())
+print(json.dumps({{"ready": ready, "report": report, "modules": len(sys.modules)}}))
+"""
+
+
+def run_once(cwd: str) -> dict:
+    start = time.time()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(src=os.path.abspath(SRC))],
+        cwd=cwd, capture_output=True, text=True, check=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["time_to_ready"] = result.pop("ready") - start
+    return result
+
+
+def main(runs: int) -> None:
+    with tempfile.TemporaryDirectory() as cwd:
+        results = [run_once(cwd) for _ in range(runs)]
+    times = [result["time_to_ready"] for result in results]
+    print(f"time to ready over {runs} runs: median {statistics.median(times) * 1000:.0f}ms, "
+          f"best {min(times) * 1000:.0f}ms, {results[-1]['modules']} modules imported")
+    report = results[-1]["report"]
+    if report:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -2,12 +2,25 @@ import discord
 from discord.ext import commands, tasks
 from discord.ext.commands import Context
 from dotenv import load_dotenv
+import asyncio
+import importlib
 import os
 import sys
 import json
-import logging
 import platform
 import random
+import math
+import time
+from typing import Optional
+
+from utils.cluster import ClusterConfig
+from utils.http import HTTPClient
+from utils.ipc import IPCClient
+from utils.log import setup_logging
+from utils.metrics import Metrics, MetricsServer
+from utils.monitor import LoopLagMonitor
+from utils.prefix import PrefixCache
+from utils.store import PlayerStore
 
 # to run in background : nohup python /Users/rishabh/Desktop/bot/src/bot.py &
 # to kill the process : ps aux | grep bot.py
@@ -19,67 +32,35 @@ else:
     with open(f"{os.path.realpath(os.path.dirname(__file__))}/config.json") as file:
         config = json.load(file)
 
+cluster = ClusterConfig.from_env()
+if cluster is not None:
+    config = cluster.configure(config)
 
 intents = discord.Intents.default()
 
 intents.message_content = True
 
+# Extensions that must finish loading before the key extension starts, e.g. music imports the help Paginator.
+EXTENSION_DEPENDENCIES = {
+    "music": ("help",),
+}
+
+
+logger, log_listener = setup_logging(config)
 
-class LoggingFormatter(logging.Formatter):
-    # Colors
-    black = "\x1b[30m"
-    red = "\x1b[31m"
-    green = "\x1b[32m"
-    yellow = "\x1b[33m"
-    blue = "\x1b[34m"
-    gray = "\x1b[38m"
-    # Styles
-    reset = "\x1b[0m"
-    bold = "\x1b[1m"
-
-    COLORS = {
-        logging.DEBUG: gray + bold,
-        logging.INFO: blue + bold,
-        logging.WARNING: yellow + bold,
-        logging.ERROR: red,
-        logging.CRITICAL: red + bold,
-    }
-
-    def format(self, record):
-        log_color = self.COLORS[record.levelno]
-        format = "(black){asctime}(reset) (levelcolor){levelname:<8}(reset) (green){name}(reset) {message}"
-        format = format.replace("(black)", self.black + self.bold)
-        format = format.replace("(reset)", self.reset)
-        format = format.replace("(levelcolor)", log_color)
-        format = format.replace("(green)", self.green + self.bold)
-        formatter = logging.Formatter(format, "%Y-%m-%d %H:%M:%S", style="{")
-        return formatter.format(record)
-
-
-logger = logging.getLogger("discord_bot")
-logger.setLevel(logging.INFO)
-
-# Console handler
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(LoggingFormatter())
-# File handler
-file_handler = logging.FileHandler(filename="discord.log", encoding="utf-8", mode="w")
-file_handler_formatter = logging.Formatter(
-    "[{asctime}] [{levelname:<8}] {name}: {message}", "%Y-%m-%d %H:%M:%S", style="{"
-)
-file_handler.setFormatter(file_handler_formatter)
-
-# Add the handlers
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
-
-
-class DiscordBot(commands.Bot):
-    def __init__(self) -> None:
+
+class DiscordBot(commands.AutoShardedBot):
+    def __init__(self, cluster: Optional[ClusterConfig] = None) -> None:
+        if cluster is not None:
+            shards = {"shard_ids": cluster.shard_ids, "shard_count": cluster.shard_count}
+        else:
+            # None lets Discord pick the shard count, which is 1 until the bot is in a few thousand guilds.
+            shards = {"shard_count": config.get("sharding", {}).get("shard_count")}
         super().__init__(
-            command_prefix=commands.when_mentioned_or(config["prefix"]),
+            command_prefix=lambda bot, message: bot.prefixes.candidates(message.guild and message.guild.id),
             intents=intents,
             help_command=None,
+            **shards,
         )
         """
         This creates custom bot variables so that we can access these variables in cogs more easily.
@@ -92,19 +73,73 @@ class DiscordBot(commands.Bot):
         self.logger = logger
         self.config = config
         self.database = None
+        self.prefixes = PrefixCache(config["prefix"])
+        self.http_client = None
+        self.loop_lag = LoopLagMonitor(logger=logger)
+        self.metrics = Metrics()
+        self.metrics_server = None
+        self.cluster = cluster
+        self.ipc = None
+        self.startup_report = {"extensions": {}}
+        self._setup_started = None
+
+    async def load_cog(self, extension: str, dependencies) -> bool:
+        """
+        Loads one extension once its dependencies have loaded. The module is imported on a worker thread so
+        several extensions can import at once, then registered with the bot on the event loop.
+        """
+        for dependency in dependencies:
+            if not await dependency:
+                self.logger.error(f"Not loading extension {extension}: a dependency failed to load")
+                return False
+        start = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, importlib.import_module, f"cogs.{extension}")
+            imported = time.perf_counter()
+            await self.load_extension(f"cogs.{extension}")
+        except Exception as e:
+            exception = f"{type(e).__name__}: {e}"
+            self.logger.error(
+                f"Failed to load extension {extension}\n{exception}"
+            )
+            return False
+        timing = {"import": imported - start, "setup": time.perf_counter() - imported}
+        self.startup_report["extensions"][extension] = timing
+        self.logger.info(
+            "Loaded extension '%s' (import %.0fms, setup %.0fms)",
+            extension, timing["import"] * 1000, timing["setup"] * 1000,
+        )
+        return True
 
     async def load_cogs(self) -> None:
-        for file in os.listdir(f"{os.path.realpath(os.path.dirname(__file__))}/cogs"):
-            if file.endswith(".py"):
-                extension = file[:-3]
-                try:
-                    await self.load_extension(f"cogs.{extension}")
-                    self.logger.info(f"Loaded extension '{extension}'")
-                except Exception as e:
-                    exception = f"{type(e).__name__}: {e}"
-                    self.logger.error(
-                        f"Failed to load extension {extension}\n{exception}"
-                    )
+        extensions = sorted(
+            file[:-3] for file in os.listdir(f"{os.path.realpath(os.path.dirname(__file__))}/cogs") if file.endswith(".py")
+        )
+        loads = {}
+
+        def schedule(extension: str) -> asyncio.Future:
+            if extension not in loads:
+                dependencies = [
+                    schedule(name) for name in EXTENSION_DEPENDENCIES.get(extension, ()) if name in extensions
+                ]
+                loads[extension] = asyncio.ensure_future(self.load_cog(extension, dependencies))
+            return loads[extension]
+
+        for extension in extensions:
+            schedule(extension)
+        await asyncio.gather(*loads.values())
+
+    def create_http_client(self) -> HTTPClient:
+        http_config = self.config.get("http", {})
+        return HTTPClient(
+            limit=http_config.get("limit", 100),
+            limit_per_host=http_config.get("limit_per_host", 10),
+            dns_ttl=http_config.get("dns_ttl", 300),
+            timeout=http_config.get("timeout", 10.0),
+            retries=http_config.get("retries", 2),
+            backoff=http_config.get("backoff", 0.5),
+            max_retry_after=http_config.get("max_retry_after", 10.0),
+        )
 
     @tasks.loop(minutes=1.0)
     async def status_task(self) -> None:
@@ -115,36 +150,183 @@ class DiscordBot(commands.Bot):
     async def before_status_task(self) -> None:
         await self.wait_until_ready()
 
+    @tasks.loop(seconds=10.0)
+    async def metrics_task(self) -> None:
+        lag = self.loop_lag.snapshot()
+        for quantile in ("p50", "p99", "max"):
+            self.metrics.set_gauge(
+                "event_loop_lag_seconds", lag[quantile], {"quantile": quantile},
+                documentation="How late the event loop woke up from a short sleep.",
+            )
+        for shard_id, latency in self.latencies:
+            if math.isfinite(latency):
+                self.metrics.set_gauge(
+                    "gateway_latency_seconds", latency, {"shard": str(shard_id)},
+                    documentation="Heartbeat latency to the Discord gateway.",
+                )
+        self.metrics.set_gauge("guilds", len(self.guilds), documentation="Guilds the bot is in.")
+        self.metrics.set_gauge(
+            "voice_clients", len(self.voice_clients), documentation="Connected voice clients."
+        )
+        if self.http_client is not None:
+            for host, stats in self.http_client.stats()["hosts"].items():
+                self.metrics.set_counter("http_requests_total", stats["requests"], {"host": host})
+                self.metrics.set_gauge("http_request_latency_seconds", stats["average_latency"], {"host": host})
+        if self.database is not None:
+            stats = self.database.stats()
+            self.metrics.set_counter("store_flushes_total", stats["flushes"], documentation="Batched writes to the session store.")
+            self.metrics.set_counter("store_rows_written_total", stats["rows_written"])
+            self.metrics.set_gauge("store_pending", stats["pending"], documentation="Guilds with unsaved changes.")
+
+    @metrics_task.before_loop
+    async def before_metrics_task(self) -> None:
+        await self.wait_until_ready()
+
+    def cluster_stats(self) -> dict:
+        """
+        Summary of this process for the cluster supervisor. Integer fields are summed across clusters.
+        """
+        self.metrics.collect()
+        players = self.metrics.series("music_players")
+        return {
+            "cluster_id": self.cluster.cluster_id if self.cluster is not None else 0,
+            "shards": len(self.shard_ids or self.shards),
+            "guilds": len(self.guilds),
+            "voice_clients": len(self.voice_clients),
+            "players": int(players[0][1]) if players else 0,
+            "latency": self.latency if math.isfinite(self.latency) else None,
+            "loop_lag_p99": self.loop_lag.snapshot()["p99"],
+        }
+
+    async def ipc_stats(self, data) -> dict:
+        return self.cluster_stats()
+
+    async def ipc_reload(self, data) -> list:
+        reloaded = []
+        for extension in data or []:
+            await self.reload_extension(f"cogs.{extension}")
+            reloaded.append(extension)
+        return reloaded
+
     async def setup_hook(self) -> None:
+        self._setup_started = time.perf_counter()
         self.logger.info(f"Logged in as {self.user.name}")
         self.logger.info(f"discord.py API version: {discord.__version__}")
         self.logger.info(f"Python version: {platform.python_version()}")
         self.logger.info(
             f"Running on: {platform.system()} {platform.release()} ({os.name})"
         )
+        if self.cluster is not None:
+            self.logger.info(
+                f"Cluster {self.cluster.cluster_id}: shards {self.cluster.shard_ids} of {self.cluster.shard_count}"
+            )
         self.logger.info("-------------------")
+        self.http_client = self.create_http_client()
+        await self.http_client.start()
+        if self.cluster is not None:
+            self.ipc = IPCClient(
+                self.cluster.ipc_host,
+                self.cluster.ipc_port,
+                self.cluster.ipc_secret,
+                self.cluster.cluster_id,
+                handlers={"stats": self.ipc_stats, "reload": self.ipc_reload},
+                logger=self.logger,
+                on_orphaned=lambda: asyncio.ensure_future(self.close()),
+            )
+            self.ipc.start()
+        database_config = self.config.get("database", {})
+        if database_config.get("path"):
+            self.database = PlayerStore(
+                database_config["path"],
+                flush_interval=database_config.get("flush_interval", 1.0),
+                logger=self.logger,
+            )
+            await self.database.start()
+        self.prefixes.set_user(self.user.id)
+        await self.prefixes.load(self.database)
+        start = time.perf_counter()
         await self.load_cogs()
+        self.startup_report["load_cogs"] = time.perf_counter() - start
         self.status_task.start()
+        self.loop_lag.start()
+        self.metrics_task.start()
+        metrics_config = self.config.get("metrics", {})
+        if metrics_config.get("enabled", False):
+            self.metrics_server = MetricsServer(
+                self.metrics,
+                host=metrics_config.get("host", "127.0.0.1"),
+                port=metrics_config.get("port", 9100),
+            )
+            await self.metrics_server.start()
+        self.startup_report["setup"] = time.perf_counter() - self._setup_started
+        self.logger.info(
+            "Setup took %.0fms, %.0fms of it loading extensions",
+            self.startup_report["setup"] * 1000, self.startup_report["load_cogs"] * 1000,
+        )
+
+    async def on_ready(self) -> None:
+        if "ready" in self.startup_report:
+            return
+        self.startup_report["ready"] = time.perf_counter() - self._setup_started
+        self.logger.info("Ready %.0fms after login", self.startup_report["ready"] * 1000)
+
+    async def close(self) -> None:
+        await super().close()
+        if self.ipc is not None:
+            await self.ipc.close()
+        if self.database is not None:
+            await self.database.close()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        if self.http_client is not None:
+            await self.http_client.close()
+        log_listener.stop()
 
     async def on_message(self, message: discord.Message) -> None:
-        if message.author == self.user or message.author.bot:
+        if message.author.bot:
+            return
+        # Most messages are chat: drop everything that does not start with a prefix and the name of a
+        # command before discord.py builds a Context for it.
+        name = self.prefixes.command_name(message.content, message.guild and message.guild.id)
+        if name is None or name not in self.all_commands:
             return
         await self.process_commands(message)
 
+    async def invoke(self, context: Context) -> None:
+        if context.command is None:
+            return await super().invoke(context)
+        start = time.perf_counter()
+        try:
+            await super().invoke(context)
+        finally:
+            self.metrics.observe(
+                "command_duration_seconds",
+                time.perf_counter() - start,
+                {"command": context.command.qualified_name, "status": "error" if context.command_failed else "ok"},
+                documentation="Time from invoking a command to its completion.",
+            )
+
     async def on_command_completion(self, context: Context) -> None:
         full_command_name = context.command.qualified_name
         split = full_command_name.split(" ")
         executed_command = str(split[0])
         if context.guild is not None:
             self.logger.info(
-                f"Executed {executed_command} command in {context.guild.name} (ID: {context.guild.id}) by {context.author} (ID: {context.author.id})"
+                "Executed %s command in %s (ID: %s) by %s (ID: %s)",
+                executed_command, context.guild.name, context.guild.id, context.author, context.author.id,
             )
         else:
             self.logger.info(
-                f"Executed {executed_command} command by {context.author} (ID: {context.author.id}) in DMs"
+                "Executed %s command by %s (ID: %s) in DMs", executed_command, context.author, context.author.id
             )
 
     async def on_command_error(self, context: Context, error) -> None:
+        original = getattr(error, "original", error)
+        self.metrics.inc(
+            "command_errors_total",
+            {"command": context.command.qualified_name if context.command else "", "error": type(original).__name__},
+            documentation="Command errors by exception type.",
+        )
         if isinstance(error, commands.CommandOnCooldown):
             minutes, seconds = divmod(error.retry_after, 60)
             hours, minutes = divmod(minutes, 60)
@@ -195,7 +377,8 @@ class DiscordBot(commands.Bot):
             raise error
 
 
-load_dotenv()
+if __name__ == "__main__":
+    load_dotenv()
 
-bot = DiscordBot()
-bot.run(os.getenv("TOKEN"))
\ No newline at end of file
+    bot = DiscordBot(cluster=cluster)
+    bot.run(os.getenv("TOKEN"))
@@ -1,9 +1,10 @@
 import random
-import aiohttp
 import discord
 from discord.ext import commands
 from discord.ext.commands import Context
 
+from utils.facts import CircuitBreaker, FactPool
+
 
 class Choice(discord.ui.View):
     def __init__(self) -> None:
@@ -87,23 +88,49 @@ class RockPaperScissorsView(discord.ui.View):
 class Fun(commands.Cog, name="fun"):
     def __init__(self, bot) -> None:
         self.bot = bot
+        facts_config = bot.config.get("facts", {})
+        self.facts = FactPool(
+            bot.http_client,
+            low=facts_config.get("low", 5),
+            high=facts_config.get("high", 20),
+            concurrency=facts_config.get("concurrency", 4),
+            recent=facts_config.get("recent", 500),
+            breaker=CircuitBreaker(
+                failure_threshold=facts_config.get("failure_threshold", 5),
+                reset_timeout=facts_config.get("reset_timeout", 30.0),
+            ),
+            logger=bot.logger,
+        )
+
+    async def cog_load(self) -> None:
+        self.bot.metrics.register_collector(self.collect_metrics)
+        self.facts.start()
+
+    async def cog_unload(self) -> None:
+        self.bot.metrics.unregister_collector(self.collect_metrics)
+        await self.facts.close()
+
+    def collect_metrics(self, metrics) -> None:
+        stats = self.facts.stats()
+        metrics.set_gauge("facts_pooled", stats["pooled"], documentation="Random facts ready to be served.")
+        for source, count in stats["served"].items():
+            metrics.set_counter("facts_served_total", count, {"source": source}, documentation="Random facts served, by where they came from.")
+        metrics.set_counter("facts_fetch_errors_total", stats["errors"], documentation="Failed random fact requests.")
+        metrics.set_counter("facts_duplicates_total", stats["duplicates"], documentation="Fetched random facts dropped as recent repeats.")
+        metrics.set_gauge("facts_breaker_open", int(stats["breaker"] != CircuitBreaker.CLOSED), documentation="Whether the random fact API circuit breaker is open.")
 
     @commands.hybrid_command(name="randomfact", description="Get a random fact.")
     async def randomfact(self, context: Context) -> None:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                "https://uselessfacts.jsph.pl/random.json?language=en"
-            ) as request:
-                if request.status == 200:
-                    data = await request.json()
-                    embed = discord.Embed(description=data["text"], color=0xD75BF4)
-                else:
-                    embed = discord.Embed(
-                        title="Error!",
-                        description="There is something wrong with the API, please try again later",
-                        color=0xE02B2B,
-                    )
-                await context.send(embed=embed)
+        text = await self.facts.get()
+        if text is not None:
+            embed = discord.Embed(description=text, color=0xD75BF4)
+        else:
+            embed = discord.Embed(
+                title="Error!",
+                description="There is something wrong with the API, please try again later",
+                color=0xE02B2B,
+            )
+        await context.send(embed=embed)
 
     @commands.hybrid_command(
         name="coinflip", description="Make a coin flip, but give your bet before."
@@ -2,49 +2,120 @@ import discord
 from discord.ext import commands
 from discord.ext.commands import Context
 import asyncio
+from typing import Optional
+
+from utils.purge import PurgeJob
+
+MAX_CLEAR = 10000
+
+class PaginatorView(discord.ui.View):
+    def __init__(self, author, get_page, page_count: int, current_page: int = 0, timeout=120):
+        super().__init__(timeout=timeout)
+        self.author = author
+        self.get_page = get_page
+        self.page_count = page_count
+        self.current_page = current_page
+        self.message = None
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user == self.author
+
+    async def show(self, interaction: discord.Interaction, page: int) -> None:
+        if page < 0 or page >= self.page_count:
+            return await interaction.response.defer()
+        self.current_page = page
+        await interaction.response.edit_message(embed=self.get_page(page), view=self)
+
+    @discord.ui.button(emoji="◀️", style=discord.ButtonStyle.blurple)
+    async def previous(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        await self.show(interaction, self.current_page - 1)
+
+    @discord.ui.button(emoji="▶️", style=discord.ButtonStyle.blurple)
+    async def next(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        await self.show(interaction, self.current_page + 1)
+
+    @discord.ui.button(emoji="❌", style=discord.ButtonStyle.gray)
+    async def close(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        self.stop()
+        await interaction.response.defer()
+        await interaction.delete_original_response()
+
+    async def on_timeout(self) -> None:
+        if self.message is None:
+            return
+        try:
+            await self.message.edit(view=None)
+        except discord.HTTPException:
+            pass
+
 
 class Paginator:
+    """
+    Shows pages one at a time with buttons to move between them.
+
+    ``get_page`` is called with a page index and returns the embed for it, so pages are only built
+    when someone looks at them. Page changes are answered through the interaction response and cost
+    no extra REST calls.
+    """
+
     def __init__(self, bot):
         self.bot = bot
 
-    async def paginate(self, ctx: Context, pages: list, timeout=120):
-        current_page = 0
-        message = await ctx.send(embed=pages[current_page])
-        
-        await message.add_reaction("◀️")
-        await message.add_reaction("▶️")
-        await message.add_reaction("❌")
-
-        def check(reaction, user):
-            return user == ctx.author and str(reaction.emoji) in ["◀️", "▶️", "❌"]
-
-        while True:
-            try:
-                reaction, user = await self.bot.wait_for("reaction_add", timeout=timeout, check=check)
-                if str(reaction.emoji) == "▶️" and current_page < len(pages) - 1:
-                    current_page += 1
-                    await message.edit(embed=pages[current_page])
-                elif str(reaction.emoji) == "◀️" and current_page > 0:
-                    current_page -= 1
-                    await message.edit(embed=pages[current_page])
-                elif str(reaction.emoji) == "❌":
-                    await message.delete()
-                    break
-
-                await message.remove_reaction(reaction, user)
-            except:
-                break
+    async def paginate(self, ctx: Context, get_page, page_count: int, timeout=120, start=0):
+        current_page = min(max(start, 0), page_count - 1)
+        if page_count <= 1:
+            return await ctx.send(embed=get_page(current_page))
+        view = PaginatorView(ctx.author, get_page, page_count, current_page, timeout)
+        view.message = await ctx.send(embed=get_page(current_page), view=view)
+        return view.message
+
+
+class ClearFlags(commands.FlagConverter, prefix="--", delimiter=" "):
+    user: Optional[discord.User] = None
+    bots: bool = False
+    contains: Optional[str] = None
+
+
+class CancelPurgeView(discord.ui.View):
+    def __init__(self, author, job: PurgeJob):
+        super().__init__(timeout=None)
+        self.author = author
+        self.job = job
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user == self.author or interaction.permissions.manage_messages
+
+    @discord.ui.button(label="Cancel", style=discord.ButtonStyle.red)
+    async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        self.job.cancel()
+        self.stop()
+        embed = discord.Embed(title="Clear", description='Cancelling...', colour=discord.Color.red())
+        await interaction.response.edit_message(embed=embed, view=None)
+
 
 class Help(commands.Cog, name="help"):
     def __init__(self, bot) -> None:
         self.bot = bot
+        self._pages = []
+        self._pages_key = None
+        self.purges = {}
 
-    @commands.command(name="help", description="List all commands.")
-    async def help_command(self, context: Context) -> None:
+    def help_pages(self) -> list:
+        """
+        The help embeds, built once and rebuilt only when the loaded cogs change (an extension was
+        loaded, unloaded or reloaded).
+        """
+        key = tuple(id(cog) for cog in self.bot.cogs.values())
+        if key != self._pages_key:
+            self._pages = self.build_help_pages()
+            self._pages_key = key
+        return self._pages
+
+    def build_help_pages(self) -> list:
         pages = []
         for cog_name in self.bot.cogs:
             cog = self.bot.get_cog(cog_name)
-            commands_list = cog.get_commands()
+            commands_list = [command for command in cog.get_commands() if not command.hidden]
             if not commands_list:
                 continue
             embed = discord.Embed(
@@ -53,51 +124,98 @@ class Help(commands.Cog, name="help"):
                 color=0x00FF00,
             )
             for command in commands_list:
-                if command.hidden:
-                    continue
                 embed.add_field(
                     name=f"`${command.name}`",
                     value=command.description or "No description",
                     inline=False,
                 )
             pages.append(embed)
+        return pages
 
+    @commands.command(name="help", description="List all commands.")
+    async def help_command(self, context: Context) -> None:
+        pages = self.help_pages()
         paginator = Paginator(self.bot)
-        await paginator.paginate(context, pages)
+        await paginator.paginate(context, pages.__getitem__, len(pages))
 
-    @commands.command(name="clear", description="clears the chat")
-    async def clear(self,ctx, *, n: int):
+    @commands.command(name="prefix", description="Show or change the command prefix of this server.")
+    @commands.guild_only()
+    async def prefix(self, context: Context, new_prefix: Optional[str] = None) -> None:
+        prefixes = self.bot.prefixes
+        if new_prefix is None:
+            embed = discord.Embed(
+                title="Prefix", description=f"The prefix here is `{prefixes.get(context.guild.id)}`.", colour=discord.Color.green())
+            return await context.send(embed=embed)
+        if not context.author.guild_permissions.manage_guild:
+            raise commands.MissingPermissions(["manage_guild"])
         try:
-            if n < 10001:
-                count = n//100
-                rem = n % 100
-                for i in range(count):
-                    messages = []
-                    async for message in ctx.channel.history(limit=100):
-                        messages.append(message)
-                    await ctx.channel.delete_messages(messages)
-                    await asyncio.sleep(1.2)
-                messages = []
-                async for message in ctx.channel.history(limit=(rem+1)):
-                    messages.append(message)
-                await ctx.channel.delete_messages(messages)
-                k = str(ctx.message.author)+' deleted '+str(n)+' messages.'
-                async with ctx.typing():
-                    embed = discord.Embed(
-                        title="Clear", description=k, colour=discord.Color.green())
-                m = await ctx.send(embed=embed)
-                await asyncio.sleep(3)
-                await ctx.channel.delete_messages([m])
-            else:
-                async with ctx.typing():
-                    embed = discord.Embed(
-                        title="Error", description='Cannot clear more than 10,000 msgs at once.', colour=discord.Color.red())
-                await ctx.send(embed=embed)
-        except:
-            async with ctx.typing():
+            await prefixes.set(context.guild.id, None if new_prefix == "reset" else new_prefix)
+        except ValueError as e:
+            embed = discord.Embed(title="Error", description=str(e), colour=discord.Color.red())
+            return await context.send(embed=embed)
+        embed = discord.Embed(
+            title="Prefix", description=f"The prefix here is now `{prefixes.get(context.guild.id)}`.", colour=discord.Color.green())
+        await context.send(embed=embed)
+
+    @commands.command(name="clear", description="clears the chat")
+    async def clear(self, ctx, n: int, *, flags: ClearFlags):
+        if n > MAX_CLEAR:
+            embed = discord.Embed(
+                title="Error", description='Cannot clear more than 10,000 msgs at once.', colour=discord.Color.red())
+            return await ctx.send(embed=embed)
+        if ctx.channel.id in self.purges:
+            embed = discord.Embed(
+                title="Error", description='A clear is already running in this channel.', colour=discord.Color.red())
+            return await ctx.send(embed=embed)
+
+        checks = []
+        if flags.user is not None:
+            checks.append(lambda message: message.author.id == flags.user.id)
+        if flags.bots:
+            checks.append(lambda message: message.author.bot)
+        if flags.contains:
+            text = flags.contains.lower()
+            checks.append(lambda message: text in message.content.lower())
+        check = (lambda message: all(c(message) for c in checks)) if checks else None
+
+        last_update = 0.0
+
+        async def on_progress(job: PurgeJob) -> None:
+            nonlocal last_update
+            now = asyncio.get_running_loop().time()
+            if now - last_update >= 2:
+                last_update = now
                 embed = discord.Embed(
-                    title="Error", description='Permission Error.', colour=discord.Color.red())
-            await ctx.send(embed=embed)
+                    title="Clear", description=f'Deleted {job.deleted} messages so far...', colour=discord.Color.green())
+                await progress.edit(embed=embed)
+
+        job = PurgeJob(ctx.channel, n, check=check, before=ctx.message, include=[ctx.message], on_progress=on_progress)
+        view = CancelPurgeView(ctx.author, job)
+        progress = await ctx.send(
+            embed=discord.Embed(title="Clear", description='Deleting messages...', colour=discord.Color.green()),
+            view=view,
+        )
+        self.purges[ctx.channel.id] = job
+        try:
+            await job.run()
+        except discord.Forbidden:
+            embed = discord.Embed(
+                title="Error", description='Permission Error.', colour=discord.Color.red())
+            return await progress.edit(embed=embed, view=None)
+        except discord.HTTPException as e:
+            self.bot.logger.warning(f"Clear in channel {ctx.channel.id} failed: {e}")
+            embed = discord.Embed(
+                title="Error", description=f'Could not delete messages: {e.text or e.status}', colour=discord.Color.red())
+            return await progress.edit(embed=embed, view=None)
+        finally:
+            view.stop()
+            self.purges.pop(ctx.channel.id, None)
+        k = str(ctx.message.author)+' deleted '+str(job.deleted)+' messages.'
+        if job.cancelled:
+            k += ' (cancelled)'
+        embed = discord.Embed(
+            title="Clear", description=k, colour=discord.Color.green())
+        await progress.edit(embed=embed, view=None, delete_after=3)
 
 
 async def setup(bot) -> None:
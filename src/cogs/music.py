@@ -1,46 +1,29 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.ext.commands import Context
 from discord.utils import get
-import yt_dlp
-import random
 import asyncio
-from collections import deque
-import aiohttp
 from dotenv import load_dotenv
 import os
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
-import re
+import time
 
 from cogs.help import Paginator
+from utils.admission import INTERACTIVE, PRIORITY_NAMES, AdmissionController, AdmissionRejected
+from utils.audio import AUDIO_MODES, open_source, set_volume
+from utils.audio_cache import AudioCache
+from utils.cache import ResolverCache
+from utils.output import OutputScheduler
+from utils.player import PlayerManager, restorable
+from utils.prefetch import Prefetcher
+from utils.queue_resolver import QueueResolver
+from utils.reaper import SessionReaper
+from utils.resolver import ResolveError, TrackResolver
+from utils.spotify import SpotifyClient, SpotifyError, parse_spotify_url
+from utils.track import Track
+from utils.youtube import YouTubeSearch
 
 load_dotenv()
-CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
-CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
-client_credentials_manager = SpotifyClientCredentials(client_id=CLIENT_ID, client_secret=CLIENT_SECRET)
-sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager)
-
-
-def get_playlist_id(url):
-    pattern = r"playlist/([a-zA-Z0-9]+)"
-    match = re.search(pattern, url)
-    if match:
-        return match.group(1)
-    else:
-        return None
-
-def get_playlist_songs(playlist_id):
-    tracks_response = sp.playlist_tracks(playlist_id)
-    tracks = tracks_response["items"]
-    while tracks_response["next"]:
-        tracks_response = sp.next(tracks_response)
-        tracks.extend(tracks_response["items"])
-    songs = []
-    for i in tracks:
-        output_str = f"{i['track']['name']} by {i['track']['artists'][0]['name']}"
-        songs.append(output_str)
-    return songs
+
 
 def create_embed(title: str, description: str, color=discord.Color.green(), image=None, thumbnail=None) -> discord.Embed:
     embed = discord.Embed(title=title, description=description, color=color)
@@ -50,38 +33,209 @@ def create_embed(title: str, description: str, color=discord.Color.green(), imag
         embed.set_thumbnail(url=thumbnail)
     return embed
 
-def get_spotify_songs(url):
-    playlist_id = get_playlist_id(url)
-    if playlist_id:
-        songs = get_playlist_songs(playlist_id)
-        return songs
-    else:
-        return False
-
-async def ytbettersearch(query):
-    url = f"https://www.youtube.com/results?search_query={query}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            html = await resp.text()
-    index = html.find('watch?v')
-    url = ""
-    while True:
-        char = html[index]
-        if char == '"':
-            break
-        url += char
-        index += 1
-    url = f"https://www.youtube.com/{url}"
-    return url
+def render_queue_page(queue, index: int, per_page: int = 5, pending: int = 0) -> discord.Embed:
+    page_count = max(1, -(-len(queue) // per_page))
+    start = index * per_page
+    embed = discord.Embed(title="Queue", description="List of songs in the queue:", color=discord.Color.green())
+    for position, entry in enumerate(queue.page(start, start + per_page), start + 1):
+        song = entry.item
+        if isinstance(song, Track):
+            embed.add_field(name=f"{position}. {song.title}", value="",inline=False)
+        else:
+            embed.add_field(name=f"{position}. {song}", value="",inline=False)
+    footer = f"Page {index + 1}/{page_count} - {len(queue)} songs"
+    if pending:
+        footer += f" - looking up {pending} of them"
+    embed.set_footer(text=footer)
+    return embed
 
 class Music(commands.Cog, name="music"):
     def __init__(self, bot) -> None:
         self.bot = bot
-        self.song_queue = deque()
-        self.is_playing = False
-        self.player = None
-        self.current_song = None
-        self.on_loop = False
+        self.players = PlayerManager(store=bot.database)
+        resolver_config = bot.config.get("resolver", {})
+        cache_config = bot.config.get("cache", {})
+        self.cache = ResolverCache(
+            search_size=cache_config.get("search_size", 4096),
+            search_ttl=cache_config.get("search_ttl", 7 * 24 * 3600),
+            stream_size=cache_config.get("stream_size", 1024),
+            path=cache_config.get("path"),
+        )
+        self.cache.load()
+        search_config = bot.config.get("search", {})
+        self.youtube = YouTubeSearch(
+            bot.http_client,
+            max_results=search_config.get("max_results", 5),
+            max_duration=search_config.get("max_duration"),
+            allow_shorts=search_config.get("allow_shorts", False),
+        )
+        self.resolver = TrackResolver(
+            self.youtube.best_url,
+            workers=resolver_config.get("workers", 4),
+            timeout=resolver_config.get("timeout", 30.0),
+            cache=self.cache,
+            metrics=bot.metrics,
+        )
+        prefetch_config = bot.config.get("prefetch", {})
+        audio_config = bot.config.get("audio", {})
+        self.audio_mode = audio_config.get("mode", "opus")
+        if self.audio_mode not in AUDIO_MODES:
+            bot.logger.warning(f"Unknown audio mode '{self.audio_mode}', falling back to pcm")
+            self.audio_mode = "pcm"
+        self.queue_resolver = QueueResolver(self.resolver, concurrency=resolver_config.get("bulk_concurrency", 2))
+        self.prefetcher = Prefetcher(
+            self.resolver,
+            self.open_audio,
+            depth=prefetch_config.get("depth", 3),
+            lead=prefetch_config.get("lead", 3.0),
+            queue_resolver=self.queue_resolver,
+        )
+        self.spotify = SpotifyClient(
+            client_id=os.getenv("SPOTIFY_CLIENT_ID"),
+            client_secret=os.getenv("SPOTIFY_CLIENT_SECRET"),
+        )
+        audio_cache_config = bot.config.get("audio_cache", {})
+        self.audio_cache = None
+        if audio_cache_config.get("path"):
+            self.audio_cache = AudioCache(
+                audio_cache_config["path"],
+                max_bytes=audio_cache_config.get("max_bytes", 1024 ** 3),
+                hot_after=audio_cache_config.get("hot_after", 2),
+                workers=audio_cache_config.get("workers", 2),
+                logger=bot.logger,
+            )
+        admission_config = bot.config.get("admission", {})
+        self.admission = AdmissionController(
+            global_limit=admission_config.get("global_limit", 8),
+            guild_limit=admission_config.get("guild_limit", 2),
+            max_pending=admission_config.get("max_pending", 64),
+            guild_pending=admission_config.get("guild_pending", 5),
+            metrics=bot.metrics,
+        )
+        self.max_queue = admission_config.get("max_queue", 1000)
+        self.warmed = False
+        output_config = bot.config.get("output", {})
+        self.output = OutputScheduler(
+            window=output_config.get("window", 0.5),
+            min_interval=output_config.get("min_interval", 1.0),
+            metrics=bot.metrics,
+            logger=bot.logger,
+        )
+        voice_config = bot.config.get("voice", {})
+        self.reaper = SessionReaper(
+            self.players,
+            self.release,
+            idle_timeout=voice_config.get("idle_timeout", 300),
+            alone_timeout=voice_config.get("alone_timeout", 60),
+            logger=bot.logger,
+        )
+
+    async def cog_load(self) -> None:
+        self.bot.metrics.register_collector(self.collect_metrics)
+        self.reap_task.change_interval(seconds=self.bot.config.get("voice", {}).get("reap_interval", 15))
+        self.reap_task.start()
+        if self.audio_cache is not None:
+            await self.audio_cache.start()
+        if self.bot.database is not None:
+            self.bot.database.register_saver(self.players.save_all)
+            self.checkpoint_task.change_interval(seconds=self.bot.config.get("database", {}).get("checkpoint_interval", 30))
+            self.checkpoint_task.start()
+
+    async def cog_unload(self) -> None:
+        self.bot.metrics.unregister_collector(self.collect_metrics)
+        self.reap_task.cancel()
+        if self.bot.database is not None:
+            self.checkpoint_task.cancel()
+            self.players.save_all()
+            self.bot.database.unregister_saver(self.players.save_all)
+        self.output.close()
+        if self.audio_cache is not None:
+            await self.audio_cache.close()
+        self.resolver.close()
+        self.spotify.close()
+        self.cache.save()
+
+    def release(self, guild_id: int, forget: bool = True) -> None:
+        self.players.remove(guild_id, forget=forget)
+        self.output.forget(guild_id)
+
+    def playable(self, song: Track) -> Track:
+        if self.audio_cache is None:
+            return song
+        return self.audio_cache.playable(song)
+
+    def open_audio(self, song: Track, volume: float, start: float = 0.0) -> discord.AudioSource:
+        return open_source(self.playable(song), volume, self.audio_mode, start)
+
+    async def cog_before_invoke(self, context: Context) -> None:
+        if context.guild is not None:
+            await self.players.restore(context.guild.id)
+
+    async def cog_after_invoke(self, context: Context) -> None:
+        if context.guild is not None:
+            self.players.mark(context.guild.id)
+
+    @tasks.loop(seconds=30.0)
+    async def checkpoint_task(self) -> None:
+        # Playback position changes without any command, so playing guilds are saved periodically.
+        for player in self.players:
+            if player.is_active:
+                self.players.mark(player.guild_id)
+
+    @tasks.loop(seconds=15.0)
+    async def reap_task(self) -> None:
+        try:
+            await self.reaper.sweep(self.bot.voice_clients)
+        except Exception:
+            # An error must not stop the loop, or sessions would pile up from then on.
+            self.bot.logger.exception("Reaping voice sessions failed")
+
+    def collect_metrics(self, metrics) -> None:
+        reaper = self.reaper.stats()
+        metrics.set_gauge("music_players", len(self.players), documentation="Guilds with music state.")
+        metrics.set_gauge("voice_sessions", len(self.bot.voice_clients), documentation="Connected voice clients.")
+        metrics.set_gauge("ffmpeg_processes", reaper["ffmpeg_processes"], documentation="Running FFmpeg processes.")
+        for reason, count in reaper["reaped"].items():
+            metrics.set_counter("voice_sessions_reaped_total", count, {"reason": reason}, documentation="Music sessions ended because nobody was using them.")
+        metrics.set_counter("ffmpeg_orphans_killed_total", reaper["orphans_killed"], documentation="FFmpeg processes killed because nothing played them.")
+        admission = self.admission.stats()
+        metrics.set_gauge("admission_pending", admission["pending"], documentation="Music requests waiting for a resolution slot.")
+        metrics.set_gauge("admission_active", admission["active"], documentation="Music requests being resolved.")
+        for priority, waiting in self.resolver.stats()["waiting"].items():
+            metrics.set_gauge("resolver_waiting", waiting, {"priority": PRIORITY_NAMES[priority]}, documentation="Extractions waiting for a worker.")
+        metrics.set_gauge("music_queued_tracks", sum(len(player.queue) for player in self.players), documentation="Tracks in all guild queues.")
+        metrics.set_counter("queue_resolved_total", self.queue_resolver.resolved, documentation="Queued searches resolved in the background.")
+        metrics.set_counter("queue_resolve_failures_total", self.queue_resolver.failed, documentation="Queued searches that could not be resolved.")
+        for level, stats in self.cache.stats().items():
+            metrics.set_counter("cache_hits_total", stats["hits"], {"cache": level})
+            metrics.set_counter("cache_misses_total", stats["misses"], {"cache": level})
+            metrics.set_gauge("cache_entries", stats["size"], {"cache": level})
+        if self.audio_cache is not None:
+            stats = self.audio_cache.stats()
+            metrics.set_counter("cache_hits_total", stats["hits"], {"cache": "audio"})
+            metrics.set_counter("cache_misses_total", stats["misses"], {"cache": "audio"})
+            metrics.set_gauge("cache_entries", stats["files"], {"cache": "audio"})
+            metrics.set_gauge("audio_cache_bytes", stats["bytes"], documentation="Size of the cached audio files.")
+            metrics.set_gauge("audio_cache_downloads_in_progress", stats["downloading"], documentation="Tracks being cached.")
+            metrics.set_counter("audio_cache_downloads_total", stats["downloads"], documentation="Tracks written to the audio cache.")
+            metrics.set_counter("audio_cache_failures_total", stats["failures"], documentation="Failed audio cache downloads.")
+            metrics.set_counter("audio_cache_evictions_total", stats["evictions"], documentation="Tracks evicted from the audio cache.")
+
+    @commands.Cog.listener()
+    async def on_ready(self) -> None:
+        if self.warmed or not self.bot.config.get("startup", {}).get("prewarm", False):
+            return
+        self.warmed = True
+        start = time.perf_counter()
+        await asyncio.gather(self.resolver.warm(), self.spotify.warm(), return_exceptions=True)
+        self.bot.logger.info("Pre-warmed music dependencies in %.0fms", (time.perf_counter() - start) * 1000)
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState) -> None:
+        if member.id == self.bot.user.id and before.channel is not None and after.channel is None:
+            # Voice disconnects during shutdown keep the saved session so it can be restored.
+            self.release(member.guild.id, forget=not self.bot.is_closed())
+            self.reaper.forget(member.guild.id)
 
     @commands.command(name="join", description="Join the voice channel.")
     async def join(self, context: Context) -> None:
@@ -92,99 +246,157 @@ class Music(commands.Cog, name="music"):
 
     @commands.command(name="play", description="Play a song from YouTube.")
     async def play(self, context: Context, *, url: str) -> None:
-        voice = get(self.bot.voice_clients, guild=context.guild)
+        player = self.players.get(context.guild.id)
         try:
             await context.author.voice.channel.connect()
         except:
             pass
         voice = context.voice_client
+        if len(player.queue) >= self.max_queue:
+            return await context.send(embed=create_embed("Queue Full", f"The queue is limited to {self.max_queue} songs.", color=discord.Color.red()))
         if "spotify" in url:
-            songs = get_spotify_songs(url)
-            if not songs:
-                embed = discord.Embed(title="Error", description="Invalid Spotify Playlist URL.", color=discord.Color.red())
-                return await context.send(embed=embed)
-            for song in songs:
-                self.song_queue.append(song)
-            if voice.is_playing() or voice.is_paused():
-                embed = discord.Embed(title="Added to Queue", description=f"Added {len(songs)} songs to the queue.", color=discord.Color.green())
-                await context.send(embed=embed)
-            else:
-                await self.next(context)
-            return
-        url = await ytbettersearch(url)
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'quiet': True,
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            self.current_song = info
-            song = {
-                'url': info['url'],
-                'title': info['title'],
-                'thumbnail': info['thumbnail']
-            }
+            return await self.play_spotify(context, voice, url)
+        try:
+            async with self.admission.admit(context.guild.id):
+                song = await self.resolver.resolve(url)
+        except AdmissionRejected as e:
+            return await context.send(embed=create_embed("Busy", str(e), color=discord.Color.red()))
+        except ResolveError as e:
+            self.bot.logger.warning(str(e))
+            return await context.send(embed=create_embed("Error", "Could not load that song.", color=discord.Color.red()))
         
         if voice.is_playing() or voice.is_paused():
-            self.song_queue.appendleft(song)
-            embed = discord.Embed(title="Added to Queue", description=f"Added {song['title']} to the queue.", color=discord.Color.green())
-            await context.send(embed=embed)
+            player.queue.appendleft(song)
+            self.prefetcher.schedule(player)
+            self.output.added(context.channel, song.title)
         else:
             await self.play_audio(context, voice, song)
 
-    async def play_audio(self, context: Context, voice, song) -> None:
-        self.current_song = song
-        ffmpeg_options = {
-            'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
-            'options': '-vn'
-        }
-        self.player = discord.PCMVolumeTransformer(discord.FFmpegPCMAudio(song['url'], **ffmpeg_options))
-        voice.play(self.player, after=lambda e: asyncio.run_coroutine_threadsafe(self._on_song_end(context), self.bot.loop))
-        await context.send(embed=create_embed("Now Playing", f"Playing {song['title']}", thumbnail=song['thumbnail']))
-
-    async def _on_song_end(self,context):
-        if self.on_loop:
-            voice = get(self.bot.voice_clients, guild=context.guild)
-            await self.play_audio(context,voice,self.current_song)
+    async def play_spotify(self, context: Context, voice, url: str) -> None:
+        if parse_spotify_url(url) is None:
+            embed = discord.Embed(title="Error", description="Invalid Spotify URL.", color=discord.Color.red())
+            return await context.send(embed=embed)
+        player = self.players.get(context.guild.id)
+        message = None
+        added = 0
+        last_update = 0.0
+        truncated = False
+        # One track past the room left, to tell whether the playlist had to be cut short.
+        tracks = self.spotify.iter_tracks(url, limit=self.max_queue - len(player.queue) + 1)
+        try:
+            async for song in tracks:
+                if self.players.peek(context.guild.id) is not player:
+                    return
+                if len(player.queue) >= self.max_queue:
+                    truncated = True
+                    break
+                player.queue.append(song)
+                added += 1
+                if added == 1 and not (voice.is_playing() or voice.is_paused()):
+                    # Started on the side, so the rest of the playlist keeps coming in while the first
+                    # track is looked up.
+                    playback = asyncio.ensure_future(self.next(context))
+                    playback.add_done_callback(self._log_playback_error)
+                if time.monotonic() - last_update >= 2:
+                    last_update = time.monotonic()
+                    self.prefetcher.schedule(player)
+                    self.players.mark(context.guild.id)
+                    embed = discord.Embed(title="Adding to Queue", description=f"Added {added} songs to the queue so far...", color=discord.Color.green())
+                    if message is None:
+                        message = await context.send(embed=embed)
+                    else:
+                        await message.edit(embed=embed)
+        except SpotifyError as e:
+            self.bot.logger.warning(f"Spotify lookup of {url} failed: {e}")
+            if not added:
+                embed = discord.Embed(title="Error", description="Could not load that Spotify link.", color=discord.Color.red())
+                return await context.send(embed=embed)
+        finally:
+            await tracks.aclose()
+        self.prefetcher.schedule(player)
+        description = f"Added {added} songs to the queue."
+        if truncated:
+            description += f" The queue is limited to {self.max_queue} songs, so the rest were left out."
+        embed = discord.Embed(title="Added to Queue", description=description, color=discord.Color.green())
+        if message is None:
+            await context.send(embed=embed)
+        else:
+            await message.edit(embed=embed)
+
+    def _log_playback_error(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            self.bot.logger.error("Starting playback failed", exc_info=task.exception())
+
+    async def play_audio(self, context: Context, voice, song, source=None, start: float = 0.0) -> None:
+        player = self.players.get(context.guild.id)
+        player.current_song = song
+        player.source = source or self.open_audio(song, player.volume, start)
+        voice.play(player.source, after=lambda e: asyncio.run_coroutine_threadsafe(self._on_song_end(context, e), self.bot.loop))
+        if self.audio_cache is not None:
+            self.audio_cache.played(song, loop=player.on_loop)
+        self.prefetcher.schedule(player)
+        self.players.mark(context.guild.id)
+        self.output.now_playing(context.guild.id, context.channel, create_embed("Now Playing", f"Playing {song.title}", thumbnail=song.thumbnail))
+
+    async def _on_song_end(self,context, error=None):
+        if error is not None:
+            self.bot.logger.warning(f"Playback in guild {context.guild.id} failed: {error}")
+        player = self.players.peek(context.guild.id)
+        voice = get(self.bot.voice_clients, guild=context.guild)
+        if player is None or voice is None:
+            # Left voice while the song was playing; the reaper releases what is left.
+            return
+        if player.on_loop:
+            song = restorable(player.current_song)
+            if isinstance(song, str):
+                # The stream URL expired while the song was looping; look it up again.
+                try:
+                    song = (await self.resolver.resolve(song, INTERACTIVE))._replace(query=player.current_song.query)
+                except ResolveError as e:
+                    self.bot.logger.warning(str(e))
+                    player.on_loop = False
+                    await context.send(embed=create_embed("Error", "Could not reload the looped song, moving on.", color=discord.Color.red()))
+                    return await self.next(context)
+            await self.play_audio(context,voice,song)
         else:
             await self.next(context,check = True)
 
     @commands.command(name="next", description="Play the next song in the queue.")
     async def next(self, context: Context,check=False) -> None:
+        player = self.players.get(context.guild.id)
         voice = get(self.bot.voice_clients, guild=context.guild)
         if voice.is_playing() or voice.is_paused():
             voice.stop()
-            self.on_loop = False
+            player.on_loop = False
             if check:
                 return
-        if self.song_queue:
-            next_song = self.song_queue.popleft()
-            if isinstance(next_song, str):
-                next_song = await ytbettersearch(next_song)
-                ydl_opts = {
-                    'format': 'bestaudio/best',
-                    'quiet': True,
-                    'postprocessors': [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'mp3',
-                        'preferredquality': '192',
-                    }],
-                }
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(next_song, download=False)
-                    next_song = {
-                        'url': info['url'],
-                        'title': info['title'],
-                        'thumbnail': info['thumbnail']
-                }
-            await self.play_audio(context, voice, next_song)
+        if player.queue:
+            entry = player.queue.pop_entry(0)
+            next_song = restorable(entry.item)
+            source = None
+            start = 0.0
+            if player.resume_at is not None and player.resume_at[0] == entry.id:
+                start = player.resume_at[1]
+                player.resume_at = None
+            preopened = self.prefetcher.take(player, entry.id)
+            if preopened is not None and start:
+                preopened[1].cleanup()
+                preopened = None
+            if preopened is not None:
+                next_song, source = preopened
+            elif isinstance(next_song, str):
+                try:
+                    next_song = await self.resolver.resolve(next_song, INTERACTIVE)
+                except ResolveError as e:
+                    self.bot.logger.warning(str(e))
+                    await context.send(embed=create_embed("Error", "Could not load the next song, skipping it.", color=discord.Color.red()))
+                    return await self.next(context)
+            await self.play_audio(context, voice, next_song, source, start)
         else:
-            self.current_song = None
+            player.current_song = None
+            player.source = None
+            player.cancel_prefetch()
+            self.players.mark(context.guild.id)
             embed = discord.Embed(title="Queue Empty", description="There are no more songs in the queue.", color=discord.Color.red())
             await context.send(embed=embed)
 
@@ -208,8 +420,12 @@ class Music(commands.Cog, name="music"):
 
     @commands.command(name="stop", description="Stop the currently playing song and clears the queue.")
     async def stop(self, context: Context) -> None:
-        self.song_queue.clear()
-        self.current_song = None
+        player = self.players.get(context.guild.id)
+        player.queue.clear()
+        player.current_song = None
+        player.cancel_prefetch()
+        player.cancel_resolve()
+        player.drop_preopened()
         voice = get(self.bot.voice_clients, guild=context.guild)
         if (voice and voice.is_paused()) or (voice and voice.is_playing()):
             voice.stop()
@@ -218,77 +434,109 @@ class Music(commands.Cog, name="music"):
 
     @commands.command(name="volume", description="Set the volume of the music.")
     async def volume(self, context: Context, vol: float) -> None:
-        voice = context.voice_client
-        voice.source.volume = (vol / 100)
-        await context.send(embed=create_embed("Volume", f"Changed volume to {voice.source.volume * 100}%"))
+        player = self.players.get(context.guild.id)
+        player.volume = vol / 100
+        player.drop_preopened()
+        if player.source is not None and player.current_song is not None:
+            player.source = set_volume(context.voice_client, player.source, self.playable(player.current_song), player.volume)
+        self.prefetcher.schedule(player)
+        await context.send(embed=create_embed("Volume", f"Changed volume to {player.volume * 100}%"))
 
     @commands.command(name="now_playing", description="Show the currently playing song.")
     async def now_playing(self, context: Context) -> None:
-        if (not self.player) or (not self.current_song):
+        player = self.players.peek(context.guild.id)
+        if (not player) or (not player.source) or (not player.current_song):
             embed = discord.Embed(title="Error", description="There is no music playing right now.", color=discord.Color.red())
             return await context.send(embed=embed)
-        title = self.current_song["title"]
+        title = player.current_song.title
         embed = discord.Embed(title=f"Now Playing",description=f"{title}", color=discord.Color.green())
-        embed.set_thumbnail(url=self.current_song["thumbnail"])
+        embed.set_thumbnail(url=player.current_song.thumbnail)
         await context.send(embed=embed)
 
     @commands.command(name="leave", description="Leave the voice channel.")
     async def leave(self, context: Context) -> None:
         voice_client = context.message.guild.voice_client
-        if voice_client:
-            self.song_queue.clear()
-            self.is_playing = False
-            self.current_song = None
-            self.on_loop = False
+        if voice_client is None:
+            return await context.send(embed=create_embed("Error", "I am not connected to a voice channel.", color=discord.Color.red()))
+        self.release(context.guild.id)
+        self.reaper.forget(context.guild.id)
         await voice_client.disconnect()
 
     @commands.command(name="queue", description="Show the current queue.")
-    async def queue(self, context: Context) -> None:
-        if not self.song_queue:
+    async def queue(self, context: Context, page: int = 1) -> None:
+        player = self.players.peek(context.guild.id)
+        if not player or not player.queue:
             embed = discord.Embed(title="Queue", description="There are no songs in the queue.", color=discord.Color.red())
             return await context.send(embed=embed)
-        pages = []
-        for i in range(0, len(self.song_queue), 5):
-            embed = discord.Embed(title="Queue", description="List of songs in the queue:", color=discord.Color.green())
-            for j in range(i, i + 5):
-                if j >= len(self.song_queue):
-                    break
-                song = self.song_queue[j]
-                if isinstance(song, dict):
-                    embed.add_field(name=f"{j + 1}. {song['title']}", value="",inline=False)
-                else:
-                    embed.add_field(name=f"{j + 1}. {song}", value="",inline=False)
-            pages.append(embed)
+        queue = player.queue
+        page_count = max(1, -(-len(queue) // 5))
         paginator = Paginator(self.bot)
-        await paginator.paginate(context, pages)
+        await paginator.paginate(
+            context,
+            lambda index: render_queue_page(queue, index, pending=self.queue_resolver.pending(player)),
+            page_count,
+            start=page - 1,
+        )
     
     @commands.command(name="shuffle", description="Shuffle the queue.")
     async def shuffle(self, context: Context) -> None:
-        random.shuffle(self.song_queue)
+        player = self.players.get(context.guild.id)
+        player.queue.shuffle()
+        self.prefetcher.schedule(player)
         embed = discord.Embed(title="Queue Shuffled", description="The queue has been shuffled.", color=discord.Color.green())
         await context.send(embed=embed)
+
+    @commands.command(name="unshuffle", description="Restore the queue order from before it was shuffled.")
+    async def unshuffle(self, context: Context) -> None:
+        player = self.players.get(context.guild.id)
+        if not player.queue.unshuffle():
+            embed = discord.Embed(title="Error", description="The queue is not shuffled.", color=discord.Color.red())
+            return await context.send(embed=embed)
+        self.prefetcher.schedule(player)
+        embed = discord.Embed(title="Queue Unshuffled", description="The queue is back in its original order.", color=discord.Color.green())
+        await context.send(embed=embed)
+
+    @commands.command(name="move", description="Move a song to another position in the queue.")
+    async def move(self, context: Context, index: int, position: int) -> None:
+        player = self.players.get(context.guild.id)
+        if not (1 <= index <= len(player.queue)) or not (1 <= position <= len(player.queue)):
+            embed = discord.Embed(title="Error", description="Invalid index.", color=discord.Color.red())
+            return await context.send(embed=embed)
+        song = player.queue.move(index - 1, position - 1).item
+        self.prefetcher.schedule(player)
+        title = song.title if isinstance(song, Track) else song
+        embed = discord.Embed(title="Song Moved", description=f"Moved {title} to position {position}.", color=discord.Color.green())
+        await context.send(embed=embed)
     
     @commands.command(name="remove", description="Remove a song from the queue.")
     async def remove(self, context: Context, index: int) -> None:
-        if index < 1 or index > len(self.song_queue):
+        player = self.players.get(context.guild.id)
+        if index < 1 or index > len(player.queue):
             embed = discord.Embed(title="Error", description="Invalid index.", color=discord.Color.red())
             return await context.send(embed=embed)
-        song = self.song_queue[index - 1]
-        self.song_queue.remove(song)
-        embed = discord.Embed(title="Song Removed", description=f"Removed {song['title']} from the queue.", color=discord.Color.green())
+        song = player.queue.pop(index - 1)
+        self.prefetcher.schedule(player)
+        title = song.title if isinstance(song, Track) else song
+        embed = discord.Embed(title="Song Removed", description=f"Removed {title} from the queue.", color=discord.Color.green())
         await context.send(embed=embed)
 
     @commands.command(name="loop", description="Loop the current song.")
     async def loop(self, context: Context) -> None:
-        if not self.current_song:
+        player = self.players.peek(context.guild.id)
+        if not player or not player.current_song:
             embed = discord.Embed(title="Error", description="There is no song playing right now.", color=discord.Color.red())
             return await context.send(embed=embed)
-        self.on_loop = not self.on_loop
-        if self.on_loop:
+        player.on_loop = not player.on_loop
+        player.drop_preopened()
+        if player.on_loop and self.audio_cache is not None:
+            # Cache the song while its first round plays, so the repeats come from disk.
+            self.audio_cache.fetch(player.current_song)
+        self.prefetcher.schedule(player)
+        if player.on_loop:
             embed = discord.Embed(title="Loop", description="Looping the current song.", color=discord.Color.green())
         else:
             embed = discord.Embed(title="Loop", description="Stopped looping the current song.", color=discord.Color.red())
         await context.send(embed=embed)
 
 async def setup(bot) -> None:
-    await bot.add_cog(Music(bot))
+    await bot.add_cog(Music(bot))
\ No newline at end of file
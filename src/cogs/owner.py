@@ -0,0 +1,139 @@
+import discord
+from discord.ext import commands
+from discord.ext.commands import Context
+
+from utils.ipc import IPCError
+
+
+class Owner(commands.Cog, name="owner"):
+    def __init__(self, bot) -> None:
+        self.bot = bot
+
+    @commands.command(name="stats", description="Show bot metrics.", hidden=True)
+    @commands.is_owner()
+    async def stats(self, context: Context) -> None:
+        metrics = self.bot.metrics
+        metrics.collect()
+        embed = discord.Embed(title="Stats", color=0xBEBEFE)
+
+        lag = self.bot.loop_lag.snapshot()
+        embed.add_field(
+            name="Runtime",
+            value=(
+                f"Gateway latency: {self.bot.latency * 1000:.0f}ms\n"
+                f"Loop lag p50/p99/max: {lag['p50'] * 1000:.1f}/{lag['p99'] * 1000:.1f}/{lag['max'] * 1000:.1f}ms\n"
+                f"Guilds: {len(self.bot.guilds)}  Voice clients: {len(self.bot.voice_clients)}"
+            ),
+            inline=False,
+        )
+
+        players = metrics.series("music_players")
+        if players:
+            hits = {labels["cache"]: value for labels, value in metrics.series("cache_hits_total")}
+            misses = {labels["cache"]: value for labels, value in metrics.series("cache_misses_total")}
+            lines = [f"Players: {players[0][1]:.0f}  FFmpeg processes: {metrics.series('ffmpeg_processes')[0][1]:.0f}"]
+            reaped = {labels["reason"]: value for labels, value in metrics.series("voice_sessions_reaped_total")}
+            orphans = metrics.series("ffmpeg_orphans_killed_total")
+            lines.append(
+                "Reaped sessions: " + ", ".join(f"{reason} {count:.0f}" for reason, count in reaped.items())
+                + f"  Orphaned FFmpeg killed: {orphans[0][1] if orphans else 0:.0f}"
+            )
+            for labels, size in metrics.series("cache_entries"):
+                cache = labels["cache"]
+                lookups = hits.get(cache, 0) + misses.get(cache, 0)
+                rate = hits.get(cache, 0) / lookups * 100 if lookups else 0
+                lines.append(f"Cache {cache}: {size:.0f} entries, {rate:.0f}% hits")
+            embed.add_field(name="Music", value="\n".join(lines), inline=False)
+
+        busiest = sorted(metrics.series("command_duration_seconds"), key=lambda item: item[1].count, reverse=True)[:8]
+        if busiest:
+            embed.add_field(
+                name="Commands (count, p50, p99)",
+                value="\n".join(
+                    f"`{labels['command']}` ({labels['status']}): {histogram.count}, "
+                    f"{histogram.quantile(0.5) * 1000:.0f}ms, {histogram.quantile(0.99) * 1000:.0f}ms"
+                    for labels, histogram in busiest
+                ),
+                inline=False,
+            )
+
+        errors = {}
+        for labels, count in metrics.series("command_errors_total"):
+            errors[labels["error"]] = errors.get(labels["error"], 0) + count
+        if errors:
+            embed.add_field(
+                name="Errors",
+                value="\n".join(f"{error}: {count:.0f}" for error, count in sorted(errors.items(), key=lambda item: -item[1])[:8]),
+                inline=False,
+            )
+        await context.send(embed=embed)
+
+    @commands.command(name="cluster", description="Show every cluster's shards and load.", hidden=True)
+    @commands.is_owner()
+    async def cluster(self, context: Context) -> None:
+        if self.bot.ipc is None:
+            stats = self.bot.cluster_stats()
+            entries = [{"cluster_id": 0, "shard_ids": [], "restarts": 0, "result": stats}]
+            totals = stats
+        else:
+            try:
+                summary = await self.bot.ipc.request("stats")
+            except IPCError as e:
+                return await context.send(embed=discord.Embed(description=f"Cluster stats unavailable: {e}", color=0xE02B2B))
+            entries, totals = summary["clusters"], summary["totals"]
+        embed = discord.Embed(
+            title="Clusters",
+            description=(
+                f"Shards: {totals.get('shards', 0)}  Guilds: {totals.get('guilds', 0)}  "
+                f"Voice clients: {totals.get('voice_clients', 0)}  Players: {totals.get('players', 0)}"
+            ),
+            color=0xBEBEFE,
+        )
+        for entry in entries:
+            stats = entry.get("result")
+            if stats is None:
+                value = f"Down: {entry.get('error')} (restarts: {entry['restarts']})"
+            else:
+                latency = f"{stats['latency'] * 1000:.0f}ms" if stats["latency"] is not None else "n/a"
+                value = (
+                    f"Guilds: {stats['guilds']}  Voice: {stats['voice_clients']}  Players: {stats['players']}\n"
+                    f"Latency: {latency}  Loop lag p99: {stats['loop_lag_p99'] * 1000:.1f}ms  Restarts: {entry['restarts']}"
+                )
+            shards = entry["shard_ids"]
+            name = f"Cluster {entry['cluster_id']}" + (f" (shards {shards[0]}-{shards[-1]})" if shards else "")
+            embed.add_field(name=name, value=value, inline=False)
+        await context.send(embed=embed)
+
+    @commands.command(name="reload", description="Reload an extension on every cluster.", hidden=True)
+    @commands.is_owner()
+    async def reload(self, context: Context, extension: str) -> None:
+        if self.bot.ipc is None:
+            await self.bot.ipc_reload([extension])
+            return await context.send(embed=discord.Embed(description=f"Reloaded `{extension}`.", color=0xBEBEFE))
+        try:
+            entries = await self.bot.ipc.request("reload", [extension], timeout=30.0)
+        except IPCError as e:
+            return await context.send(embed=discord.Embed(description=f"Reload failed: {e}", color=0xE02B2B))
+        lines = [
+            f"Cluster {entry['cluster_id']}: " + ("reloaded" if "result" in entry else entry["error"])
+            for entry in entries
+        ]
+        await context.send(embed=discord.Embed(title=f"Reload `{extension}`", description="\n".join(lines), color=0xBEBEFE))
+
+    @commands.command(name="restart", description="Restart a cluster.", hidden=True)
+    @commands.is_owner()
+    async def restart(self, context: Context, cluster_id: int) -> None:
+        if self.bot.ipc is None:
+            return await context.send(embed=discord.Embed(description="Not running as a cluster.", color=0xE02B2B))
+        await context.send(embed=discord.Embed(description=f"Restarting cluster {cluster_id}.", color=0xBEBEFE))
+        try:
+            await self.bot.ipc.request("restart", cluster_id, timeout=30.0)
+        except IPCError as e:
+            if cluster_id == self.bot.cluster.cluster_id:
+                # This process is the one shutting down, so the reply never arrives.
+                return
+            await context.send(embed=discord.Embed(description=f"Restart failed: {e}", color=0xE02B2B))
+
+
+async def setup(bot) -> None:
+    await bot.add_cog(Owner(bot))
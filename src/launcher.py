@@ -0,0 +1,43 @@
+import asyncio
+import os
+import sys
+
+from dotenv import load_dotenv
+
+from bot import config, log_listener, logger
+from utils.cluster import Supervisor, recommended_shards
+from utils.http import HTTPClient
+
+# Runs the bot as a cluster of processes, see the "sharding" section of config.json.
+# to run : python src/launcher.py
+
+
+async def main() -> None:
+    sharding = config.get("sharding", {})
+    shard_count = sharding.get("shard_count")
+    if shard_count is None:
+        http_client = HTTPClient()
+        await http_client.start()
+        try:
+            shard_count = await recommended_shards(http_client, os.getenv("TOKEN"))
+        finally:
+            await http_client.close()
+    logger.info(f"Running {shard_count} shards in {sharding.get('clusters', 1)} clusters")
+    supervisor = Supervisor(
+        [sys.executable, os.path.join(os.path.realpath(os.path.dirname(__file__)), "bot.py")],
+        shard_count,
+        clusters=sharding.get("clusters", 1),
+        ipc_host=sharding.get("ipc_host", "127.0.0.1"),
+        ipc_port=sharding.get("ipc_port", 9200),
+        start_delay=sharding.get("start_delay", 5.0),
+        logger=logger,
+    )
+    await supervisor.run()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    try:
+        asyncio.run(main())
+    finally:
+        log_listener.stop()
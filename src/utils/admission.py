@@ -0,0 +1,169 @@
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from utils.metrics import Metrics
+
+# Lower runs first. Interactive work is what a user is waiting on right now (the next song after a
+# skip), normal work is a new request, bulk work is look-ahead nobody is waiting for yet.
+INTERACTIVE = 0
+NORMAL = 1
+BULK = 2
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", NORMAL: "normal", BULK: "bulk"}
+
+
+class PrioritySemaphore:
+    """
+    A semaphore that hands free slots to the waiter with the lowest priority number first, and to the
+    longest waiting one among equal priorities. A waiter that acquired with a ``key`` can be moved up
+    later with ``reprioritize``, for when more urgent work comes to depend on it.
+    """
+
+    def __init__(self, value: int) -> None:
+        self.value = value
+        self._waiters: List[list] = []
+        self._order = itertools.count()
+
+    def waiting(self) -> Dict[int, int]:
+        counts = dict.fromkeys(PRIORITY_NAMES, 0)
+        for priority, *_ in self._waiters:
+            counts[priority] = counts.get(priority, 0) + 1
+        return counts
+
+    async def acquire(self, priority: int = NORMAL, key: Optional[str] = None) -> None:
+        if self.value > 0 and not self._waiters:
+            self.value -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._order), future, key]
+        heapq.heappush(self._waiters, entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            else:
+                # The slot was handed over just before the cancellation; pass it on.
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            future = heapq.heappop(self._waiters)[2]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.value += 1
+
+    def reprioritize(self, key: str, priority: int) -> None:
+        """
+        Raises the waiters that acquired with ``key`` to ``priority`` if that is more urgent.
+        """
+        raised = False
+        for entry in self._waiters:
+            if entry[3] == key and priority < entry[0]:
+                entry[0] = priority
+                raised = True
+        if raised:
+            heapq.heapify(self._waiters)
+
+    @asynccontextmanager
+    async def hold(self, priority: int = NORMAL, key: Optional[str] = None) -> AsyncIterator[None]:
+        await self.acquire(priority, key)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class AdmissionRejected(Exception):
+    pass
+
+
+class AdmissionController:
+    """
+    Limits how much resolution work music commands start at once.
+
+    At most ``guild_limit`` requests per guild and ``global_limit`` in total are resolved at the same
+    time. Requests over those limits wait, but only ``max_pending`` of them in total and
+    ``guild_pending`` per guild; beyond that they are rejected straight away with
+    ``AdmissionRejected``, so a spamming guild cannot fill the queue for everyone. Interactive requests
+    are never rejected and go ahead of everything else that is waiting.
+    """
+
+    def __init__(
+        self,
+        global_limit: int = 8,
+        guild_limit: int = 2,
+        max_pending: int = 64,
+        guild_pending: int = 5,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        self.guild_limit = guild_limit
+        self.max_pending = max_pending
+        self.guild_pending = guild_pending
+        self.metrics = metrics
+        self.slots = PrioritySemaphore(global_limit)
+        self._guilds: Dict[int, asyncio.Semaphore] = {}
+        # guild id -> requests admitted and not finished, waiting or running
+        self._admitted: Dict[int, int] = {}
+        self.pending = 0
+        self.active = 0
+        self.rejected = {"global": 0, "guild": 0}
+
+    def _reject(self, scope: str, message: str) -> None:
+        self.rejected[scope] += 1
+        if self.metrics is not None:
+            self.metrics.inc(
+                "admission_rejections_total", {"scope": scope},
+                documentation="Music requests turned away because too many were waiting.",
+            )
+        raise AdmissionRejected(message)
+
+    @asynccontextmanager
+    async def admit(self, guild_id: int, priority: int = NORMAL) -> AsyncIterator[None]:
+        admitted = self._admitted.get(guild_id, 0)
+        if priority != INTERACTIVE:
+            if admitted >= self.guild_limit + self.guild_pending:
+                self._reject("guild", "This server already has too many songs being looked up, please wait a moment.")
+            if self.pending >= self.max_pending:
+                self._reject("global", "The bot is busy right now, please try again in a moment.")
+        semaphore = self._guilds.get(guild_id)
+        if semaphore is None:
+            semaphore = self._guilds[guild_id] = asyncio.Semaphore(self.guild_limit)
+        self._admitted[guild_id] = admitted + 1
+        self.pending += 1
+        holds_guild = running = False
+        try:
+            if priority != INTERACTIVE:
+                await semaphore.acquire()
+                holds_guild = True
+            await self.slots.acquire(priority)
+            self.pending -= 1
+            self.active += 1
+            running = True
+            yield
+        finally:
+            if running:
+                self.active -= 1
+                self.slots.release()
+            else:
+                self.pending -= 1
+            if holds_guild:
+                semaphore.release()
+            self._admitted[guild_id] -= 1
+            if not self._admitted[guild_id]:
+                del self._admitted[guild_id]
+                del self._guilds[guild_id]
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "active": self.active,
+            "guilds": len(self._admitted),
+            "rejected": dict(self.rejected),
+        }
@@ -0,0 +1,143 @@
+from typing import List, Set
+
+import discord
+
+from utils.track import Track
+
+FFMPEG_BEFORE_OPTIONS = '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
+
+# discord.py reads one 20ms frame per call to read().
+FRAME_LENGTH = 0.02
+
+AUDIO_MODES = ("opus", "pcm")
+
+# Every source open_source has spawned, until the reaper sees it released. Lets FFmpeg processes that
+# nothing plays any more be found and killed.
+_sources: Set[discord.AudioSource] = set()
+
+
+def _seek_options(url: str, start: float) -> str:
+    # The reconnect options only apply to HTTP inputs, not to files from the audio cache.
+    options = FFMPEG_BEFORE_OPTIONS if url.startswith(("http://", "https://")) else ""
+    if start > 0:
+        options = f"{options} -ss {start:.2f}".strip()
+    return options
+
+
+class TrackedSource(discord.PCMVolumeTransformer):
+    """
+    PCM source: FFmpeg decodes to raw PCM, volume is applied in Python and discord.py encodes every frame
+    with libopus. Also counts the frames read, so the playback position is known.
+    """
+
+    def __init__(self, original: discord.AudioSource, volume: float = 1.0, start: float = 0.0) -> None:
+        super().__init__(original, volume=volume)
+        self.frames = 0
+        self.start = start
+
+    @property
+    def position(self) -> float:
+        return self.start + self.frames * FRAME_LENGTH
+
+    def read(self) -> bytes:
+        self.frames += 1
+        return super().read()
+
+
+class TrackedOpusSource(discord.FFmpegOpusAudio):
+    """
+    Opus source: FFmpeg hands over ready-made Opus packets, so the player thread does no per-frame
+    decoding, scaling or encoding. When the stream already is Opus and the volume is 100% the audio is
+    passed through without being re-encoded at all. Otherwise FFmpeg applies the volume as a filter and
+    encodes, which means a volume change needs a new FFmpeg process (see ``reopen_source``).
+    """
+
+    def __init__(self, url: str, volume: float = 1.0, start: float = 0.0, codec=None, bitrate=None) -> None:
+        options = '-vn'
+        if volume != 1.0:
+            options += f' -filter:a volume={volume:.3f}'
+        super().__init__(
+            url,
+            bitrate=int(bitrate) if bitrate else None,
+            codec='copy' if codec == 'opus' and volume == 1.0 else None,
+            before_options=_seek_options(url, start),
+            options=options,
+        )
+        self.volume = volume
+        self.frames = 0
+        self.start = start
+
+    @property
+    def position(self) -> float:
+        return self.start + self.frames * FRAME_LENGTH
+
+    def read(self) -> bytes:
+        self.frames += 1
+        return super().read()
+
+
+def _process(source):
+    if isinstance(source, discord.PCMVolumeTransformer):
+        source = source.original
+    # cleanup() sets the process to discord.utils.MISSING, which is falsy.
+    return getattr(source, '_process', None) or None
+
+
+def ffmpeg_process(source):
+    """
+    Returns the FFmpeg subprocess behind a source, or None once it has exited or been cleaned up.
+    """
+    process = _process(source)
+    if process is None or process.poll() is not None:
+        return None
+    return process
+
+
+def is_released(source) -> bool:
+    """
+    Whether a source has been cleaned up, so it no longer holds a process or its pipes.
+    """
+    return _process(source) is None
+
+
+def open_sources() -> List[discord.AudioSource]:
+    return list(_sources)
+
+
+def forget_source(source) -> None:
+    _sources.discard(source)
+
+
+def open_source(song: Track, volume: float = 1.0, mode: str = "pcm", start: float = 0.0):
+    """
+    Spawns the FFmpeg process for a song. The process starts buffering right away, before the source is played.
+    """
+    if mode == "opus":
+        source = TrackedOpusSource(song.url, volume=volume, start=start, codec=song.codec, bitrate=song.bitrate)
+    else:
+        pcm = discord.FFmpegPCMAudio(song.url, before_options=_seek_options(song.url, start), options='-vn')
+        source = TrackedSource(pcm, volume=volume, start=start)
+    _sources.add(source)
+    return source
+
+
+def set_volume(voice: discord.VoiceClient, source, song: Track, volume: float):
+    """
+    Applies a new volume to the playing source and returns the source that is playing afterwards.
+
+    PCM sources are scaled in place. Opus sources are reopened at the current position with the new
+    volume filter and swapped into the player without triggering its ``after`` callback.
+    """
+    if isinstance(source, TrackedSource):
+        source.volume = volume
+        return source
+    if voice is None or voice.source is not source:
+        return source
+    paused = voice.is_paused()
+    replacement = open_source(song, volume, mode="opus", start=source.position)
+    # Swapping the source resumes the player, so restore the paused state afterwards.
+    voice.source = replacement
+    if paused:
+        voice.pause()
+    source.cleanup()
+    return replacement
@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import os
+import re
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set
+
+from utils.audio import FFMPEG_BEFORE_OPTIONS
+from utils.track import Track
+
+EXTENSION = ".ogg"
+PART_EXTENSION = ".part"
+
+# Only plain video ids become file names.
+KEY_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class AudioCache:
+    """
+    Size bounded disk cache of tracks that are played more than once, stored as Opus in Ogg.
+
+    A track is downloaded once it has been started ``hot_after`` times (across all guilds), or right
+    away when it is looped. Until the file is complete the track keeps streaming from YouTube as before;
+    the download runs in a separate FFmpeg process next to playback. Once cached, a track is played
+    from disk, and since the file already is Opus the opus audio mode sends it without re-encoding.
+
+    Files are evicted least recently played first when the cache holds more than ``max_bytes``. Lookups
+    only consult the in-memory index; the files of played tracks are touched in the background (to keep
+    the order across restarts) on the default executor, and a file found missing there, evicted by
+    another cluster sharing the directory, is dropped from the index. All other disk access (scanning,
+    moving finished downloads into place, removing partial and evicted files) runs on the default
+    executor too, so a slow disk never stalls the event loop.
+
+    Every download writes to its own ``<id>.<pid>.<n>.part`` file and is moved into place with
+    ``os.replace``, so a reader never sees a half written file, and two writers (in this process or in
+    another cluster sharing the directory) can at worst download the same track twice. Downloads of the
+    same track within one process are coalesced.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 1024 ** 3,
+        hot_after: int = 2,
+        workers: int = 2,
+        bitrate: int = 128,
+        ffmpeg: str = "ffmpeg",
+        logger: Optional[logging.Logger] = None,
+    ) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hot_after = hot_after
+        self.bitrate = bitrate
+        self.ffmpeg = ffmpeg
+        self.logger = logger or logging.getLogger("discord_bot")
+        # key -> file size, least recently played first
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._plays: "OrderedDict[str, int]" = OrderedDict()
+        self._downloads: Dict[str, asyncio.Task] = {}
+        self._touched: Set[str] = set()
+        self._touch_task: Optional[asyncio.Task] = None
+        # keys whose evicted file has not been removed yet; they are not downloaded again until it is
+        self._unlinking: Set[str] = set()
+        self._semaphore = asyncio.Semaphore(workers)
+        self._parts = 0
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.downloads = 0
+        self.failures = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(song: Track) -> Optional[str]:
+        if song.id is not None and KEY_PATTERN.match(song.id):
+            return song.id
+        return None
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + EXTENSION)
+
+    def _scan(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(PART_EXTENSION):
+                # Leftovers of a process that died mid download.
+                try:
+                    if not _pid_alive(int(entry.name.split(".")[-3])):
+                        os.unlink(entry.path)
+                except (ValueError, IndexError, OSError):
+                    pass
+            elif entry.name.endswith(EXTENSION):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[: -len(EXTENSION)], stat.st_size))
+        for _, key, size in sorted(files):
+            self._files[key] = size
+            self.size += size
+
+    async def start(self) -> None:
+        """
+        Indexes the files already on disk, oldest played first, and removes abandoned partial downloads.
+        """
+        await asyncio.get_running_loop().run_in_executor(None, self._scan)
+        await self._evict()
+
+    def lookup(self, song: Track) -> Optional[str]:
+        """
+        Returns the cached file for a song, or None if it has to be streamed.
+        """
+        key = self.key(song)
+        if key is None:
+            return None
+        if key not in self._files:
+            self.misses += 1
+            return None
+        self._files.move_to_end(key)
+        self.hits += 1
+        self._touched.add(key)
+        if self._touch_task is None or self._touch_task.done():
+            self._touch_task = asyncio.ensure_future(self._touch_files())
+        return self.path(key)
+
+    async def _touch_files(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._touched:
+            keys, self._touched = self._touched, set()
+            missing = await loop.run_in_executor(None, self._touch, keys)
+            for key in missing:
+                if key in self._files and key not in self._downloads:
+                    self.size -= self._files.pop(key)
+
+    def _touch(self, keys: Iterable[str]) -> List[str]:
+        missing = []
+        for key in keys:
+            try:
+                os.utime(self.path(key))
+            except FileNotFoundError:
+                missing.append(key)
+        return missing
+
+    def playable(self, song: Track) -> Track:
+        """
+        Returns the song to hand to FFmpeg: the cached copy if there is one, otherwise the song itself.
+        """
+        path = self.lookup(song)
+        if path is None:
+            return song
+        bitrate = song.bitrate if song.codec == "opus" else self.bitrate
+        return song._replace(url=path, codec="opus", bitrate=bitrate, expires_at=None)
+
+    def played(self, song: Track, loop: bool = False) -> None:
+        """
+        Counts a play of the song and starts caching it once it is hot or looped.
+        """
+        key = self.key(song)
+        if key is None or key in self._files:
+            return
+        plays = self._plays.pop(key, 0) + 1
+        self._plays[key] = plays
+        while len(self._plays) > 4096:
+            self._plays.popitem(last=False)
+        if loop or plays >= self.hot_after:
+            self.fetch(song)
+
+    def fetch(self, song: Track) -> Optional[asyncio.Task]:
+        key = self.key(song)
+        if key is None or key in self._files or key in self._unlinking:
+            return None
+        task = self._downloads.get(key)
+        if task is None:
+            task = self._downloads[key] = asyncio.ensure_future(self._download(key, song))
+            task.add_done_callback(lambda _: self._downloads.pop(key, None))
+        return task
+
+    def _command(self, song: Track, part: str) -> list:
+        if song.codec == "opus":
+            codec = ["-c:a", "copy"]
+        else:
+            codec = ["-c:a", "libopus", "-b:a", f"{self.bitrate}k"]
+        return [
+            self.ffmpeg, "-nostdin", "-loglevel", "error", *FFMPEG_BEFORE_OPTIONS.split(),
+            "-i", song.url, "-vn", "-map", "0:a:0", *codec, "-f", "ogg", part,
+        ]
+
+    @staticmethod
+    def _unlink(paths: Iterable[str]) -> None:
+        for path in paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _finish(self, part: str, key: str) -> int:
+        size = os.path.getsize(part)
+        os.replace(part, self.path(key))
+        return size
+
+    async def _download(self, key: str, song: Track) -> None:
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            if key in self._files:
+                return
+            self._parts += 1
+            part = os.path.join(self.directory, f"{key}.{os.getpid()}.{self._parts}{PART_EXTENSION}")
+            process = None
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *self._command(song, part),
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+                _, stderr = await process.communicate()
+                if process.returncode != 0:
+                    raise OSError(stderr.decode(errors="replace").strip() or f"exit code {process.returncode}")
+                size = await loop.run_in_executor(None, self._finish, part, key)
+            except (OSError, asyncio.CancelledError) as e:
+                if process is not None and process.returncode is None:
+                    process.kill()
+                    await process.wait()
+                await loop.run_in_executor(None, self._unlink, [part])
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                self.failures += 1
+                self.logger.warning(f"Caching '{song.title}' failed: {e}")
+                return
+        self.downloads += 1
+        self.size += size - self._files.pop(key, 0)
+        self._files[key] = size
+        self._plays.pop(key, None)
+        await self._evict()
+
+    async def _evict(self) -> None:
+        keys = []
+        while self.size > self.max_bytes and self._files:
+            key, size = self._files.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            keys.append(key)
+        if not keys:
+            return
+        self._unlinking.update(keys)
+        try:
+            # A file that is playing stays readable until FFmpeg closes it.
+            await asyncio.get_running_loop().run_in_executor(None, self._unlink, [self.path(key) for key in keys])
+        finally:
+            self._unlinking.difference_update(keys)
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self._files),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "downloads": self.downloads,
+            "downloading": len(self._downloads),
+            "failures": self.failures,
+            "evictions": self.evictions,
+        }
+
+    async def close(self) -> None:
+        """
+        Cancels running downloads; their partial files are removed. Waits for pending touches.
+        """
+        tasks = list(self._downloads.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._touch_task is not None:
+            await self._touch_task
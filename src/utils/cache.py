@@ -0,0 +1,147 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from utils.track import STREAM_EXPIRY_MARGIN, Track
+
+
+class TTLCache:
+    """
+    A size bounded LRU cache whose entries also expire after a time to live.
+
+    ``get_or_fetch`` coalesces concurrent lookups of the same key into a single fetch.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, expires_at: Optional[float] = None) -> None:
+        if expires_at is None:
+            expires_at = time.time() + self.ttl
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        expires: Optional[Callable[[Any], Optional[float]]] = None,
+    ) -> Any:
+        value = self.get(key)
+        if value is not None:
+            return value
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._fetch(key, fetch, expires))
+            self._pending[key] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shielded so that one cancelled caller does not cancel the fetch the others are waiting on.
+        return await asyncio.shield(pending)
+
+    async def _fetch(self, key: str, fetch, expires) -> Any:
+        value = await fetch()
+        self.set(key, value, expires(value) if expires else None)
+        return value
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def dump(self) -> list:
+        now = time.time()
+        return [[key, expires_at, value] for key, (expires_at, value) in self._data.items() if expires_at > now]
+
+    def load(self, entries: list) -> None:
+        now = time.time()
+        for key, expires_at, value in entries:
+            if expires_at > now:
+                self.set(key, value, expires_at)
+
+
+class ResolverCache:
+    """
+    Two level cache used by the resolver: search query to video URL, and video URL to ``Track``.
+    Can optionally be persisted to a JSON file so it survives restarts.
+    """
+
+    def __init__(
+        self,
+        search_size: int = 4096,
+        search_ttl: float = 7 * 24 * 3600.0,
+        stream_size: int = 1024,
+        stream_ttl: float = 3600.0,
+        path: Optional[str] = None,
+    ) -> None:
+        self.searches = TTLCache(search_size, search_ttl)
+        self.streams = TTLCache(stream_size, stream_ttl)
+        self.path = path
+
+    @staticmethod
+    def stream_expires_at(track: Track) -> Optional[float]:
+        if track.expires_at is None:
+            return None
+        return track.expires_at - STREAM_EXPIRY_MARGIN
+
+    def stats(self) -> dict:
+        return {"searches": self.searches.stats(), "streams": self.streams.stats()}
+
+    def load(self) -> None:
+        if not self.path or not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        self.searches.load(data.get("searches", []))
+        self.streams.load([[key, expires_at, Track.from_dict(value)] for key, expires_at, value in data.get("streams", [])])
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        streams = [[key, expires_at, track.to_dict()] for key, expires_at, track in self.streams.dump()]
+        data = {"searches": self.searches.dump(), "streams": streams}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(tmp_path, self.path)
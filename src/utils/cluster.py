@@ -0,0 +1,288 @@
+import asyncio
+import copy
+import logging
+import os
+import secrets
+import signal
+import time
+from typing import Dict, List, Mapping, NamedTuple, Optional, Sequence
+
+from utils.ipc import IPCConnection, IPCError, IPCServer
+
+GATEWAY_BOT_URL = "https://discord.com/api/v10/gateway/bot"
+
+
+class ClusterConfig(NamedTuple):
+    """
+    What a cluster process needs to know about its place in the cluster. The supervisor passes it to
+    each process through environment variables.
+    """
+
+    cluster_id: int
+    shard_ids: List[int]
+    shard_count: int
+    ipc_host: str
+    ipc_port: int
+    ipc_secret: str
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> Optional["ClusterConfig"]:
+        if "CLUSTER_ID" not in environ:
+            return None
+        return cls(
+            cluster_id=int(environ["CLUSTER_ID"]),
+            shard_ids=[int(shard_id) for shard_id in environ["CLUSTER_SHARDS"].split(",")],
+            shard_count=int(environ["SHARD_COUNT"]),
+            ipc_host=environ["IPC_HOST"],
+            ipc_port=int(environ["IPC_PORT"]),
+            ipc_secret=environ["IPC_SECRET"],
+        )
+
+    def to_env(self) -> Dict[str, str]:
+        return {
+            "CLUSTER_ID": str(self.cluster_id),
+            "CLUSTER_SHARDS": ",".join(str(shard_id) for shard_id in self.shard_ids),
+            "SHARD_COUNT": str(self.shard_count),
+            "IPC_HOST": self.ipc_host,
+            "IPC_PORT": str(self.ipc_port),
+            "IPC_SECRET": self.ipc_secret,
+        }
+
+    def configure(self, config: dict) -> dict:
+        """
+        Returns a copy of the bot config for this cluster: every cluster logs to its own file and
+        serves metrics on its own port.
+        """
+        config = copy.deepcopy(config)
+        log_config = config.setdefault("logging", {})
+        root, extension = os.path.splitext(log_config.get("file", "discord.log"))
+        log_config["file"] = f"{root}-{self.cluster_id}{extension}"
+        metrics_config = config.setdefault("metrics", {})
+        metrics_config["port"] = metrics_config.get("port", 9100) + self.cluster_id
+        return config
+
+
+def plan_clusters(shard_count: int, clusters: int) -> List[List[int]]:
+    """
+    Splits shards into ``clusters`` contiguous groups of near equal size.
+    """
+    clusters = max(1, min(clusters, shard_count))
+    size, extra = divmod(shard_count, clusters)
+    plan, start = [], 0
+    for cluster_id in range(clusters):
+        end = start + size + (1 if cluster_id < extra else 0)
+        plan.append(list(range(start, end)))
+        start = end
+    return plan
+
+
+async def recommended_shards(http_client, token: str) -> int:
+    """
+    Asks Discord how many shards the bot should run.
+    """
+    async with http_client.request("GET", GATEWAY_BOT_URL, headers={"Authorization": f"Bot {token}"}) as response:
+        response.raise_for_status()
+        return (await response.json())["shards"]
+
+
+class ClusterProcess:
+    def __init__(self, config: ClusterConfig) -> None:
+        self.config = config
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.connection: Optional[IPCConnection] = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.restart_requested = False
+
+    @property
+    def cluster_id(self) -> int:
+        return self.config.cluster_id
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    def info(self) -> dict:
+        return {
+            "cluster_id": self.cluster_id,
+            "shard_ids": self.config.shard_ids,
+            "pid": self.process.pid if self.running else None,
+            "uptime": time.monotonic() - self.started_at if self.running else 0.0,
+            "restarts": self.restarts,
+            "connected": self.connection is not None and not self.connection.closed.is_set(),
+        }
+
+
+class Supervisor:
+    """
+    Runs the bot as several processes, each one an AutoShardedBot over a contiguous group of shards.
+
+    Cluster processes are started ``start_delay`` seconds apart so their shards do not all identify at
+    once. A cluster that exits is started again. The delay before a restart doubles up to
+    ``max_backoff`` while it keeps crashing, and goes back to the minimum once it has stayed up for
+    ``stable_after`` seconds.
+
+    Clusters connect back over the IPC channel. The supervisor relays owner commands (``stats``,
+    ``reload``, ``restart``) from any cluster to all of them.
+    """
+
+    def __init__(
+        self,
+        command: Sequence[str],
+        shard_count: int,
+        clusters: int,
+        ipc_host: str = "127.0.0.1",
+        ipc_port: int = 0,
+        start_delay: float = 5.0,
+        min_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        stable_after: float = 60.0,
+        shutdown_timeout: float = 15.0,
+        env: Optional[Mapping[str, str]] = None,
+        logger: Optional[logging.Logger] = None,
+    ) -> None:
+        self.command = list(command)
+        self.shard_count = shard_count
+        self.start_delay = start_delay
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.shutdown_timeout = shutdown_timeout
+        self.env = dict(os.environ if env is None else env)
+        self.logger = logger or logging.getLogger("discord_bot")
+        self.secret = secrets.token_hex(16)
+        self.ipc = IPCServer(
+            ipc_host, ipc_port, self.secret,
+            handlers={"stats": self.stats, "reload": self.reload, "restart": self.restart},
+            on_connect=self._on_connect,
+            logger=self.logger,
+        )
+        self.clusters = [
+            ClusterProcess(ClusterConfig(cluster_id, shard_ids, shard_count, ipc_host, ipc_port, self.secret))
+            for cluster_id, shard_ids in enumerate(plan_clusters(shard_count, clusters))
+        ]
+        self.closing = False
+        self._watchers: List[asyncio.Task] = []
+        self._stopped = asyncio.Event()
+
+    async def start(self) -> None:
+        await self.ipc.start()
+        for cluster in self.clusters:
+            cluster.config = cluster.config._replace(ipc_port=self.ipc.port)
+        for index, cluster in enumerate(self.clusters):
+            if index:
+                await asyncio.sleep(self.start_delay)
+            await self._spawn(cluster)
+            self._watchers.append(asyncio.ensure_future(self._watch(cluster)))
+
+    async def _spawn(self, cluster: ClusterProcess) -> None:
+        cluster.connection = None
+        # A new session keeps a Ctrl+C in the terminal from reaching the clusters directly; the supervisor
+        # forwards it to each one during close.
+        cluster.process = await asyncio.create_subprocess_exec(
+            *self.command, env={**self.env, **cluster.config.to_env()}, start_new_session=True
+        )
+        cluster.started_at = time.monotonic()
+        self.logger.info(
+            f"Started cluster {cluster.cluster_id} (PID {cluster.process.pid}) with shards {cluster.config.shard_ids}"
+        )
+
+    async def _watch(self, cluster: ClusterProcess) -> None:
+        backoff = self.min_backoff
+        while True:
+            returncode = await cluster.process.wait()
+            if self.closing:
+                return
+            if cluster.restart_requested:
+                cluster.restart_requested = False
+                delay = 0.0
+            else:
+                if time.monotonic() - cluster.started_at >= self.stable_after:
+                    backoff = self.min_backoff
+                delay = backoff
+                backoff = min(backoff * 2, self.max_backoff)
+                self.logger.error(
+                    f"Cluster {cluster.cluster_id} exited with code {returncode}, restarting in {delay:.0f}s"
+                )
+            await asyncio.sleep(delay)
+            if self.closing:
+                return
+            cluster.restarts += 1
+            await self._spawn(cluster)
+
+    def _on_connect(self, cluster_id: int, connection: IPCConnection) -> None:
+        if 0 <= cluster_id < len(self.clusters):
+            self.clusters[cluster_id].connection = connection
+            self.logger.info(f"Cluster {cluster_id} connected")
+
+    async def broadcast(self, op: str, data: object = None, timeout: float = 10.0) -> List[dict]:
+        """
+        Sends a request to every cluster and returns one entry per cluster, with either its ``result``
+        or the ``error`` it failed with.
+        """
+
+        async def ask(cluster: ClusterProcess) -> dict:
+            entry = cluster.info()
+            if not entry["connected"]:
+                entry["error"] = "not connected"
+                return entry
+            try:
+                entry["result"] = await cluster.connection.request(op, data, timeout)
+            except IPCError as e:
+                entry["error"] = str(e)
+            return entry
+
+        return list(await asyncio.gather(*(ask(cluster) for cluster in self.clusters)))
+
+    async def stats(self, data: object = None) -> dict:
+        entries = await self.broadcast("stats")
+        totals: Dict[str, float] = {}
+        for entry in entries:
+            for key, value in (entry.get("result") or {}).items():
+                if isinstance(value, int) and not isinstance(value, bool) and key != "cluster_id":
+                    totals[key] = totals.get(key, 0) + value
+        return {"shard_count": self.shard_count, "clusters": entries, "totals": totals}
+
+    async def reload(self, data: object = None) -> List[dict]:
+        return await self.broadcast("reload", data)
+
+    async def restart(self, data: object = None) -> dict:
+        cluster_id = int(data)
+        if not 0 <= cluster_id < len(self.clusters):
+            raise ValueError(f"No cluster {cluster_id}")
+        cluster = self.clusters[cluster_id]
+        if not cluster.running:
+            raise ValueError(f"Cluster {cluster_id} is not running")
+        cluster.restart_requested = True
+        await self._terminate(cluster)
+        return cluster.info()
+
+    async def _terminate(self, cluster: ClusterProcess) -> None:
+        # SIGINT lets Client.run shut down cleanly, which saves caches and flushes logs.
+        if not cluster.running:
+            return
+        cluster.process.send_signal(signal.SIGINT)
+        try:
+            await asyncio.wait_for(cluster.process.wait(), self.shutdown_timeout)
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Cluster {cluster.cluster_id} did not shut down in time, killing it")
+            cluster.process.kill()
+            await cluster.process.wait()
+
+    async def close(self) -> None:
+        self.closing = True
+        for watcher in self._watchers:
+            watcher.cancel()
+        await asyncio.gather(*(self._terminate(cluster) for cluster in self.clusters))
+        await self.ipc.stop()
+        self._stopped.set()
+
+    async def run(self) -> None:
+        """
+        Starts the clusters and supervises them until SIGINT or SIGTERM.
+        """
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, lambda: asyncio.ensure_future(self.close()))
+        await self.start()
+        await self._stopped.wait()
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Deque, Optional, Set, Tuple
+
+import aiohttp
+
+FACTS_URL = "https://uselessfacts.jsph.pl/random.json?language=en"
+
+
+class CircuitBreaker:
+    """
+    Stops calls to an upstream that keeps failing.
+
+    After ``failure_threshold`` failures in a row the breaker opens and no calls are made for
+    ``reset_timeout`` seconds. Then it lets a single trial call through (half open): a success closes it
+    again, a failure opens it for twice as long, up to ``max_timeout``.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, max_timeout: float = 600.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_timeout = max_timeout
+        self.failures = 0
+        self.timeout = reset_timeout
+        self.opened_at = 0.0
+        self.trial = False
+        self.opens = 0
+
+    @property
+    def state(self) -> str:
+        if self.failures < self.failure_threshold:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at < self.timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    @property
+    def retry_in(self) -> float:
+        """
+        Seconds until the next call is allowed.
+        """
+        if self.state != self.OPEN:
+            return 0.0
+        return self.opened_at + self.timeout - time.monotonic()
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self.trial:
+            self.trial = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.timeout = self.reset_timeout
+        self.trial = False
+
+    def record_failure(self) -> None:
+        trial, self.trial = self.trial, False
+        if trial:
+            self.timeout = min(self.timeout * 2, self.max_timeout)
+        self.failures += 1
+        # Calls that were already in flight when the breaker opened do not extend the timeout.
+        if trial or self.failures == self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self.opens += 1
+
+
+class FactPool:
+    """
+    In-memory pool of random facts that commands take from without waiting on the API.
+
+    A background task keeps between ``low`` and ``high`` facts in the pool: once a command takes the
+    pool below ``low`` it is refilled up to ``high``, ``concurrency`` requests at a time. Facts that were
+    already pooled or served among the last ``recent`` facts are dropped, as the API repeats itself.
+
+    Requests go through a circuit breaker. While the API is down the pool is not refilled, and once it
+    runs dry commands get a fact they may have seen recently instead of an error.
+    """
+
+    def __init__(
+        self,
+        http_client,
+        url: str = FACTS_URL,
+        low: int = 5,
+        high: int = 20,
+        concurrency: int = 4,
+        recent: int = 500,
+        wait: float = 5.0,
+        breaker: Optional[CircuitBreaker] = None,
+        logger: Optional[logging.Logger] = None,
+    ) -> None:
+        self.http_client = http_client
+        self.url = url
+        self.low = low
+        self.high = max(high, low + 1)
+        self.concurrency = concurrency
+        self.wait = wait
+        self.breaker = breaker or CircuitBreaker()
+        self.logger = logger or logging.getLogger("discord_bot")
+        self._facts: Deque[Tuple[str, str]] = deque()
+        # Ids of the facts pooled or served lately, oldest first.
+        self._recent: Deque[str] = deque()
+        self._recent_ids: Set[str] = set()
+        self._recent_limit = recent
+        self._served: Deque[str] = deque(maxlen=recent)
+        self._wanted = asyncio.Event()
+        self._available = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.fetched = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.served = {"pool": 0, "stale": 0, "none": 0}
+
+    def __len__(self) -> int:
+        return len(self._facts)
+
+    def start(self) -> None:
+        self._wanted.set()
+        self._task = asyncio.ensure_future(self._refill_loop())
+
+    def _remember(self, fact_id: str) -> None:
+        self._recent.append(fact_id)
+        self._recent_ids.add(fact_id)
+        while len(self._recent) > self._recent_limit:
+            self._recent_ids.discard(self._recent.popleft())
+
+    async def _fetch(self) -> None:
+        try:
+            async with self.http_client.get(self.url) as response:
+                response.raise_for_status()
+                data = await response.json()
+            text = data["text"]
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError, TypeError) as e:
+            self.errors += 1
+            self.breaker.record_failure()
+            self.logger.debug(f"Fetching a random fact failed: {e!r}")
+            return
+        self.breaker.record_success()
+        self.fetched += 1
+        fact_id = str(data.get("id") or text)
+        if fact_id in self._recent_ids:
+            self.duplicates += 1
+            return
+        self._remember(fact_id)
+        self._facts.append((fact_id, text))
+        self._available.set()
+
+    async def _refill_loop(self) -> None:
+        while True:
+            await self._wanted.wait()
+            try:
+                await self._refill()
+            except Exception:
+                # Anything _fetch does not expect (a closed session, say) must not end the task, or the
+                # pool would never be refilled again. It counts as a failed request, so the breaker
+                # backs off if it keeps happening.
+                self.errors += 1
+                self.breaker.record_failure()
+                self.logger.exception("Refilling the fact pool failed")
+                await asyncio.sleep(1.0)
+                continue
+            self._wanted.clear()
+
+    async def _refill(self) -> None:
+        while len(self._facts) < self.high:
+            if self.breaker.state == CircuitBreaker.OPEN:
+                await asyncio.sleep(self.breaker.retry_in)
+                continue
+            # Half open lets one trial request through; the rest of the batch is skipped.
+            batch = sum(
+                1 for _ in range(min(self.concurrency, self.high - len(self._facts))) if self.breaker.allow()
+            )
+            pooled = len(self._facts)
+            if batch:
+                await asyncio.gather(*(self._fetch() for _ in range(batch)))
+            if len(self._facts) == pooled:
+                # Only errors or repeats: slow down rather than ask again right away.
+                await asyncio.sleep(1.0)
+
+    def _take(self) -> Optional[str]:
+        if len(self._facts) < self.low:
+            self._wanted.set()
+        if not self._facts:
+            self._available.clear()
+            return None
+        _, text = self._facts.popleft()
+        self._served.append(text)
+        self.served["pool"] += 1
+        return text
+
+    async def get(self) -> Optional[str]:
+        """
+        Returns a fact from the pool, or a recently served one if the pool is empty. Only before the first
+        fact was served does it wait for the refill, up to ``wait`` seconds unless the API is known to be
+        down. Returns None if no fact has been fetched at all.
+        """
+        text = self._take()
+        if text is None and not self._served and self.breaker.state != CircuitBreaker.OPEN:
+            try:
+                await asyncio.wait_for(self._available.wait(), self.wait)
+            except asyncio.TimeoutError:
+                pass
+            text = self._take()
+        if text is not None:
+            return text
+        if self._served:
+            self.served["stale"] += 1
+            return random.choice(self._served)
+        self.served["none"] += 1
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "pooled": len(self._facts),
+            "fetched": self.fetched,
+            "duplicates": self.duplicates,
+            "errors": self.errors,
+            "served": dict(self.served),
+            "breaker": self.breaker.state,
+            "breaker_opens": self.breaker.opens,
+        }
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,152 @@
+import asyncio
+import random
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HostStats:
+    __slots__ = ("requests", "errors", "retries", "in_flight", "total_latency", "max_latency")
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.in_flight = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "in_flight": self.in_flight,
+            "average_latency": self.total_latency / self.requests if self.requests else 0.0,
+            "max_latency": self.max_latency,
+        }
+
+
+class HTTPClient:
+    """
+    One pooled aiohttp session shared by every cog, available as ``bot.http_client``.
+
+    Connections are kept alive and DNS lookups cached by the connector, which also caps the number of
+    concurrent connections per host. Connection errors, timeouts and 429/5xx responses are retried
+    with exponential backoff, or after the response's ``Retry-After``. A ``Retry-After`` longer than
+    ``max_retry_after`` seconds is not waited for; the response is returned to the caller instead.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 10,
+        dns_ttl: int = 300,
+        timeout: float = 10.0,
+        retries: int = 2,
+        backoff: float = 0.5,
+        max_retry_after: float = 10.0,
+    ) -> None:
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.hosts = defaultdict(HostStats)
+
+    async def start(self) -> None:
+        if self.session is not None and not self.session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_ttl,
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, **kwargs) -> AsyncIterator[aiohttp.ClientResponse]:
+        stats = self.hosts[urlparse(url).hostname]
+        response = await self._request(stats, method, url, **kwargs)
+        try:
+            yield response
+        finally:
+            response.release()
+            stats.in_flight -= 1
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    async def _request(self, stats: HostStats, method: str, url: str, **kwargs) -> aiohttp.ClientResponse:
+        """
+        Sends the request, retrying as needed. ``stats.in_flight`` counts the request until the
+        response returned is released by ``request``, since it holds its pooled connection until then.
+        """
+        if self.session is None:
+            raise RuntimeError("HTTPClient.start() has not been called")
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            stats.in_flight += 1
+            returned = False
+            try:
+                response = await self.session.request(method, url, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                stats.errors += 1
+                if attempt >= self.retries:
+                    raise
+                delay = None
+            else:
+                latency = time.perf_counter() - start
+                stats.requests += 1
+                stats.total_latency += latency
+                stats.max_latency = max(stats.max_latency, latency)
+                delay = self._retry_after(response) if response.status in RETRY_STATUSES else None
+                # Waiting longer than max_retry_after would stall whoever is waiting on this request.
+                if (
+                    response.status not in RETRY_STATUSES
+                    or attempt >= self.retries
+                    or (delay is not None and delay > self.max_retry_after)
+                ):
+                    returned = True
+                    return response
+                response.release()
+            finally:
+                if not returned:
+                    stats.in_flight -= 1
+            attempt += 1
+            stats.retries += 1
+            if delay is None:
+                delay = self.backoff * 2 ** (attempt - 1) * (1 + random.random() / 2)
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _retry_after(response: aiohttp.ClientResponse) -> Optional[float]:
+        try:
+            return float(response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            return None
+
+    def stats(self) -> dict:
+        pool = {"limit": self.limit, "limit_per_host": self.limit_per_host, "open": 0, "acquired": 0}
+        if self.session is not None:
+            connector = self.session.connector
+            pool["acquired"] = len(getattr(connector, "_acquired", ()))
+            pool["open"] = sum(len(conns) for conns in getattr(connector, "_conns", {}).values())
+        return {"pool": pool, "hosts": {host: stats.to_dict() for host, stats in self.hosts.items()}}
@@ -0,0 +1,242 @@
+import asyncio
+import hmac
+import itertools
+import json
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Optional
+
+Handler = Callable[[object], Awaitable[object]]
+
+# Stats replies from large clusters can be a few hundred kilobytes.
+LINE_LIMIT = 4 * 1024 * 1024
+
+
+class IPCError(Exception):
+    pass
+
+
+class IPCConnection:
+    """
+    One end of a newline delimited JSON channel between the supervisor and a cluster.
+
+    Either end can send requests. A request is ``{"id", "op", "data"}`` and is answered with
+    ``{"id", "result"}`` or ``{"id", "error"}``. Incoming requests are dispatched to ``handlers`` by op, each
+    in its own task so a slow handler does not hold up replies to requests this end has sent.
+    """
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        handlers: Dict[str, Handler],
+        timeout: float = 10.0,
+    ) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.handlers = handlers
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.closed = asyncio.Event()
+
+    def start(self) -> None:
+        self._task = asyncio.ensure_future(self._read_loop())
+
+    async def request(self, op: str, data: object = None, timeout: Optional[float] = None) -> object:
+        if self.closed.is_set():
+            raise IPCError("Connection is closed")
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self._send({"id": request_id, "op": op, "data": data})
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            raise IPCError(f"'{op}' timed out")
+        except ConnectionError as e:
+            raise IPCError(f"'{op}' failed: {e}") from e
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _send(self, message: dict) -> None:
+        self.writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+        await self.writer.drain()
+
+    async def _read_loop(self) -> None:
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if "op" in message:
+                    asyncio.ensure_future(self._handle(message))
+                    continue
+                future = self._pending.get(message.get("id"))
+                if future is None or future.done():
+                    continue
+                if "error" in message:
+                    future.set_exception(IPCError(message["error"]))
+                else:
+                    future.set_result(message.get("result"))
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            self.closed.set()
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(IPCError("Connection closed"))
+            self.writer.close()
+
+    async def _handle(self, message: dict) -> None:
+        handler = self.handlers.get(message["op"])
+        try:
+            if handler is None:
+                raise IPCError(f"Unknown op '{message['op']}'")
+            reply = {"id": message["id"], "result": await handler(message.get("data"))}
+        except Exception as e:
+            reply = {"id": message["id"], "error": f"{type(e).__name__}: {e}"}
+        try:
+            await self._send(reply)
+        except ConnectionError:
+            pass
+
+    async def close(self) -> None:
+        self.writer.close()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+class IPCServer:
+    """
+    Accepts cluster connections on the supervisor. A cluster introduces itself with a ``hello`` line
+    carrying its id and the shared secret; connections with a wrong secret are dropped.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        secret: str,
+        handlers: Dict[str, Handler],
+        on_connect: Optional[Callable[[int, IPCConnection], None]] = None,
+        logger: Optional[logging.Logger] = None,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.handlers = handlers
+        self.on_connect = on_connect
+        self.logger = logger or logging.getLogger("discord_bot")
+        self.connections: Dict[int, IPCConnection] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._accept, self.host, self.port, limit=LINE_LIMIT)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            hello = json.loads(await asyncio.wait_for(reader.readline(), 5.0))
+            secret = str(hello.get("secret", ""))
+            cluster_id = int(hello["cluster_id"])
+        except (asyncio.TimeoutError, ValueError, KeyError, TypeError, ConnectionError):
+            writer.close()
+            return
+        if not hmac.compare_digest(secret, self.secret):
+            self.logger.warning("Rejected an IPC connection with a wrong secret")
+            writer.close()
+            return
+        previous = self.connections.get(cluster_id)
+        if previous is not None:
+            await previous.close()
+        connection = IPCConnection(reader, writer, self.handlers)
+        connection.start()
+        self.connections[cluster_id] = connection
+        if self.on_connect is not None:
+            self.on_connect(cluster_id, connection)
+        await connection.closed.wait()
+        if self.connections.get(cluster_id) is connection:
+            del self.connections[cluster_id]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for connection in list(self.connections.values()):
+                await connection.close()
+            await self._server.wait_closed()
+            self._server = None
+
+
+class IPCClient:
+    """
+    The cluster's side of the channel. Connects to the supervisor in the background and reconnects
+    with backoff if the connection drops. If the supervisor process itself is gone (this process was
+    re-parented), ``on_orphaned`` is called instead so the cluster does not run unsupervised.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        secret: str,
+        cluster_id: int,
+        handlers: Dict[str, Handler],
+        logger: Optional[logging.Logger] = None,
+        max_backoff: float = 30.0,
+        on_orphaned: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.cluster_id = cluster_id
+        self.handlers = handlers
+        self.logger = logger or logging.getLogger("discord_bot")
+        self.max_backoff = max_backoff
+        self.on_orphaned = on_orphaned
+        self._parent_pid = os.getppid()
+        self.connection: Optional[IPCConnection] = None
+        self.connected = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self) -> None:
+        backoff = 0.5
+        while True:
+            if os.getppid() != self._parent_pid:
+                self.logger.error("The cluster supervisor exited, shutting down")
+                if self.on_orphaned is not None:
+                    self.on_orphaned()
+                return
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port, limit=LINE_LIMIT)
+            except OSError as e:
+                self.logger.warning(f"Could not reach the cluster supervisor: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            hello = {"cluster_id": self.cluster_id, "secret": self.secret}
+            writer.write(json.dumps(hello).encode() + b"\n")
+            self.connection = IPCConnection(reader, writer, self.handlers)
+            self.connection.start()
+            self.connected.set()
+            backoff = 0.5
+            await self.connection.closed.wait()
+            self.connected.clear()
+            self.logger.warning("Lost the connection to the cluster supervisor, reconnecting")
+
+    async def request(self, op: str, data: object = None, timeout: Optional[float] = None) -> object:
+        if self.connection is None or not self.connected.is_set():
+            raise IPCError("Not connected to the cluster supervisor")
+        return await self.connection.request(op, data, timeout)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self.connection is not None:
+            await self.connection.close()
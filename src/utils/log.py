@@ -0,0 +1,101 @@
+import json
+import logging
+import logging.handlers
+import queue
+from typing import Tuple
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class LoggingFormatter(logging.Formatter):
+    # Colors
+    black = "\x1b[30m"
+    red = "\x1b[31m"
+    green = "\x1b[32m"
+    yellow = "\x1b[33m"
+    blue = "\x1b[34m"
+    gray = "\x1b[38m"
+    # Styles
+    reset = "\x1b[0m"
+    bold = "\x1b[1m"
+
+    COLORS = {
+        logging.DEBUG: gray + bold,
+        logging.INFO: blue + bold,
+        logging.WARNING: yellow + bold,
+        logging.ERROR: red,
+        logging.CRITICAL: red + bold,
+    }
+
+    def __init__(self) -> None:
+        super().__init__()
+        # One formatter per level, built once instead of for every record.
+        self.formatters = {
+            level: logging.Formatter(
+                f"{self.black}{self.bold}{{asctime}}{self.reset} {color}{{levelname:<8}}{self.reset} "
+                f"{self.green}{self.bold}{{name}}{self.reset} {{message}}",
+                DATE_FORMAT,
+                style="{",
+            )
+            for level, color in self.COLORS.items()
+        }
+
+    def format(self, record):
+        formatter = self.formatters.get(record.levelno) or self.formatters[logging.INFO]
+        return formatter.format(record)
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per line, for log ingestion.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, DATE_FORMAT),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(config: dict) -> Tuple[logging.Logger, logging.handlers.QueueListener]:
+    """
+    Creates the bot logger. Records are put on a queue by the calling thread and formatted and written
+    by a background listener thread, so logging never does I/O on the event loop. The file log rotates
+    by size instead of being truncated on every start.
+
+    The returned listener must be stopped on shutdown to flush the remaining records.
+    """
+    log_config = config.get("logging", {})
+
+    # Console handler
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(LoggingFormatter())
+    # File handler
+    file_handler = logging.handlers.RotatingFileHandler(
+        filename=log_config.get("file", "discord.log"),
+        encoding="utf-8",
+        maxBytes=log_config.get("max_bytes", 10 * 1024 * 1024),
+        backupCount=log_config.get("backup_count", 5),
+    )
+    if log_config.get("json", False):
+        file_handler.setFormatter(JSONFormatter())
+    else:
+        file_handler.setFormatter(
+            logging.Formatter("[{asctime}] [{levelname:<8}] {name}: {message}", DATE_FORMAT, style="{")
+        )
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, console_handler, file_handler, respect_handler_level=True
+    )
+
+    logger = logging.getLogger("discord_bot")
+    logger.setLevel(log_config.get("level", "INFO"))
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener.start()
+    return logger, listener
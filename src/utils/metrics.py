@@ -0,0 +1,182 @@
+import bisect
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Optional[dict]) -> Labels:
+    if not labels:
+        return ()
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    if extra is not None:
+        labels = labels + (extra,)
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for key, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates a quantile by interpolating inside the bucket it falls in.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class Metrics:
+    """
+    In-process metrics registry, rendered in the Prometheus text format.
+
+    Counters and histograms are updated where things happen. Values that are cheaper to read than to
+    track (queue sizes, connection counts) are filled in by collectors right before rendering.
+    """
+
+    def __init__(self, namespace: str = "discord_bot") -> None:
+        self.namespace = namespace
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.help: Dict[str, str] = {}
+        self.collectors: List[Callable[["Metrics"], None]] = []
+
+    def _name(self, name: str, documentation: Optional[str]) -> str:
+        name = f"{self.namespace}_{name}"
+        if documentation and name not in self.help:
+            self.help[name] = documentation
+        return name
+
+    def inc(self, name: str, labels: Optional[dict] = None, value: float = 1, documentation: str = None) -> None:
+        series = self.counters.setdefault(self._name(name, documentation), {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + value
+
+    def set_counter(self, name: str, value: float, labels: Optional[dict] = None, documentation: str = None) -> None:
+        self.counters.setdefault(self._name(name, documentation), {})[_labels(labels)] = value
+
+    def set_gauge(self, name: str, value: float, labels: Optional[dict] = None, documentation: str = None) -> None:
+        self.gauges.setdefault(self._name(name, documentation), {})[_labels(labels)] = value
+
+    def observe(self, name: str, value: float, labels: Optional[dict] = None, documentation: str = None) -> None:
+        series = self.histograms.setdefault(self._name(name, documentation), {})
+        key = _labels(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    def histogram(self, name: str, labels: Optional[dict] = None) -> Optional[Histogram]:
+        return self.histograms.get(f"{self.namespace}_{name}", {}).get(_labels(labels))
+
+    def series(self, name: str) -> List[Tuple[dict, object]]:
+        """
+        Returns ``(labels, value)`` pairs of a counter, gauge or histogram, for display.
+        """
+        name = f"{self.namespace}_{name}"
+        for family in (self.counters, self.gauges, self.histograms):
+            if name in family:
+                return [(dict(labels), value) for labels, value in family[name].items()]
+        return []
+
+    def register_collector(self, collector: Callable[["Metrics"], None]) -> None:
+        self.collectors.append(collector)
+
+    def unregister_collector(self, collector: Callable[["Metrics"], None]) -> None:
+        if collector in self.collectors:
+            self.collectors.remove(collector)
+
+    def collect(self) -> None:
+        for collector in list(self.collectors):
+            collector(self)
+
+    def render(self) -> str:
+        self.collect()
+        lines = []
+        for kind, families in (("counter", self.counters), ("gauge", self.gauges)):
+            for name, series in sorted(families.items()):
+                self._header(lines, name, kind)
+                for labels, value in series.items():
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        for name, series in sorted(self.histograms.items()):
+            self._header(lines, name, "histogram")
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', str(bound)))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines: List[str], name: str, kind: str) -> None:
+        if name in self.help:
+            lines.append(f"# HELP {name} {self.help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+class MetricsServer:
+    """
+    Serves ``/metrics`` in the Prometheus text format. Meant to be bound to localhost.
+
+    ``aiohttp.web`` is only imported when the server starts, so bots with metrics disabled never load it.
+    """
+
+    def __init__(self, metrics: Metrics, host: str = "127.0.0.1", port: int = 9100) -> None:
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def start(self) -> None:
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def handle(self, request: "web.Request") -> "web.Response":
+        from aiohttp import web
+
+        return web.Response(text=self.metrics.render(), content_type="text/plain", charset="utf-8")
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Optional
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes up from a short sleep. A healthy loop stays in the low
+    milliseconds, anything blocking it (synchronous I/O, heavy parsing) shows up as lag.
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.25,
+        window: int = 240,
+        warn_threshold: float = 0.5,
+        logger: Optional[logging.Logger] = None,
+    ) -> None:
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.logger = logger
+        self.samples = deque(maxlen=window)
+        self.last = 0.0
+        self.max = 0.0
+        self._task = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, loop.time() - expected))
+
+    def record(self, lag: float) -> None:
+        self.last = lag
+        self.max = max(self.max, lag)
+        self.samples.append(lag)
+        if self.logger and lag >= self.warn_threshold:
+            self.logger.warning(f"Event loop was blocked for {lag * 1000:.0f}ms")
+
+    def percentile(self, p: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+    def snapshot(self) -> dict:
+        return {
+            "last": self.last,
+            "max": self.max,
+            "p50": self.percentile(0.50),
+            "p99": self.percentile(0.99),
+        }
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import discord
+
+from utils.metrics import Metrics
+
+
+class ChannelOutput:
+    """
+    What is waiting to be posted to one text channel.
+    """
+
+    def __init__(self, channel) -> None:
+        self.channel = channel
+        self.added: List[str] = []
+        self.now_playing: Optional[Tuple[int, discord.Embed]] = None
+        self.last_sent = float("-inf")
+        self.task: Optional[asyncio.Task] = None
+
+
+class OutputScheduler:
+    """
+    Posts the music cog's routine messages without flooding channels.
+
+    Updates are queued per channel and written by one task per channel:
+
+    - Songs added within ``window`` seconds of each other become one "Added to Queue" message.
+    - Each guild has one "Now Playing" message that is edited in place for every track change. If
+      several track changes happen before the next write, only the latest is sent; an update that would
+      not change the message is skipped.
+    - Writes to a channel are at least ``min_interval`` seconds apart, which keeps a busy guild below
+      the per channel rate limit instead of relying on 429 retries.
+    """
+
+    def __init__(
+        self,
+        window: float = 0.5,
+        min_interval: float = 1.0,
+        metrics: Optional[Metrics] = None,
+        logger: Optional[logging.Logger] = None,
+    ) -> None:
+        self.window = window
+        self.min_interval = min_interval
+        self.metrics = metrics
+        self.logger = logger or logging.getLogger("discord_bot")
+        self._channels: Dict[int, ChannelOutput] = {}
+        # guild id -> (now playing message, the embed it currently shows)
+        self._now_playing: Dict[int, Tuple[discord.Message, dict]] = {}
+
+    def _count(self, outcome: str, value: int = 1) -> None:
+        if self.metrics is not None:
+            self.metrics.inc(
+                "output_updates_total", {"outcome": outcome}, value,
+                documentation="Music channel updates by what happened to them.",
+            )
+
+    def _output(self, channel) -> ChannelOutput:
+        output = self._channels.get(channel.id)
+        if output is None:
+            output = self._channels[channel.id] = ChannelOutput(channel)
+        return output
+
+    def _wake(self, output: ChannelOutput) -> None:
+        if output.task is None or output.task.done():
+            output.task = asyncio.ensure_future(self._drain(output))
+
+    def added(self, channel, title: str) -> None:
+        output = self._output(channel)
+        output.added.append(title)
+        self._wake(output)
+
+    def now_playing(self, guild_id: int, channel, embed: discord.Embed) -> None:
+        output = self._output(channel)
+        if output.now_playing is not None:
+            self._count("superseded")
+        output.now_playing = (guild_id, embed)
+        self._wake(output)
+
+    def forget(self, guild_id: int) -> None:
+        """
+        Stops editing the guild's now playing message; the next track gets a new one.
+        """
+        self._now_playing.pop(guild_id, None)
+        for output in self._channels.values():
+            if output.now_playing is not None and output.now_playing[0] == guild_id:
+                output.now_playing = None
+
+    async def _drain(self, output: ChannelOutput) -> None:
+        loop = asyncio.get_running_loop()
+        # Give a burst the chance to arrive before writing anything.
+        await asyncio.sleep(self.window)
+        while output.added or output.now_playing is not None:
+            wait = output.last_sent + self.min_interval - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                if output.added:
+                    titles, output.added = output.added, []
+                    wrote = await self._send_added(output.channel, titles)
+                else:
+                    (guild_id, embed), output.now_playing = output.now_playing, None
+                    wrote = await self._send_now_playing(output.channel, guild_id, embed)
+            except discord.HTTPException as e:
+                self.logger.warning(f"Could not post to channel {output.channel.id}: {e}")
+                self._count("failed")
+                wrote = True
+            if wrote:
+                output.last_sent = loop.time()
+        if self._channels.get(output.channel.id) is output:
+            del self._channels[output.channel.id]
+
+    async def _send_added(self, channel, titles: List[str]) -> bool:
+        if len(titles) == 1:
+            description = f"Added {titles[0]} to the queue."
+        else:
+            description = f"Added {len(titles)} songs to the queue, the last one being {titles[-1]}."
+            self._count("coalesced", len(titles) - 1)
+        await channel.send(embed=discord.Embed(title="Added to Queue", description=description, color=discord.Color.green()))
+        self._count("sent")
+        return True
+
+    async def _send_now_playing(self, channel, guild_id: int, embed: discord.Embed) -> bool:
+        shown = embed.to_dict()
+        current = self._now_playing.get(guild_id)
+        if current is not None and current[0].channel.id == channel.id:
+            message, previous = current
+            if previous == shown:
+                self._count("unchanged")
+                return False
+            try:
+                await message.edit(embed=embed)
+                self._now_playing[guild_id] = (message, shown)
+                self._count("edited")
+                return True
+            except discord.NotFound:
+                pass
+        message = await channel.send(embed=embed)
+        self._now_playing[guild_id] = (message, shown)
+        self._count("sent")
+        return True
+
+    def close(self) -> None:
+        for output in self._channels.values():
+            if output.task is not None:
+                output.task.cancel()
+        self._channels.clear()
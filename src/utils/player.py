@@ -0,0 +1,164 @@
+from typing import Any, Dict, Iterator, Optional, Set
+
+from utils.store import PlayerStore
+from utils.track import Track
+from utils.track_queue import TrackQueue
+
+
+def restorable(item: Any) -> Any:
+    """
+    Tracks whose stream URL has expired come back as the query they were found with (or their title),
+    to be searched again when they reach the front of the queue.
+    """
+    if isinstance(item, Track) and item.expired:
+        return item.query or item.title
+    return item
+
+
+def _dump(item: Any) -> Any:
+    return item.to_dict() if isinstance(item, Track) else item
+
+
+def _load(item: Any) -> Any:
+    return restorable(Track.from_dict(item) if isinstance(item, dict) else item)
+
+
+class GuildPlayer:
+    """
+    Playback state for a single guild: its queue, loop flag, volume and the track that is currently playing.
+    """
+
+    def __init__(self, guild_id: int) -> None:
+        self.guild_id = guild_id
+        self.queue = TrackQueue()
+        self.current_song = None
+        self.source = None
+        self.on_loop = False
+        self.volume = 1.0
+        self.prefetch_task = None
+        self.resolve_task = None
+        self.preopened = None
+        # (queue entry id, seconds) to start that entry from, set when a session is restored mid track
+        self.resume_at = None
+
+    @property
+    def is_active(self) -> bool:
+        return self.current_song is not None
+
+    def clear(self) -> None:
+        self.queue.clear()
+        self.current_song = None
+        self.source = None
+        self.on_loop = False
+        self.cancel_prefetch()
+        self.cancel_resolve()
+        self.drop_preopened()
+
+    def snapshot(self) -> dict:
+        return {
+            "volume": self.volume,
+            "on_loop": self.on_loop,
+            "current_song": _dump(self.current_song),
+            "position": getattr(self.source, "position", 0.0) if self.source is not None else 0.0,
+            "queue": [_dump(item) for item in self.queue],
+        }
+
+    @classmethod
+    def from_snapshot(cls, guild_id: int, state: dict) -> "GuildPlayer":
+        """
+        Rebuilds a saved session. Nothing is playing after a restart, so the song that was playing goes
+        back to the front of the queue and resumes where it stopped when it is played next.
+        """
+        player = cls(guild_id)
+        player.volume = state.get("volume", 1.0)
+        player.on_loop = state.get("on_loop", False)
+        player.queue.extend(_load(item) for item in state.get("queue", ()))
+        if state.get("current_song"):
+            current_song = _load(state["current_song"])
+            entry = player.queue.appendleft(current_song)
+            if isinstance(current_song, Track) and state.get("position"):
+                player.resume_at = (entry.id, state["position"])
+        return player
+
+    def cancel_prefetch(self) -> None:
+        if self.prefetch_task is not None:
+            self.prefetch_task.cancel()
+            self.prefetch_task = None
+
+    def cancel_resolve(self) -> None:
+        if self.resolve_task is not None:
+            self.resolve_task.cancel()
+            self.resolve_task = None
+
+    def drop_preopened(self) -> None:
+        if self.preopened is not None:
+            self.preopened[2].cleanup()
+            self.preopened = None
+
+
+class PlayerManager:
+    """
+    Holds one GuildPlayer per guild. Players are created on first use and dropped when the bot leaves voice.
+
+    With a store, changed players are saved in the background, and a guild's saved session is loaded
+    the first time the guild uses a music command after a restart rather than all at start up.
+    """
+
+    def __init__(self, store: Optional[PlayerStore] = None) -> None:
+        self._players: Dict[int, GuildPlayer] = {}
+        self.store = store
+        self._checked: Set[int] = set()
+
+    def get(self, guild_id: int) -> GuildPlayer:
+        player = self._players.get(guild_id)
+        if player is None:
+            player = GuildPlayer(guild_id)
+            self._players[guild_id] = player
+        return player
+
+    def peek(self, guild_id: int) -> Optional[GuildPlayer]:
+        return self._players.get(guild_id)
+
+    async def restore(self, guild_id: int) -> Optional[GuildPlayer]:
+        """
+        Loads the guild's saved session, once per guild and only if it has no player in memory yet.
+        """
+        if self.store is None or guild_id in self._checked:
+            return self._players.get(guild_id)
+        self._checked.add(guild_id)
+        state = await self.store.load(guild_id)
+        if state is not None and guild_id not in self._players:
+            self._players[guild_id] = GuildPlayer.from_snapshot(guild_id, state)
+        return self._players.get(guild_id)
+
+    def mark(self, guild_id: int) -> None:
+        player = self._players.get(guild_id)
+        if self.store is not None and player is not None:
+            self.store.mark(guild_id, player.snapshot)
+
+    def remove(self, guild_id: int, forget: bool = True) -> Optional[GuildPlayer]:
+        """
+        Drops the guild's player. Unless ``forget`` is False its saved session is deleted too.
+        """
+        player = self._players.pop(guild_id, None)
+        if self.store is not None:
+            if forget:
+                self.store.delete(guild_id)
+            elif player is not None:
+                state = player.snapshot()
+                self.store.mark(guild_id, lambda: state)
+                # Let the next music command load the saved session again.
+                self._checked.discard(guild_id)
+        if player is not None:
+            player.clear()
+        return player
+
+    def save_all(self) -> None:
+        for guild_id in self._players:
+            self.mark(guild_id)
+
+    def __len__(self) -> int:
+        return len(self._players)
+
+    def __iter__(self) -> Iterator[GuildPlayer]:
+        return iter(list(self._players.values()))
@@ -0,0 +1,88 @@
+import asyncio
+from typing import Callable, Optional, Tuple
+
+import discord
+
+from utils.admission import BULK, NORMAL
+from utils.player import GuildPlayer, restorable
+from utils.queue_resolver import QueueResolver
+from utils.resolver import ResolveError, TrackResolver
+from utils.track import Track
+
+
+class Prefetcher:
+    """
+    Look-ahead stage for gapless playback.
+
+    While a track plays, the next ``depth`` queued entries are resolved in the background so they are
+    in the resolver cache when their turn comes; with a ``queue_resolver`` that resolves the whole
+    queue instead. ``lead`` seconds before the current track ends, the FFmpeg source of the next entry
+    is opened so it has buffered by the time it is played.
+
+    The pre-opened source is tied to the queue entry it was opened for. If the queue changes under it
+    (shuffle, remove, stop) and that entry is no longer next, the source is thrown away.
+    """
+
+    def __init__(
+        self,
+        resolver: TrackResolver,
+        opener: Callable[[Track, float], discord.AudioSource],
+        depth: int = 3,
+        lead: float = 3.0,
+        queue_resolver: Optional[QueueResolver] = None,
+    ) -> None:
+        self.resolver = resolver
+        self.opener = opener
+        self.depth = depth
+        self.lead = lead
+        self.queue_resolver = queue_resolver
+
+    def schedule(self, player: GuildPlayer) -> None:
+        player.cancel_prefetch()
+        if player.preopened is not None and (not player.queue or player.preopened[0] != player.queue.entry(0).id):
+            player.drop_preopened()
+        if player.queue:
+            if self.queue_resolver is not None:
+                self.queue_resolver.schedule(player)
+            player.prefetch_task = asyncio.create_task(self._run(player))
+
+    def take(self, player: GuildPlayer, entry_id: int) -> Optional[Tuple[Track, discord.AudioSource]]:
+        """
+        Returns the resolved song and pre-opened source for the queue entry ``entry_id`` if there is one.
+        """
+        preopened = player.preopened
+        player.preopened = None
+        if preopened is None:
+            return None
+        if preopened[0] != entry_id:
+            preopened[2].cleanup()
+            return None
+        return preopened[1], preopened[2]
+
+    async def _run(self, player: GuildPlayer) -> None:
+        queries = [entry.item for entry in player.queue.page(0, self.depth) if isinstance(entry.item, str)]
+        if queries and self.queue_resolver is None:
+            await asyncio.gather(*(self.resolver.resolve(query, BULK) for query in queries), return_exceptions=True)
+
+        if player.on_loop or player.preopened is not None:
+            return
+        while True:
+            source = player.source
+            song = player.current_song
+            if source is None or song is None or not song.duration:
+                return
+            remaining = song.duration - source.position
+            if remaining <= self.lead:
+                break
+            await asyncio.sleep(min(remaining - self.lead, 1.0))
+
+        if not player.queue or player.on_loop:
+            return
+        entry = player.queue.entry(0)
+        item = restorable(entry.item)
+        try:
+            song = item if isinstance(item, Track) else await self.resolver.resolve(item, NORMAL)
+        except ResolveError:
+            return
+        if player.queue and player.queue.entry(0).id == entry.id:
+            player.preopened = (entry.id, song, self.opener(song, player.volume))
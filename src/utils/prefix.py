@@ -0,0 +1,94 @@
+import re
+from typing import Dict, List, Optional, Pattern
+
+from utils.store import PlayerStore
+
+MAX_PREFIX_LENGTH = 10
+
+
+class PrefixCache:
+    """
+    Command prefixes per guild, held in memory and backed by the store.
+
+    Every guild is served by exactly one process, so the in-memory copy is authoritative: it is loaded
+    once at start up and updated (and written through to the store) when a guild changes its prefix.
+    Guilds without their own prefix, and DMs, use ``default``. Mentioning the bot always works as a
+    prefix too.
+
+    For each distinct prefix a regular expression matching the prefix directly followed by the command
+    name is compiled once, so ``command_name`` can tell whether a message is a command without building
+    a ``Context``. Like discord.py (without ``strip_after_prefix``), no whitespace is allowed between
+    the two.
+    """
+
+    def __init__(self, default: str, store: Optional[PlayerStore] = None) -> None:
+        self.default = default
+        self.store = store
+        self.user_id: Optional[int] = None
+        self._prefixes: Dict[int, str] = {}
+        self._patterns: Dict[str, Pattern] = {}
+        self._candidates: Dict[str, List[str]] = {}
+
+    async def load(self, store: Optional[PlayerStore]) -> None:
+        self.store = store
+        if store is not None:
+            self._prefixes = await store.load_prefixes()
+
+    def get(self, guild_id: Optional[int]) -> str:
+        if guild_id is None:
+            return self.default
+        return self._prefixes.get(guild_id, self.default)
+
+    async def set(self, guild_id: int, prefix: Optional[str]) -> None:
+        """
+        Changes a guild's prefix; None (or the default prefix) goes back to the default.
+        """
+        if prefix == self.default:
+            prefix = None
+        if prefix is not None and (not prefix or len(prefix) > MAX_PREFIX_LENGTH or prefix != prefix.strip()):
+            raise ValueError(f"A prefix must be 1 to {MAX_PREFIX_LENGTH} characters without surrounding spaces.")
+        if self.store is not None:
+            await self.store.save_prefix(guild_id, prefix)
+        if prefix is None:
+            self._prefixes.pop(guild_id, None)
+        else:
+            self._prefixes[guild_id] = prefix
+        self._forget_unused()
+
+    def _forget_unused(self) -> None:
+        used = set(self._prefixes.values())
+        used.add(self.default)
+        for prefix in [prefix for prefix in self._patterns if prefix not in used]:
+            del self._patterns[prefix]
+            self._candidates.pop(prefix, None)
+
+    def set_user(self, user_id: int) -> None:
+        if user_id != self.user_id:
+            self.user_id = user_id
+            self._patterns.clear()
+            self._candidates.clear()
+
+    def candidates(self, guild_id: Optional[int]) -> List[str]:
+        """
+        The prefixes discord.py should accept for a guild, as ``commands.when_mentioned_or`` would return them.
+        """
+        prefix = self.get(guild_id)
+        candidates = self._candidates.get(prefix)
+        if candidates is None:
+            candidates = self._candidates[prefix] = [f"<@{self.user_id}> ", f"<@!{self.user_id}> ", prefix]
+        return candidates
+
+    def _pattern(self, prefix: str) -> Pattern:
+        pattern = self._patterns.get(prefix)
+        if pattern is None:
+            pattern = self._patterns[prefix] = re.compile(
+                rf"(?:<@!?{self.user_id}> |{re.escape(prefix)})(\S+)"
+            )
+        return pattern
+
+    def command_name(self, content: str, guild_id: Optional[int]) -> Optional[str]:
+        """
+        Returns the word after the prefix if the message starts with one, else None.
+        """
+        match = self._pattern(self.get(guild_id)).match(content)
+        return match.group(1) if match is not None else None
@@ -0,0 +1,115 @@
+import asyncio
+from datetime import timedelta
+from typing import Awaitable, Callable, Iterable, List, Optional
+
+import discord
+
+# Discord refuses to bulk delete messages older than 14 days. Messages within a minute of that
+# cutoff are treated as old too, so a slow purge does not see its batch rejected.
+BULK_DELETE_MAX_AGE = timedelta(days=14) - timedelta(minutes=1)
+BULK_DELETE_SIZE = 100
+
+
+class PurgeJob:
+    """
+    Deletes up to ``limit`` messages of a channel, newest first, reading them through a single history
+    cursor.
+
+    Recent messages are bulk deleted 100 at a time while the next history page is already being fetched.
+    Messages older than 14 days cannot be bulk deleted and are removed one by one. There are no fixed
+    sleeps: discord.py's HTTP client reads the rate limit headers of every response and waits exactly as
+    long as the bucket requires.
+
+    Like ``TextChannel.purge``, ``limit`` is the number of messages looked at; ``check`` decides which of
+    them are deleted. Messages in ``include`` (such as the command message) are deleted with the first batch.
+    """
+
+    def __init__(
+        self,
+        channel: discord.abc.Messageable,
+        limit: int,
+        check: Optional[Callable[[discord.Message], bool]] = None,
+        before=None,
+        include: Iterable[discord.Message] = (),
+        on_progress: Optional[Callable[["PurgeJob"], Awaitable[None]]] = None,
+    ) -> None:
+        self.channel = channel
+        self.limit = limit
+        self.check = check
+        self.before = before
+        self.include = list(include)
+        self.on_progress = on_progress
+        self.scanned = 0
+        self.bulk_deleted = 0
+        self.single_deleted = 0
+        self.api_calls = 0
+        self.cancelled = False
+        self.finished = False
+
+    @property
+    def deleted(self) -> int:
+        return self.bulk_deleted + self.single_deleted
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    async def run(self) -> "PurgeJob":
+        cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+        batch: List[discord.Message] = list(self.include)
+        old: List[discord.Message] = []
+        pending = None
+        try:
+            async for message in self.channel.history(limit=self.limit, before=self.before):
+                if self.scanned % BULK_DELETE_SIZE == 0:
+                    self.api_calls += 1
+                self.scanned += 1
+                if self.cancelled:
+                    break
+                if self.check is not None and not self.check(message):
+                    continue
+                if message.created_at < cutoff:
+                    old.append(message)
+                    continue
+                batch.append(message)
+                if len(batch) == BULK_DELETE_SIZE:
+                    if pending is not None:
+                        await pending
+                    pending = asyncio.ensure_future(self._bulk_delete(batch))
+                    batch = []
+            if pending is not None:
+                await pending
+                pending = None
+            if batch and not self.cancelled:
+                await self._bulk_delete(batch)
+            for message in old:
+                if self.cancelled:
+                    break
+                await self._single_delete(message)
+        finally:
+            if pending is not None:
+                pending.cancel()
+            self.finished = True
+        return self
+
+    async def _bulk_delete(self, messages: List[discord.Message]) -> None:
+        if len(messages) == 1:
+            return await self._single_delete(messages[0])
+        self.api_calls += 1
+        await self.channel.delete_messages(messages)
+        self.bulk_deleted += len(messages)
+        await self._progress()
+
+    async def _single_delete(self, message: discord.Message) -> None:
+        self.api_calls += 1
+        try:
+            await message.delete()
+        except discord.NotFound:
+            pass
+        else:
+            self.single_deleted += 1
+            if self.single_deleted % 25 == 0:
+                await self._progress()
+
+    async def _progress(self) -> None:
+        if self.on_progress is not None:
+            await self.on_progress(self)
@@ -0,0 +1,86 @@
+import asyncio
+from typing import Dict, Set
+
+from utils.admission import BULK
+from utils.player import GuildPlayer
+from utils.resolver import ResolveError, TrackResolver
+from utils.track_queue import QueueEntry, TrackQueue
+
+
+class QueueResolver:
+    """
+    Resolves the search queries waiting in guild queues (Spotify tracks are queued as
+    ``"title by artist"``) into songs in the background, so the queue shows real titles and the next
+    track is ready when its turn comes.
+
+    Each guild's queue is walked from the front, so the entries closest to playing are resolved first.
+    The walk continues from where it stopped as songs are appended, and starts over only when the queue's
+    ``version`` shows it was otherwise changed (a shuffle, move, insert or removal), so resolving a
+    queue costs one pass over it rather than one pass per resolution. At most ``concurrency`` queries are resolved at once across all guilds, at bulk priority so
+    commands never wait behind them. Identical queries (the same song in several guilds' playlists)
+    are resolved once by the resolver's cache.
+
+    A resolved entry keeps its query, so it can be looked up again if its stream URL expires before it
+    is played.
+    """
+
+    def __init__(self, resolver: TrackResolver, concurrency: int = 2) -> None:
+        self.resolver = resolver
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.resolved = 0
+        self.failed = 0
+
+    def schedule(self, player: GuildPlayer) -> None:
+        if player.resolve_task is None or player.resolve_task.done():
+            player.resolve_task = asyncio.ensure_future(self._run(player))
+
+    @staticmethod
+    def pending(player: GuildPlayer) -> int:
+        return player.queue.queries
+
+    async def _run(self, player: GuildPlayer) -> None:
+        in_flight: Dict[int, asyncio.Task] = {}
+        failed: Set[int] = set()
+        queue = player.queue
+        version = None
+        position = 0
+        try:
+            while True:
+                if queue.version != version:
+                    version, position = queue.version, 0
+                while len(in_flight) < self.concurrency and position < len(queue):
+                    entry = queue.entry(position)
+                    position += 1
+                    if isinstance(entry.item, str) and entry.id not in in_flight and entry.id not in failed:
+                        in_flight[entry.id] = asyncio.ensure_future(self._resolve(queue, entry))
+                if not in_flight:
+                    return
+                done, _ = await asyncio.wait(in_flight.values(), return_when=asyncio.FIRST_COMPLETED)
+                for entry_id, task in list(in_flight.items()):
+                    if task in done:
+                        del in_flight[entry_id]
+                        if not task.result():
+                            failed.add(entry_id)
+        finally:
+            for task in in_flight.values():
+                task.cancel()
+
+    async def _resolve(self, queue: TrackQueue, entry: QueueEntry) -> bool:
+        query = entry.item
+        async with self._semaphore:
+            if entry.item is not query:
+                return True
+            try:
+                song = await self.resolver.resolve(query, BULK)
+            except ResolveError:
+                self.failed += 1
+                return False
+        # The entry may have been played or resolved by someone else in the meantime.
+        if entry.item is query:
+            queue.replace(entry, song._replace(query=query))
+            self.resolved += 1
+        return True
+
+    def stats(self) -> dict:
+        return {"concurrency": self.concurrency, "resolved": self.resolved, "failed": self.failed}
@@ -0,0 +1,134 @@
+import logging
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import discord
+
+from utils.audio import ffmpeg_process, forget_source, is_released, open_sources
+from utils.player import PlayerManager
+
+REASONS = ("idle", "alone", "detached")
+
+
+class SessionReaper:
+    """
+    Ends music sessions nobody is using and kills FFmpeg processes nothing is playing.
+
+    ``sweep`` is meant to run every few seconds. On each sweep:
+
+    * a voice connection that has not been playing for ``idle_timeout`` seconds (a paused song counts
+      as not playing), or whose channel has had nobody but bots in it for ``alone_timeout`` seconds,
+      is disconnected and its guild's player released with ``release``;
+    * a player whose guild has had no voice connection for ``idle_timeout`` seconds (the connection
+      dropped, or a saved session was restored by a command that does not play) is released, keeping
+      its saved session so it can be restored later;
+    * every source ``open_source`` spawned that is neither playing nor pre-opened by a player, on two
+      sweeps in a row, is cleaned up, which kills its FFmpeg process and closes its pipes.
+    """
+
+    def __init__(
+        self,
+        players: PlayerManager,
+        release: Callable[[int, bool], None],
+        idle_timeout: float = 300.0,
+        alone_timeout: float = 60.0,
+        logger: Optional[logging.Logger] = None,
+    ) -> None:
+        self.players = players
+        self.release = release
+        self.idle_timeout = idle_timeout
+        self.alone_timeout = alone_timeout
+        self.logger = logger or logging.getLogger(__name__)
+        # guild id -> monotonic time the condition was first seen
+        self._idle: Dict[int, float] = {}
+        self._alone: Dict[int, float] = {}
+        self._detached: Dict[int, float] = {}
+        # ids of sources found unused on the previous sweep
+        self._suspects: Set[int] = set()
+        self.reaped = dict.fromkeys(REASONS, 0)
+        self.orphans_killed = 0
+
+    @staticmethod
+    def _since(table: Dict[int, float], guild_id: int, condition: bool, now: float) -> float:
+        if not condition:
+            table.pop(guild_id, None)
+            return 0.0
+        return now - table.setdefault(guild_id, now)
+
+    @staticmethod
+    def _is_alone(voice: discord.VoiceClient) -> bool:
+        channel = voice.channel
+        return channel is not None and not any(not member.bot for member in channel.members)
+
+    async def _end(self, voice: discord.VoiceClient, reason: str) -> None:
+        guild_id = voice.guild.id
+        self.forget(guild_id)
+        self.release(guild_id, True)
+        try:
+            await voice.disconnect(force=True)
+        except Exception as e:
+            self.logger.warning(f"Disconnecting from voice in guild {guild_id} failed: {e}")
+        self.reaped[reason] += 1
+        self.logger.info(f"Left voice in guild {guild_id} ({reason})")
+
+    async def sweep(self, voice_clients: Iterable[discord.VoiceClient]) -> None:
+        voice_clients = list(voice_clients)
+        now = time.monotonic()
+        connected = set()
+        for voice in voice_clients:
+            guild_id = voice.guild.id
+            connected.add(guild_id)
+            alone = self._since(self._alone, guild_id, self._is_alone(voice), now)
+            idle = self._since(self._idle, guild_id, not voice.is_playing(), now)
+            if alone >= self.alone_timeout:
+                await self._end(voice, "alone")
+            elif idle >= self.idle_timeout:
+                await self._end(voice, "idle")
+
+        for player in self.players:
+            guild_id = player.guild_id
+            if self._since(self._detached, guild_id, guild_id not in connected, now) >= self.idle_timeout:
+                self.forget(guild_id)
+                self.release(guild_id, False)
+                self.reaped["detached"] += 1
+        # Guilds that have neither a connection nor a player any more.
+        for table in (self._idle, self._alone, self._detached):
+            for guild_id in [guild_id for guild_id in table if guild_id not in connected and self.players.peek(guild_id) is None]:
+                del table[guild_id]
+
+        self.reap_sources(voice_clients)
+
+    def reap_sources(self, voice_clients: List[discord.VoiceClient]) -> None:
+        in_use = {id(voice.source) for voice in voice_clients}
+        for player in self.players:
+            in_use.add(id(player.source))
+            if player.preopened is not None:
+                in_use.add(id(player.preopened[2]))
+        suspects = set()
+        for source in open_sources():
+            if is_released(source):
+                forget_source(source)
+            elif id(source) not in in_use:
+                if id(source) not in self._suspects:
+                    suspects.add(id(source))
+                    continue
+                if ffmpeg_process(source) is not None:
+                    self.orphans_killed += 1
+                source.cleanup()
+                forget_source(source)
+        self._suspects = suspects
+
+    def forget(self, guild_id: int) -> None:
+        for table in (self._idle, self._alone, self._detached):
+            table.pop(guild_id, None)
+
+    def stats(self) -> dict:
+        sources = open_sources()
+        return {
+            "idle": len(self._idle),
+            "alone": len(self._alone),
+            "ffmpeg_processes": sum(1 for source in sources if ffmpeg_process(source) is not None),
+            "sources": len(sources),
+            "reaped": dict(self.reaped),
+            "orphans_killed": self.orphans_killed,
+        }
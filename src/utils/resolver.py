@@ -0,0 +1,165 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from utils.admission import NORMAL, PrioritySemaphore
+from utils.cache import ResolverCache
+from utils.metrics import Metrics
+from utils.track import Track
+
+YDL_OPTIONS = {
+    'format': 'bestaudio/best',
+    'quiet': True,
+    'postprocessors': [{
+        'key': 'FFmpegExtractAudio',
+        'preferredcodec': 'mp3',
+        'preferredquality': '192',
+    }],
+}
+
+
+class ResolveError(Exception):
+    pass
+
+
+class TrackResolver:
+    """
+    Resolves a search query to a playable song without blocking the event loop.
+
+    Searching is awaited on the loop, extraction runs on a bounded thread pool. At most ``workers``
+    extractions run at once, the rest wait on a semaphore so they can still be cancelled cheaply.
+    Waiting extractions are started by priority, so the song a user is waiting for is not stuck behind
+    look-ahead work. An extraction is shared by everyone resolving the same URL and runs at the most
+    urgent of their priorities, so asking for a song that is already being looked up in bulk moves that
+    lookup up instead of waiting behind it.
+    When a cache is given, searches and stream infos are looked up there first.
+
+    yt_dlp takes longer to import than the rest of the bot's own code put together, so it is imported on
+    the first extraction (or by ``warm``) instead of at module import.
+    """
+
+    def __init__(
+        self,
+        search: Callable[[str], Awaitable[str]],
+        workers: int = 4,
+        timeout: float = 30.0,
+        ydl_options: Optional[dict] = None,
+        cache: Optional[ResolverCache] = None,
+        metrics: Optional[Metrics] = None,
+        extractor: Optional[Callable[[str], dict]] = None,
+    ) -> None:
+        self.search = search
+        self.workers = workers
+        self.timeout = timeout
+        self.ydl_options = ydl_options or YDL_OPTIONS
+        self.cache = cache
+        self.metrics = metrics
+        self.extractor = extractor or self._extract
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="resolver")
+        self._semaphore = PrioritySemaphore(workers)
+        # url -> priorities of the callers waiting for its extraction
+        self._wanted: Dict[str, List[int]] = {}
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.total_time = 0.0
+
+    async def resolve(self, query: str, priority: int = NORMAL) -> Track:
+        if self.cache is None:
+            return await self.extract(await self.search_url(query), priority)
+        url = await self.cache.searches.get_or_fetch(query, lambda: self.search_url(query))
+        wanted = self._wanted.setdefault(url, [])
+        wanted.append(priority)
+        self._semaphore.reprioritize(url, priority)
+        try:
+            return await self.cache.streams.get_or_fetch(
+                url, lambda: self.extract(url, priority), expires=self.cache.stream_expires_at
+            )
+        finally:
+            wanted.remove(priority)
+            if not wanted and self._wanted.get(url) is wanted:
+                del self._wanted[url]
+
+    def _observe(self, stage: str, start: float) -> None:
+        if self.metrics is not None:
+            self.metrics.observe(
+                "resolve_duration_seconds", time.perf_counter() - start, {"stage": stage},
+                documentation="Time spent searching for and extracting tracks.",
+            )
+
+    async def search_url(self, query: str) -> str:
+        start = time.perf_counter()
+        try:
+            url = await asyncio.wait_for(self.search(query), self.timeout)
+            self._observe("search", start)
+            return url
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise ResolveError(f"Search for '{query}' timed out")
+        except Exception as e:
+            self.failed += 1
+            raise ResolveError(f"Search for '{query}' failed: {e}") from e
+
+    async def extract(self, url: str, priority: int = NORMAL) -> Track:
+        priority = min([priority, *self._wanted.get(url, ())])
+        async with self._semaphore.hold(priority, url):
+            loop = asyncio.get_running_loop()
+            start = time.perf_counter()
+            self.in_flight += 1
+            try:
+                future = loop.run_in_executor(self._executor, self.extractor, url)
+                info = await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise ResolveError(f"Extracting '{url}' timed out")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                raise ResolveError(f"Extracting '{url}' failed: {e}") from e
+            finally:
+                self.in_flight -= 1
+            self.completed += 1
+            self.total_time += time.perf_counter() - start
+            self._observe("extract", start)
+        # Only the Track is kept; the info dict with every format goes out of scope here.
+        return Track.from_info(info)
+
+    def _extract(self, url: str) -> dict:
+        import yt_dlp
+
+        with yt_dlp.YoutubeDL(self.ydl_options) as ydl:
+            return ydl.extract_info(url, download=False)
+
+    def _warm(self) -> None:
+        import yt_dlp
+
+        with yt_dlp.YoutubeDL(self.ydl_options):
+            pass
+
+    async def warm(self) -> None:
+        """
+        Imports yt_dlp and builds its extractor list on a worker thread, so the first real extraction
+        does not pay for it.
+        """
+        if self.extractor == self._extract:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._warm)
+
+    def stats(self) -> dict:
+        stats = {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "waiting": self._semaphore.waiting(),
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "average_time": self.total_time / self.completed if self.completed else 0.0,
+        }
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        return stats
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,172 @@
+import asyncio
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Optional, Tuple
+
+SPOTIFY_URL = re.compile(r"spotify\.com/(?:intl-[a-z]+/)?(playlist|album|track)/([a-zA-Z0-9]+)")
+
+PLAYLIST_PAGE_SIZE = 100
+ALBUM_PAGE_SIZE = 50
+
+
+class SpotifyError(Exception):
+    pass
+
+
+def parse_spotify_url(url: str) -> Optional[Tuple[str, str]]:
+    """
+    Returns ``(kind, id)`` for a playlist, album or track URL, or None when the URL is not one of those.
+    """
+    match = SPOTIFY_URL.search(url)
+    if match:
+        return match.group(1), match.group(2)
+    return None
+
+
+def track_query(track: dict) -> str:
+    return f"{track['name']} by {track['artists'][0]['name']}"
+
+
+def _is_spotipy_error(error: Exception) -> bool:
+    # spotipy is imported lazily; if it was never imported the error cannot have come from it.
+    spotipy = sys.modules.get("spotipy")
+    return spotipy is not None and isinstance(error, (spotipy.SpotifyException, spotipy.SpotifyOauthError))
+
+
+class SpotifyClient:
+    """
+    Async wrapper around spotipy.
+
+    spotipy is synchronous, so every request runs on a small thread pool. The underlying client is
+    built on first use rather than at import time, and spotipy itself is only imported then. A ready made client (such as ``StubSpotify``) can be
+    passed in instead of credentials.
+    """
+
+    def __init__(
+        self,
+        client_id: Optional[str] = None,
+        client_secret: Optional[str] = None,
+        page_concurrency: int = 4,
+        client=None,
+    ) -> None:
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.page_concurrency = page_concurrency
+        self._client = client
+        self._executor = ThreadPoolExecutor(max_workers=page_concurrency, thread_name_prefix="spotify")
+
+    @property
+    def client(self):
+        if self._client is None:
+            import spotipy
+            from spotipy.oauth2 import SpotifyClientCredentials
+
+            credentials = SpotifyClientCredentials(client_id=self.client_id, client_secret=self.client_secret)
+            self._client = spotipy.Spotify(client_credentials_manager=credentials)
+        return self._client
+
+    async def _call(self, method: str, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self._executor, lambda: getattr(self.client, method)(*args, **kwargs)
+            )
+        except Exception as e:
+            if _is_spotipy_error(e):
+                raise SpotifyError(str(e)) from e
+            if isinstance(e, OSError):
+                # Network and transport errors; requests' ConnectionError and Timeout are OSErrors too.
+                raise SpotifyError(f"Spotify request failed: {e}") from e
+            raise
+
+    async def warm(self) -> None:
+        """
+        Imports spotipy and builds the client on a worker thread. Does not make any requests.
+        """
+        await asyncio.get_running_loop().run_in_executor(self._executor, lambda: self.client)
+
+    async def iter_tracks(self, url: str, limit: Optional[int] = None) -> AsyncIterator[str]:
+        """
+        Yields a search query for every track behind a Spotify URL, in order, or for the first ``limit``.
+
+        The first page is yielded as soon as it arrives, the remaining pages are then fetched
+        concurrently and yielded in order as they complete. Pages past ``limit`` are not fetched.
+        """
+        parsed = parse_spotify_url(url)
+        if parsed is None:
+            raise SpotifyError(f"Not a Spotify playlist, album or track URL: {url}")
+        kind, spotify_id = parsed
+        if kind == "track":
+            yield track_query(await self._call("track", spotify_id))
+            return
+        if kind == "playlist":
+            method, page_size = "playlist_items", PLAYLIST_PAGE_SIZE
+            kwargs = {"additional_types": ("track",)}
+        else:
+            method, page_size = "album_tracks", ALBUM_PAGE_SIZE
+            kwargs = {}
+
+        first = await self._call(method, spotify_id, limit=page_size, offset=0, **kwargs)
+        for query in self._page_queries(first, kind):
+            yield query
+
+        pages = [
+            asyncio.ensure_future(self._call(method, spotify_id, limit=page_size, offset=offset, **kwargs))
+            for offset in range(page_size, min(first["total"], limit or first["total"]), page_size)
+        ]
+        try:
+            for page in pages:
+                for query in self._page_queries(await page, kind):
+                    yield query
+        finally:
+            for page in pages:
+                page.cancel()
+
+    @staticmethod
+    def _page_queries(page: dict, kind: str):
+        for item in page["items"]:
+            track = item.get("track") if kind == "playlist" else item
+            if track and track.get("name") and track.get("artists"):
+                yield track_query(track)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class StubSpotify:
+    """
+    Offline stand-in for ``spotipy.Spotify`` that serves generated playlists, albums and tracks.
+    Every id is valid; ``size`` controls how many tracks playlists and albums have.
+    """
+
+    def __init__(self, size: int = 250, delay: float = 0.0) -> None:
+        self.size = size
+        self.delay = delay
+        self.requests = 0
+
+    def _track(self, spotify_id: str, index: int) -> dict:
+        return {"name": f"{spotify_id} song {index}", "artists": [{"name": f"artist {index % 17}"}]}
+
+    def _page(self, spotify_id: str, limit: int, offset: int, wrap: bool) -> dict:
+        self.requests += 1
+        if self.delay:
+            time.sleep(self.delay)
+        items = [self._track(spotify_id, i) for i in range(offset, min(offset + limit, self.size))]
+        return {
+            "items": [{"track": track} for track in items] if wrap else items,
+            "total": self.size,
+            "offset": offset,
+            "limit": limit,
+        }
+
+    def playlist_items(self, playlist_id: str, limit: int = 100, offset: int = 0, **kwargs) -> dict:
+        return self._page(playlist_id, limit, offset, wrap=True)
+
+    def album_tracks(self, album_id: str, limit: int = 50, offset: int = 0, **kwargs) -> dict:
+        return self._page(album_id, limit, offset, wrap=False)
+
+    def track(self, track_id: str, **kwargs) -> dict:
+        self.requests += 1
+        return self._track(track_id, 0)
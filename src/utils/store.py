@@ -0,0 +1,187 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    guild_id INTEGER PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS prefixes (
+    guild_id INTEGER PRIMARY KEY,
+    prefix TEXT NOT NULL
+);
+"""
+
+
+class PlayerStore:
+    """
+    SQLite backed store for music sessions, so queues survive a restart or a crash, and for the
+    guilds' command prefixes.
+
+    Every call to SQLite runs on a single worker thread that owns the connection; the event loop never
+    waits on disk. Writes are write-behind: ``mark`` only records that a guild changed, and a background
+    task writes every changed guild once per ``flush_interval`` in a single transaction. A guild that
+    changes many times between flushes (such as a 1,000 track playlist being queued) is written once,
+    from a snapshot taken at flush time.
+
+    Each guild is one row holding its state as JSON, so reading a session back is a single lookup.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0, logger: Optional[logging.Logger] = None) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.logger = logger or logging.getLogger("discord_bot")
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store")
+        self._connection: Optional[sqlite3.Connection] = None
+        # guild id -> function returning the guild's state, or None when the row should be deleted
+        self._dirty: Dict[int, Optional[Callable[[], dict]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.savers: List[Callable[[], None]] = []
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+        self.rows_written = 0
+        self.rows_deleted = 0
+        self.loads = 0
+        self.last_flush_time = 0.0
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _open(self) -> None:
+        # check_same_thread is left on: only the store's worker thread ever touches the connection.
+        self._connection = sqlite3.connect(self.path, timeout=30.0)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        self._connection.commit()
+
+    async def start(self) -> None:
+        await self._run(self._open)
+        self._task = asyncio.ensure_future(self._flush_loop())
+
+    def mark(self, guild_id: int, snapshot: Callable[[], dict]) -> None:
+        """
+        Records that a guild changed. ``snapshot`` is called at flush time to get its current state.
+        """
+        self._dirty[guild_id] = snapshot
+
+    def delete(self, guild_id: int) -> None:
+        self._dirty[guild_id] = None
+
+    def register_saver(self, saver: Callable[[], None]) -> None:
+        """
+        Registers a function that marks everything it owns as changed. Savers run on close, so state that
+        is not marked on every change (like playback position) is written one last time.
+        """
+        self.savers.append(saver)
+
+    def unregister_saver(self, saver: Callable[[], None]) -> None:
+        if saver in self.savers:
+            self.savers.remove(saver)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self._dirty:
+                try:
+                    await self.flush()
+                except sqlite3.Error as e:
+                    self.logger.warning(f"Saving music sessions failed, retrying: {e}")
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            dirty, self._dirty = self._dirty, {}
+            if not dirty:
+                return
+            now = time.time()
+            writes: List[Tuple[int, str, float]] = []
+            deletes: List[Tuple[int]] = []
+            for guild_id, snapshot in dirty.items():
+                if snapshot is None:
+                    deletes.append((guild_id,))
+                else:
+                    writes.append((guild_id, json.dumps(snapshot(), separators=(",", ":")), now))
+            start = time.perf_counter()
+            try:
+                await self._run(self._write, writes, deletes)
+            except sqlite3.Error:
+                # Keep the changes for the next flush, unless the guild changed again since.
+                for guild_id, snapshot in dirty.items():
+                    self._dirty.setdefault(guild_id, snapshot)
+                raise
+            self.last_flush_time = time.perf_counter() - start
+            self.flushes += 1
+            self.rows_written += len(writes)
+            self.rows_deleted += len(deletes)
+
+    def _write(self, writes: List[Tuple[int, str, float]], deletes: List[Tuple[int]]) -> None:
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO players (guild_id, state, updated_at) VALUES (?, ?, ?)", writes
+            )
+            self._connection.executemany("DELETE FROM players WHERE guild_id = ?", deletes)
+
+    async def load(self, guild_id: int) -> Optional[dict]:
+        if guild_id in self._dirty:
+            # The row on disk is older than what is waiting to be written.
+            await self.flush()
+        self.loads += 1
+        row = await self._run(self._read, guild_id)
+        return json.loads(row[0]) if row is not None else None
+
+    def _read(self, guild_id: int) -> Optional[Tuple[str]]:
+        return self._connection.execute("SELECT state FROM players WHERE guild_id = ?", (guild_id,)).fetchone()
+
+    async def load_prefixes(self) -> Dict[int, str]:
+        return dict(await self._run(self._read_prefixes))
+
+    def _read_prefixes(self) -> List[Tuple[int, str]]:
+        return self._connection.execute("SELECT guild_id, prefix FROM prefixes").fetchall()
+
+    async def save_prefix(self, guild_id: int, prefix: Optional[str]) -> None:
+        """
+        Writes a guild's prefix right away, or removes it when ``prefix`` is None. Prefixes change rarely,
+        so they are not batched like sessions.
+        """
+        await self._run(self._write_prefix, guild_id, prefix)
+
+    def _write_prefix(self, guild_id: int, prefix: Optional[str]) -> None:
+        with self._connection:
+            if prefix is None:
+                self._connection.execute("DELETE FROM prefixes WHERE guild_id = ?", (guild_id,))
+            else:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO prefixes (guild_id, prefix) VALUES (?, ?)", (guild_id, prefix)
+                )
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._dirty),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "rows_deleted": self.rows_deleted,
+            "loads": self.loads,
+            "last_flush_time": self.last_flush_time,
+        }
+
+    async def close(self) -> None:
+        """
+        Stops the background flush, writes whatever is still pending and closes the database.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._connection is not None:
+            for saver in list(self.savers):
+                saver()
+            await self.flush()
+            await self._run(self._connection.close)
+            self._connection = None
+        self._executor.shutdown(wait=True)
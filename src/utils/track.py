@@ -0,0 +1,74 @@
+import re
+import time
+from typing import NamedTuple, Optional
+
+# Stream URLs are treated as expired this many seconds before googlevideo expires them, so a song that
+# is started from a cache or a saved queue does not run into an expired URL halfway through.
+STREAM_EXPIRY_MARGIN = 600
+
+
+EXPIRE_PATTERN = re.compile(r"[?&]expire=(\d+)(?:&|$)")
+
+
+def stream_expiry(url: str) -> Optional[float]:
+    """
+    Returns the unix timestamp carried in the ``expire`` parameter of a googlevideo stream URL.
+    """
+    # Stream URLs carry dozens of parameters, so this looks for the one it needs instead of parsing them all.
+    match = EXPIRE_PATTERN.search(url)
+    return float(match.group(1)) if match is not None else None
+
+
+class Track(NamedTuple):
+    """
+    A resolved song, holding only what playback and display need.
+
+    yt_dlp's info dict (every format, thumbnail and subtitle track) is converted with ``from_info``
+    right after extraction and never kept. Tracks are immutable tuples without a per instance dict, so
+    a queue of them is small and one Track can be shared by every guild and cache that holds it; use
+    ``_replace`` for a changed copy.
+
+    ``query`` is the search a queued track was found with, used to find it again if its stream URL
+    expires before it is played.
+    """
+
+    title: str
+    url: str
+    id: Optional[str] = None
+    thumbnail: Optional[str] = None
+    duration: Optional[float] = None
+    expires_at: Optional[float] = None
+    codec: Optional[str] = None
+    bitrate: Optional[float] = None
+    query: Optional[str] = None
+
+    @classmethod
+    def from_info(cls, info: dict, query: Optional[str] = None) -> "Track":
+        return cls(
+            title=info["title"],
+            url=info["url"],
+            id=info.get("id"),
+            thumbnail=info.get("thumbnail"),
+            duration=info.get("duration"),
+            expires_at=stream_expiry(info["url"]),
+            codec=info.get("acodec"),
+            bitrate=info.get("abr"),
+            query=query,
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Track":
+        """
+        Rebuilds a track from ``to_dict`` output, including the plain song dicts saved by earlier versions.
+        """
+        fields = {field: data[field] for field in cls._fields if field in data}
+        if "expires_at" not in fields:
+            fields["expires_at"] = stream_expiry(data["url"])
+        return cls(**fields)
+
+    def to_dict(self) -> dict:
+        return {field: value for field, value in zip(self._fields, self) if value is not None}
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and self.expires_at - STREAM_EXPIRY_MARGIN <= time.time()
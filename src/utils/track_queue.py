@@ -0,0 +1,243 @@
+import itertools
+import random
+from typing import Any, Iterable, Iterator, List, Optional, Set
+
+# Entries are stored in blocks of at most BLOCK_SIZE. A Fenwick tree over the block sizes finds the
+# block holding a position in O(log n), and inserts/removes only shift entries inside one block.
+BLOCK_SIZE = 256
+
+_ids = itertools.count(1)
+
+
+class QueueEntry:
+    __slots__ = ("id", "item")
+
+    def __init__(self, item: Any) -> None:
+        self.id = next(_ids)
+        self.item = item
+
+
+class TrackQueue:
+    """
+    Song queue with fast positional access.
+
+    Positional get, insert, remove and move cost O(log n) to find the block plus a shift inside a
+    block of at most BLOCK_SIZE entries, and reading a page of k entries costs O(log n + k). Every
+    entry gets a stable id when it is added, which survives shuffles and moves.
+
+    Indexing and iteration return the queued items, like the deque this replaces; ``entry()`` and
+    ``pop_entry()`` return the ``QueueEntry`` wrapper with its id. ``queries`` counts the items that are
+    still search queries (``str``) in O(1), as long as they are swapped for songs with ``replace()``.
+    """
+
+    def __init__(self, items: Iterable[Any] = ()) -> None:
+        self._blocks: List[List[QueueEntry]] = []
+        self._tree: List[int] = [0]
+        self._dirty = False
+        self._length = 0
+        self._unshuffled: Optional[List[int]] = None
+        # Bumped by every change except appends, so a position read earlier is still valid as long
+        # as the version has not changed.
+        self.version = 0
+        # ids of the entries whose item is still a search query
+        self._queries: Set[int] = set()
+        self.extend(items)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __bool__(self) -> bool:
+        return self._length > 0
+
+    def __iter__(self) -> Iterator[Any]:
+        for block in self._blocks:
+            for entry in block:
+                yield entry.item
+
+    def __getitem__(self, index: int) -> Any:
+        return self.entry(index).item
+
+    @property
+    def queries(self) -> int:
+        return len(self._queries)
+
+    def entries(self) -> Iterator[QueueEntry]:
+        for block in self._blocks:
+            yield from block
+
+    def _reindex(self) -> None:
+        # Rebuilt only when blocks are split, removed or rebuilt, not on every insert or remove.
+        tree = [0] + [len(block) for block in self._blocks]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+        self._dirty = False
+
+    def _resize(self, block_index: int, delta: int) -> None:
+        if self._dirty:
+            return
+        tree = self._tree
+        i = block_index + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _locate(self, index: int):
+        if index < 0:
+            index += self._length
+        if index < 0 or index >= self._length:
+            raise IndexError("queue index out of range")
+        if self._dirty:
+            self._reindex()
+        tree = self._tree
+        block_index = 0
+        step = 1 << (len(tree) - 1).bit_length()
+        while step:
+            child = block_index + step
+            if child < len(tree) and tree[child] <= index:
+                block_index = child
+                index -= tree[child]
+            step >>= 1
+        return block_index, index
+
+    def entry(self, index: int) -> QueueEntry:
+        block_index, position = self._locate(index)
+        return self._blocks[block_index][position]
+
+    def page(self, start: int, stop: int) -> List[QueueEntry]:
+        """
+        Returns the entries from ``start`` up to (not including) ``stop``.
+        """
+        start = max(start, 0)
+        stop = min(stop, self._length)
+        if start >= stop:
+            return []
+        block_index, position = self._locate(start)
+        result = []
+        while len(result) < stop - start:
+            block = self._blocks[block_index]
+            result.extend(block[position:position + stop - start - len(result)])
+            block_index += 1
+            position = 0
+        return result
+
+    def insert(self, index: int, item: Any) -> QueueEntry:
+        self.version += 1
+        return self._insert_entry(index, QueueEntry(item))
+
+    def _insert_entry(self, index: int, entry: QueueEntry) -> QueueEntry:
+        if isinstance(entry.item, str):
+            self._queries.add(entry.id)
+        if not self._blocks:
+            self._blocks.append([entry])
+            self._dirty = True
+        else:
+            if index < 0:
+                index = max(index + self._length, 0)
+            index = min(index, self._length)
+            if index == self._length:
+                block_index, position = len(self._blocks) - 1, len(self._blocks[-1])
+            else:
+                block_index, position = self._locate(index)
+            block = self._blocks[block_index]
+            block.insert(position, entry)
+            if len(block) > BLOCK_SIZE:
+                half = len(block) // 2
+                self._blocks.insert(block_index + 1, block[half:])
+                del block[half:]
+                self._dirty = True
+            else:
+                self._resize(block_index, 1)
+        self._length += 1
+        return entry
+
+    def append(self, item: Any) -> QueueEntry:
+        entry = QueueEntry(item)
+        if self._blocks and len(self._blocks[-1]) < BLOCK_SIZE:
+            if isinstance(item, str):
+                self._queries.add(entry.id)
+            self._blocks[-1].append(entry)
+            self._resize(len(self._blocks) - 1, 1)
+            self._length += 1
+            return entry
+        return self._insert_entry(self._length, entry)
+
+    def appendleft(self, item: Any) -> QueueEntry:
+        return self.insert(0, item)
+
+    def extend(self, items: Iterable[Any]) -> None:
+        for item in items:
+            self.append(item)
+
+    def pop_entry(self, index: int = -1) -> QueueEntry:
+        block_index, position = self._locate(index)
+        block = self._blocks[block_index]
+        entry = block.pop(position)
+        self._queries.discard(entry.id)
+        self.version += 1
+        if block:
+            self._resize(block_index, -1)
+        else:
+            del self._blocks[block_index]
+            self._dirty = True
+        self._length -= 1
+        return entry
+
+    def pop(self, index: int = -1) -> Any:
+        return self.pop_entry(index).item
+
+    def popleft(self) -> Any:
+        return self.pop_entry(0).item
+
+    def replace(self, entry: QueueEntry, item: Any) -> None:
+        """
+        Swaps the search query of ``entry`` for the song it resolved to. The entry may already have
+        left the queue.
+        """
+        if not isinstance(item, str):
+            self._queries.discard(entry.id)
+        entry.item = item
+
+    def move(self, source: int, destination: int) -> QueueEntry:
+        entry = self.pop_entry(source)
+        return self._insert_entry(destination, entry)
+
+    def clear(self) -> None:
+        self.version += 1
+        self._blocks = []
+        self._tree = [0]
+        self._length = 0
+        self._dirty = False
+        self._unshuffled = None
+        self._queries = set()
+
+    def _rebuild(self, entries: List[QueueEntry]) -> None:
+        self._blocks = [entries[i:i + BLOCK_SIZE] for i in range(0, len(entries), BLOCK_SIZE)]
+        self._length = len(entries)
+        self._dirty = True
+        self.version += 1
+
+    def shuffle(self) -> None:
+        entries = list(self.entries())
+        if self._unshuffled is None:
+            self._unshuffled = [entry.id for entry in entries]
+        random.shuffle(entries)
+        self._rebuild(entries)
+
+    def unshuffle(self) -> bool:
+        """
+        Restores the order from before the first shuffle. Entries added since then keep their
+        relative order and go after the restored ones. Returns False if the queue was not shuffled.
+        """
+        if self._unshuffled is None:
+            return False
+        rank = {entry_id: i for i, entry_id in enumerate(self._unshuffled)}
+        late = len(rank)
+        entries = list(self.entries())
+        order = {entry.id: i for i, entry in enumerate(entries)}
+        entries.sort(key=lambda entry: (rank.get(entry.id, late), order[entry.id]))
+        self._rebuild(entries)
+        self._unshuffled = None
+        return True
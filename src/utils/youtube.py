@@ -0,0 +1,169 @@
+import codecs
+import json
+import re
+from typing import AsyncIterator, List, NamedTuple, Optional, Tuple
+
+SEARCH_URL = "https://www.youtube.com/results"
+RENDERER_MARKER = '"videoRenderer":'
+MAX_RENDERER_SIZE = 256 * 1024
+DECODER = json.JSONDecoder()
+WATCH_ID = re.compile(r"watch\?v=([\w-]{11})")
+
+
+class SearchError(Exception):
+    pass
+
+
+class SearchResult(NamedTuple):
+    video_id: str
+    title: str
+    duration: Optional[int]
+    is_short: bool
+
+    @property
+    def url(self) -> str:
+        return f"https://www.youtube.com/watch?v={self.video_id}"
+
+
+def parse_duration(text: Optional[str]) -> Optional[int]:
+    """
+    Converts a ``lengthText`` such as ``"1:02:03"`` to seconds.
+    """
+    if not text:
+        return None
+    seconds = 0
+    try:
+        for part in text.split(":"):
+            seconds = seconds * 60 + int(part)
+    except ValueError:
+        return None
+    return seconds
+
+
+def result_from_renderer(renderer: dict) -> Optional[SearchResult]:
+    video_id = renderer.get("videoId")
+    if not video_id:
+        return None
+    runs = renderer.get("title", {}).get("runs") or [{}]
+    title = "".join(run.get("text", "") for run in runs)
+    duration = parse_duration(renderer.get("lengthText", {}).get("simpleText"))
+    endpoint_url = (
+        renderer.get("navigationEndpoint", {})
+        .get("commandMetadata", {})
+        .get("webCommandMetadata", {})
+        .get("url", "")
+    )
+    return SearchResult(video_id, title, duration, endpoint_url.startswith("/shorts/"))
+
+
+class RendererScanner:
+    """
+    Pulls ``videoRenderer`` objects out of a results page as it is fed in chunks.
+
+    Only the renderer objects are decoded, not the whole ``ytInitialData`` blob, and everything before
+    the renderer being decoded is discarded so memory stays at roughly one renderer.
+    """
+
+    def __init__(self) -> None:
+        self.buffer = ""
+        self.fallback_ids = []
+
+    def feed(self, text: str) -> List[SearchResult]:
+        self.buffer += text
+        results = []
+        while True:
+            start = self.buffer.find(RENDERER_MARKER)
+            if start == -1:
+                self._collect_fallback(self.buffer[:-len(RENDERER_MARKER)])
+                self.buffer = self.buffer[-len(RENDERER_MARKER):]
+                return results
+            self._collect_fallback(self.buffer[:start])
+            self.buffer = self.buffer[start:]
+            brace = self.buffer.find("{", len(RENDERER_MARKER))
+            if brace == -1:
+                return results
+            try:
+                renderer, end = DECODER.raw_decode(self.buffer, brace)
+            except ValueError:
+                # Most likely the renderer continues in the next chunk. A renderer is a few KB, so if
+                # it still does not decode after MAX_RENDERER_SIZE the page is malformed: skip it.
+                if len(self.buffer) < MAX_RENDERER_SIZE:
+                    return results
+                self.buffer = self.buffer[len(RENDERER_MARKER):]
+                continue
+            self.buffer = self.buffer[end:]
+            result = result_from_renderer(renderer) if isinstance(renderer, dict) else None
+            if result is not None:
+                results.append(result)
+
+    def _collect_fallback(self, text: str) -> None:
+        # Used only when the page has no renderers at all, e.g. after a layout change.
+        if len(self.fallback_ids) < 5:
+            self.fallback_ids.extend(WATCH_ID.findall(text)[:5])
+
+
+async def parse_results(chunks: AsyncIterator[bytes], max_results: int = 5) -> Tuple[List[SearchResult], int]:
+    """
+    Reads a results page chunk by chunk and stops as soon as ``max_results`` videos were found.
+    Returns the results and the number of bytes that were read.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    scanner = RendererScanner()
+    results = []
+    bytes_read = 0
+    async for chunk in chunks:
+        bytes_read += len(chunk)
+        results.extend(scanner.feed(decoder.decode(chunk)))
+        if len(results) >= max_results:
+            return results[:max_results], bytes_read
+    if not results:
+        results = [SearchResult(video_id, "", None, False) for video_id in dict.fromkeys(scanner.fallback_ids)]
+    return results[:max_results], bytes_read
+
+
+class YouTubeSearch:
+    """
+    YouTube search backend that returns ranked candidates instead of the first ``watch?v`` link.
+    """
+
+    def __init__(
+        self,
+        http_client,
+        max_results: int = 5,
+        max_duration: Optional[int] = None,
+        allow_shorts: bool = False,
+        chunk_size: int = 16384,
+    ) -> None:
+        self.http_client = http_client
+        self.max_results = max_results
+        self.max_duration = max_duration
+        self.allow_shorts = allow_shorts
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+
+    async def search(self, query: str, max_results: Optional[int] = None) -> List[SearchResult]:
+        async with self.http_client.get(SEARCH_URL, params={"search_query": query}) as resp:
+            if resp.status != 200:
+                raise SearchError(f"YouTube search returned HTTP {resp.status}")
+            # Leaving the block before the body is fully read closes the connection instead of reusing it,
+            # which is still far cheaper than downloading the rest of the page.
+            results, bytes_read = await parse_results(
+                resp.content.iter_chunked(self.chunk_size), max_results or self.max_results
+            )
+        self.bytes_read += bytes_read
+        return results
+
+    def pick(self, results: List[SearchResult]) -> Optional[SearchResult]:
+        for result in results:
+            if result.is_short and not self.allow_shorts:
+                continue
+            if self.max_duration and result.duration and result.duration > self.max_duration:
+                continue
+            return result
+        return results[0] if results else None
+
+    async def best_url(self, query: str) -> str:
+        result = self.pick(await self.search(query))
+        if result is None:
+            raise SearchError(f"No YouTube results for '{query}'")
+        return result.url